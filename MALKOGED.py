@@ -3,7 +3,33 @@ import os
 import json
 import shutil
 import hashlib
+import gzip
+import uuid
+import itertools
+import secrets
 import threading
+import time
+import socket
+import argparse
+import fnmatch
+import queue
+import csv
+import bisect
+import heapq
+import zipfile
+import posixpath
+import struct
+import zlib
+import mmap
+import tempfile
+import multiprocessing
+import math
+import sys
+import tracemalloc
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 import requests
 import re
 import docx
@@ -11,15 +37,63 @@ import openpyxl
 from pptx import Presentation
 from tkinter import messagebox, filedialog, simpledialog
 from datetime import datetime
+from contextlib import contextmanager, ExitStack
 import pdfplumber
 from mutagen.easyid3 import EasyID3
 from mutagen.mp4 import MP4
 
+try:
+    import numpy as np
+except ImportError:  # Optionnel : requis pour le hachage perceptuel des images
+    np = None
+try:
+    import pandas as pd
+except ImportError:  # Optionnel : export analytique de l'index
+    pd = None
+try:
+    import blake3
+except ImportError:  # Optionnel : algorithme d'empreinte BLAKE3
+    blake3 = None
+try:
+    import xxhash
+except ImportError:  # Optionnel : préfiltre xxh3
+    xxhash = None
+try:
+    from PIL import Image
+except ImportError:  # Optionnel : requis pour le hachage perceptuel des images
+    Image = None
+try:
+    import pytesseract
+except ImportError:  # Optionnel : OCR des documents numérisés (Tesseract installé sur le poste)
+    pytesseract = None
+
 # ==================== CONFIGURATION ====================
 CONFIG_FILE = "ged_enterprise_config.json"
-INDEX_FILE = "ged_file_index.json"
+INDEX_FILE = "ged_file_index.json"  # Ancien index global (réparti entre les archives au démarrage)
+ARCHIVES_FILE = "ged_archives.json"
+ARCHIVES_PENDING_FILE = "ged_archives_pending.json"  # Fiches d'archives dont le support est absent
+ARCHIVE_META_DIR = ".malkoged"  # Sous la racine de chaque archive : index et filtre de Bloom
+PHASH_INDEX_FILE = "ged_phash_index.json"
+METRICS_TRACE_FILE = "ged_metrics_trace.jsonl"
+METRICS_PROM_FILE = "ged_metrics.prom"
+SLOW_FILES_LOG = "ged_slow_files.log"
+CASSETTE_FILE = "ged_api_cassette.jsonl.gz"
+JOBS_DIR = "ged_jobs"
+INDEX_ALIASES_FILE = "ged_index_aliases.json"
+SCRUB_STATE_FILE = "ged_scrub_state.json"
+TEXT_CACHE_DIR = "ged_text_cache"
+REORG_JOURNAL_FILE = "ged_reorg_journal.json"
+DEFERRED_QUEUE_FILE = "ged_deferred_queue.json"
+PACK_DIR_NAME = ".ged_packs"  # Sous la racine de l'archive
+PACK_EXTENSION = ".gpk"
+REPORTS_DIR = "ged_reports"
+PROFILES_DIR = "ged_profiles"
+SERVICE_SPOOL_DIR = "ged_spool"  # Fichiers reçus par le service HTTP avant archivage
 API_KEY = "api-key"
 DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.xlsx', '.pptx', '.mp3', '.wav',
+                        '.mp4', '.mov', '.avi', '.jpg', '.jpeg', '.png')
 
 # ==================== CLASSES UTILITAIRES ====================
 class ConfigManager:
@@ -37,7 +111,74 @@ class ConfigManager:
                 "auto_delete": False,
                 "last_destination": os.path.expanduser("~"),
                 "api_active": True,
-                "auto_create_categories": True  # Nouvelle option
+                "auto_create_categories": True,  # Nouvelle option
+                "visual_duplicates": True,  # Doublons visuels d'images (pHash)
+                "phash_threshold": 6,  # Distance de Hamming maximale (sur 64 bits)
+                "metrics_enabled": True,  # Trace JSONL + export Prometheus
+                "slow_file_threshold_s": 10,  # Seuil du journal des fichiers lents
+                "api_cassette_mode": "off",  # off / record / replay / auto
+                "api_replay_latency_ms": 0,  # Latence simulée en relecture
+                "api_replay_recorded_latency": False,  # Rejoue la latence mesurée à l'enregistrement
+                "resumable_jobs": True,  # Manifeste de lot pour reprendre après interruption
+                "job_checkpoint_interval_s": 2,
+                "shard_claim_timeout_s": 3600,  # Une partition non rafraîchie depuis ce délai peut être reprise
+                "scan_skip_patterns": [".*", "$RECYCLE.BIN", "System Volume Information", "__pycache__", "node_modules"],
+                "duplicate_scan_workers": 4,
+                "hash_algorithm": "sha256",  # sha256 / blake2b / blake3 / xxh3+sha256
+                "tree_hash_min_mb": 256,  # Hachage par blocs parallèles au-delà de cette taille
+                "tree_hash_chunk_mb": 64,
+                "hash_workers": 4,
+                "scrub_enabled": True,  # Vérification d'intégrité de l'archive en arrière-plan
+                "scrub_bandwidth_mb_s": 20,
+                "scrub_workers": 2,
+                "scrub_interval_h": 24,  # Délai entre deux passes complètes
+                "ooxml_fast_extraction": True,  # Lecture directe du XML (DOCX/XLSX/PPTX)
+                "ooxml_max_chars": 50000,
+                "media_payload_hash": False,  # MP3/MP4 : empreinte du contenu seul, balises ignorées (change les clés : migration)
+                "batch_scheduling": True,  # Petits fichiers d'abord, travail local et IA en parallèle
+                "scheduler_local_workers": 4,
+                "scheduler_api_initial_concurrency": 2,
+                "scheduler_api_max_concurrency": 8,
+                "text_cache": True,  # Texte extrait conservé (reclassement sans relire les documents)
+                "text_cache_max_mb": 512,  # Au-delà, les textes les moins relus sont supprimés
+                "excerpt_mode": "salience",  # salience : passages les plus parlants / prefix : début du texte
+                "excerpt_token_budget": 300,  # Taille de l'extrait envoyé à l'IA (≈ 4 caractères par jeton)
+                "api_timeout_s": 30,
+                "api_breaker_failures": 3,  # Échecs consécutifs avant de suspendre les appels à l'API
+                "api_breaker_probe_s": 60,  # Délai avant un appel d'essai quand l'API est suspendue
+                "api_deferred_mode": "auto",  # auto : classement provisoire si l'API échoue / always / off
+                "deferred_retry_s": 60,  # Relance de la file de classification IA en attente
+                "io_scheduling": True,  # Lectures / écritures limitées et ordonnées par disque
+                "io_hdd_concurrency": 1,  # Disque rotatif ou USB : accès séquentiels
+                "io_ssd_concurrency": 8,
+                "io_default_concurrency": 4,  # Type de disque inconnu (réseau, Windows, macOS)
+                "pack_storage": False,  # Petits documents regroupés dans des packs compressés
+                "pack_max_document_kb": 256,
+                "pack_max_mb": 1024,  # Taille d'un pack avant d'en ouvrir un nouveau
+                "pack_compact_ratio": 0.3,  # Part d'espace inutilisé déclenchant le compactage d'un pack
+                "service_host": "127.0.0.1",  # Service HTTP d'ingestion (commande serve)
+                "service_port": 8765,
+                "service_token": "",  # En-tête X-GED-Token exigé (généré au premier lancement de serve)
+                "service_batch_max_files": 1000,  # Micro-lot : index sauvegardé au moins tous les N fichiers
+                "service_batch_max_s": 60,
+                "service_batch_idle_s": 1.0,
+                "service_max_upload_mb": 512,
+                "service_submission_ttl_h": 24,  # Dépôts terminés gardés en mémoire (ensuite relus sur disque)
+                "batch_report": True,  # Rapport par lot dans ged_reports (une ligne par fichier)
+                "batch_report_format": "jsonl",  # jsonl ou csv
+                "batch_report_xlsx": False,  # Conversion en Excel à la fin du lot
+                "profile_interval_ms": 10,  # Profilage : intervalle d'échantillonnage des piles
+                "profile_tracemalloc": False,  # Profilage : allocations par étape (plus coûteux)
+                "profile_alloc_every": 20,
+                "profile_top_allocations": 15,
+                "archive_bloom_error_rate": 0.01,  # Faux positifs des filtres de Bloom (index chargé pour rien)
+                "ocr_enabled": False,  # OCR des PDF numérisés et des images (pip install pytesseract + Tesseract)
+                "ocr_languages": "fra+eng",
+                "ocr_workers": 0,  # Processus de reconnaissance (0 = moitié des cœurs)
+                "ocr_resolution": 200,
+                "ocr_max_chars": 4000,  # Arrêt de la lecture des pages une fois ce texte obtenu
+                "ocr_max_pages": 20,
+                "ocr_min_text_chars": 20  # En dessous, le document est considéré comme numérisé
             }
             ConfigManager.save_config(default_config)
             return default_config
@@ -59,185 +200,2284 @@ class ConfigManager:
 
     @staticmethod
     def load_index():
-        if not os.path.exists(INDEX_FILE):
-            return {}
+        """Index complet des archives en ligne (les outils en lot ; l'ingestion charge à la demande)"""
+        index = FileIndex()
         try:
-            with open(INDEX_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
+            registry = ArchiveRegistry()
+            registry.open(index)
+            registry.load_all()
         except Exception as e:
             print(f"Erreur chargement index: {e}")
-            return {}
+        index.on_change = None
+        return index
 
     @staticmethod
     def save_index(data):
+        """Réécrit l'index de chaque archive en ligne à partir d'un index complet"""
         try:
-            with open(INDEX_FILE, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=4)
+            # Registre ayant chargé l'index : les fiches masquées entre archives sont réécrites avec le reste
+            registry = getattr(data, "registry", None) or ArchiveRegistry()
+            registry.save(data, all_roots=True)
         except Exception as e:
             print(f"Erreur sauvegarde index: {e}")
 
+    @staticmethod
+    def load_phash_index():
+        if not os.path.exists(PHASH_INDEX_FILE):
+            return {}
+        try:
+            with open(PHASH_INDEX_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Erreur chargement index perceptuel: {e}")
+            return {}
+
+    @staticmethod
+    def save_phash_index(data):
+        try:
+            with open(PHASH_INDEX_FILE, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        except Exception as e:
+            print(f"Erreur sauvegarde index perceptuel: {e}")
+
+class MetricsCollector:
+    """Instrumentation par étape (durées, octets, résultats) avec histogrammes agrégés"""
+    STAGES = ["hashing", "extraction", "ocr", "api", "copy", "verify", "tagging", "pack"]
+    BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+    def __init__(self, enabled=True, slow_threshold=10.0, keep_samples=False):
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self.keep_samples = keep_samples  # Durées brutes (percentiles exacts pour le banc d'essai)
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self._trace = None
+        self.active_stages = {}  # Thread -> étape en cours (profilage)
+        self.profiler = None
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {stage: [0] * (len(self.BUCKETS) + 1) for stage in self.STAGES}
+            self.sums = {stage: 0.0 for stage in self.STAGES}
+            self.counts = {stage: 0 for stage in self.STAGES}
+            self.bytes = {stage: 0 for stage in self.STAGES}
+            self.outcomes = {stage: {} for stage in self.STAGES}
+            self.samples = {stage: [] for stage in self.STAGES}
+            self.file_outcomes = {}
+
+    def configure(self, config):
+        self.enabled = config.get("metrics_enabled", True)
+        self.slow_threshold = config.get("slow_file_threshold_s", 10)
+
+    def begin_file(self, filepath):
+        """Démarre le suivi d'un fichier pour le thread courant"""
+        self._local.current = {"file": filepath, "start": time.perf_counter(), "stages": {}}
+
+    def end_file(self, outcome):
+        """Termine le suivi du fichier courant : trace JSONL et journal des fichiers lents"""
+        current = getattr(self._local, "current", None)
+        self._local.current = None
+        if current is None:
+            return
+        total = time.perf_counter() - current["start"]
+        with self.lock:
+            self.file_outcomes[outcome] = self.file_outcomes.get(outcome, 0) + 1
+        if not self.enabled:
+            return
+        record = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "file": current["file"],
+            "outcome": outcome,
+            "total_s": round(total, 4),
+            "stages": current["stages"]
+        }
+        with self.lock:
+            try:
+                if self._trace is None:
+                    self._trace = open(METRICS_TRACE_FILE, "a", encoding="utf-8")
+                self._trace.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except Exception as e:
+                print(f"Erreur écriture trace: {e}")
+            if total >= self.slow_threshold:
+                try:
+                    breakdown = ", ".join(f"{name}={stage['s']:.2f}s" for name, stage in current["stages"].items())
+                    with open(SLOW_FILES_LOG, "a", encoding="utf-8") as f:
+                        f.write(f"{record['ts']}\t{total:.2f}s\t{current['file']}\t{breakdown}\n")
+                except Exception as e:
+                    print(f"Erreur journal fichiers lents: {e}")
+
+    @contextmanager
+    def stage(self, name, nbytes=0):
+        """Chronomètre une étape ; l'appelant peut ajuster 'bytes' et 'outcome' sur l'enregistrement"""
+        record = {"bytes": nbytes, "outcome": "ok"}
+        thread_id = threading.get_ident()
+        outer = self.active_stages.get(thread_id)
+        self.active_stages[thread_id] = name
+        profiler = self.profiler
+        allocations = profiler.begin_allocations(name) if profiler is not None else None
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception:
+            record["outcome"] = "error"
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, record["bytes"], record["outcome"])
+            if allocations is not None:
+                profiler.end_allocations(name, allocations)
+            if outer is None:
+                self.active_stages.pop(thread_id, None)
+            else:
+                self.active_stages[thread_id] = outer
+
+    def record(self, name, duration, nbytes=0, outcome="ok"):
+        with self.lock:
+            if name not in self.histograms:
+                return
+            bucket = len(self.BUCKETS)
+            for i, bound in enumerate(self.BUCKETS):
+                if duration <= bound:
+                    bucket = i
+                    break
+            self.histograms[name][bucket] += 1
+            self.sums[name] += duration
+            self.counts[name] += 1
+            self.bytes[name] += nbytes
+            self.outcomes[name][outcome] = self.outcomes[name].get(outcome, 0) + 1
+            if self.keep_samples:
+                self.samples[name].append(duration)
+        current = getattr(self._local, "current", None)
+        if current is not None:
+            previous = current["stages"].get(name, {"s": 0.0, "bytes": 0})
+            current["stages"][name] = {"s": round(previous["s"] + duration, 4),
+                                       "bytes": previous["bytes"] + nbytes, "outcome": outcome}
+
+    def quantile(self, name, q):
+        """Estimation d'un quantile à partir de l'histogramme (borne supérieure du seau)"""
+        with self.lock:
+            counts = list(self.histograms[name])
+        total = sum(counts)
+        if not total:
+            return 0.0
+        threshold = q * total
+        cumulated = 0
+        for i, count in enumerate(counts):
+            cumulated += count
+            if cumulated >= threshold:
+                return self.BUCKETS[i] if i < len(self.BUCKETS) else float("inf")
+        return float("inf")
+
+    def snapshot(self):
+        """Vue agrégée pour le panneau de métriques"""
+        stats = {}
+        for name in self.STAGES:
+            with self.lock:
+                count = self.counts[name]
+                stats[name] = {
+                    "count": count,
+                    "mean_s": self.sums[name] / count if count else 0.0,
+                    "bytes": self.bytes[name],
+                    "errors": sum(v for k, v in self.outcomes[name].items() if k != "ok"),
+                    "histogram": list(self.histograms[name])
+                }
+            stats[name]["p50_s"] = self.quantile(name, 0.5)
+            stats[name]["p95_s"] = self.quantile(name, 0.95)
+        return stats
+
+    def write_prometheus(self, path=METRICS_PROM_FILE):
+        """Écrit les métriques au format texte Prometheus (collecteur textfile)"""
+        lines = ["# HELP malkoged_stage_duration_seconds Durée des étapes d'ingestion",
+                 "# TYPE malkoged_stage_duration_seconds histogram"]
+        with self.lock:
+            for name in self.STAGES:
+                cumulated = 0
+                for bound, count in zip(self.BUCKETS + ["+Inf"], self.histograms[name]):
+                    cumulated += count
+                    lines.append(f'malkoged_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulated}')
+                lines.append(f'malkoged_stage_duration_seconds_sum{{stage="{name}"}} {self.sums[name]:.6f}')
+                lines.append(f'malkoged_stage_duration_seconds_count{{stage="{name}"}} {self.counts[name]}')
+            lines += ["# HELP malkoged_stage_bytes_total Octets traités par étape",
+                      "# TYPE malkoged_stage_bytes_total counter"]
+            lines += [f'malkoged_stage_bytes_total{{stage="{name}"}} {self.bytes[name]}' for name in self.STAGES]
+            lines += ["# HELP malkoged_stage_outcomes_total Résultats des étapes",
+                      "# TYPE malkoged_stage_outcomes_total counter"]
+            for name in self.STAGES:
+                for outcome, count in sorted(self.outcomes[name].items()):
+                    lines.append(f'malkoged_stage_outcomes_total{{stage="{name}",outcome="{outcome}"}} {count}')
+            lines += ["# HELP malkoged_files_total Fichiers traités par résultat",
+                      "# TYPE malkoged_files_total counter"]
+            lines += [f'malkoged_files_total{{outcome="{outcome}"}} {count}'
+                      for outcome, count in sorted(self.file_outcomes.items())]
+        try:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Erreur export Prometheus: {e}")
+
+    def flush(self):
+        """Vide la trace JSONL et met à jour l'export Prometheus"""
+        if not self.enabled:
+            return
+        with self.lock:
+            if self._trace is not None:
+                self._trace.flush()
+        self.write_prometheus()
+
+metrics = MetricsCollector()
+
+class SamplingProfiler:
+    """Profilage échantillonné d'un traitement : piles de tous les threads relevées à intervalle régulier
+    (format replié pour flamegraph.pl / speedscope), allocations par étape via tracemalloc en option"""
+    IDLE_MODULES = ("threading.py", "queue.py", "selectors.py", "socketserver.py")  # Threads en attente
+
+    def __init__(self, interval_s=0.01, trace_allocations=False, alloc_every=20, top_allocations=15):
+        self.interval_s = interval_s
+        self.trace_allocations = trace_allocations
+        self.alloc_every = max(1, alloc_every)
+        self.top_allocations = top_allocations
+        self.stacks = {}  # Pile repliée -> nombre d'échantillons
+        self.stage_samples = {}
+        self.allocations = {}  # Étape -> {site: [octets, allocations]}
+        self.stage_calls = {}
+        self.samples = 0
+        self.lock = threading.Lock()
+        self.alloc_lock = threading.Lock()  # Un seul relevé mémoire à la fois
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.started = None
+
+    @staticmethod
+    def from_config(config, trace_allocations=None):
+        return SamplingProfiler(config.get("profile_interval_ms", 10) / 1000,
+                                config.get("profile_tracemalloc", False) if trace_allocations is None
+                                else trace_allocations,
+                                config.get("profile_alloc_every", 20), config.get("profile_top_allocations", 15))
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+        metrics.profiler = self
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval_s):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    self._sample(thread_id, frame)
+
+    def _sample(self, thread_id, frame):
+        stage = metrics.active_stages.get(thread_id)
+        if stage is None and frame.f_code.co_filename.endswith(self.IDLE_MODULES):
+            return
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        names.append(f"[{stage or 'autre'}]")
+        key = ";".join(reversed(names))
+        with self.lock:
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.stage_samples[stage or "autre"] = self.stage_samples.get(stage or "autre", 0) + 1
+            self.samples += 1
+
+    # --- Allocations (un passage d'étape sur 'alloc_every' est mesuré)
+    def begin_allocations(self, stage):
+        if not self.trace_allocations:
+            return None
+        with self.lock:
+            calls = self.stage_calls.get(stage, 0)
+            self.stage_calls[stage] = calls + 1
+        if calls % self.alloc_every or not self.alloc_lock.acquire(blocking=False):
+            return None
+        return self._snapshot()
+
+    @staticmethod
+    def _snapshot():
+        """Relevé tracemalloc sans les allocations du relevé lui-même"""
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                                          tracemalloc.Filter(False, "<frozen importlib._bootstrap>")])
+
+    def end_allocations(self, stage, before):
+        try:
+            # Approximatif en parallèle : les allocations des autres threads sont aussi comptées
+            for stat in self._snapshot().compare_to(before, "lineno")[:self.top_allocations]:
+                if stat.size_diff <= 0:
+                    continue
+                frame = stat.traceback[0]
+                site = f"{frame.filename}:{frame.lineno}"
+                with self.lock:
+                    entry = self.allocations.setdefault(stage, {}).setdefault(site, [0, 0])
+                    entry[0] += stat.size_diff
+                    entry[1] += stat.count_diff
+        finally:
+            self.alloc_lock.release()
+
+    def stop(self, output_dir=None):
+        """Arrête le profilage et écrit les fichiers ; retourne le dossier de sortie"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        metrics.profiler = None
+        if self.trace_allocations and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        output_dir = output_dir or os.path.join(PROFILES_DIR, datetime.now().strftime("%Y%m%d_%H%M%S"))
+        os.makedirs(output_dir, exist_ok=True)
+        with self.lock:
+            stacks = sorted(self.stacks.items(), key=lambda item: -item[1])
+            stage_samples = dict(self.stage_samples)
+            allocations = {stage: sorted(sites.items(), key=lambda item: -item[1][0])[:self.top_allocations]
+                           for stage, sites in self.allocations.items()}
+        try:
+            with open(os.path.join(output_dir, "stacks.collapsed"), "w", encoding="utf-8") as f:
+                for stack, count in stacks:
+                    f.write(f"{stack} {count}\n")
+            summary = {
+                "duration_s": round(time.perf_counter() - self.started, 3),
+                "interval_ms": self.interval_s * 1000,
+                "samples": self.samples,
+                "samples_by_stage": stage_samples,
+                "stages": metrics.snapshot(),
+                "allocations": {stage: [{"site": site, "bytes": size, "count": count}
+                                        for site, (size, count) in sites] for stage, sites in allocations.items()}
+            }
+            with open(os.path.join(output_dir, "profile.json"), "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2, ensure_ascii=False)
+            if self.trace_allocations:
+                with open(os.path.join(output_dir, "allocations.txt"), "w", encoding="utf-8") as f:
+                    for stage, sites in allocations.items():
+                        f.write(f"== {stage} ({self.stage_calls.get(stage, 0)} passages, "
+                                f"1 sur {self.alloc_every} mesuré)\n")
+                        for site, (size, count) in sites:
+                            f.write(f"{size / 1024:10.1f} Ko {count:8d}  {site}\n")
+                        f.write("\n")
+        except Exception as e:
+            print(f"Erreur écriture profil: {e}")
+        return output_dir
+
 class DuplicateManager:
-    """Gestionnaire de détection de doublons par empreinte SHA-256"""
+    """Gestionnaire de détection de doublons par empreinte de contenu (SHA-256 par défaut)"""
+    ALGORITHMS = ("sha256", "blake2b", "blake3", "xxh3+sha256")
+    BLOCK_SIZE = 1024 * 1024
+
+    @staticmethod
+    def new_hasher(algorithm):
+        """Objet de hachage pour un algorithme (sans suffixe '-tree')"""
+        if algorithm == "blake2b":
+            return hashlib.blake2b(digest_size=32)
+        if algorithm == "blake3":
+            if blake3 is None:
+                raise ValueError("Module blake3 non installé (pip install blake3)")
+            return blake3.blake3()
+        if algorithm == "xxh3":
+            if xxhash is None:
+                raise ValueError("Module xxhash non installé (pip install xxhash)")
+            return xxhash.xxh3_128()
+        return hashlib.sha256()
+
     @staticmethod
-    def get_file_hash(filepath):
-        """Calcule l'empreinte SHA-256 d'un fichier"""
-        sha256_hash = hashlib.sha256()
+    def get_file_hash(filepath, algorithm="sha256", throttle=None):
+        """Calcule l'empreinte d'un fichier (SHA-256 par défaut) ; 'throttle(n)' limite le débit de lecture"""
+        if algorithm.endswith("-tree"):
+            return DuplicateManager.get_tree_hash(filepath, algorithm[:-5], throttle=throttle)
         try:
-            with open(filepath, "rb") as f:
-                for byte_block in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(byte_block)
-            return sha256_hash.hexdigest()
+            file_hash = DuplicateManager.new_hasher(algorithm)
+            buffer = bytearray(DuplicateManager.BLOCK_SIZE)
+            view = memoryview(buffer)
+            with open(filepath, "rb", buffering=0) as f:
+                while True:
+                    size = f.readinto(buffer)
+                    if not size:
+                        break
+                    if throttle:
+                        throttle(size)
+                    file_hash.update(view[:size])
+            return file_hash.hexdigest()
         except Exception as e:
             print(f"Erreur calcul hash: {e}")
             return None
 
+    @staticmethod
+    def get_tree_hash(filepath, algorithm, chunk_size=64 * 1024 * 1024, workers=4, throttle=None):
+        """Hachage par blocs en parallèle (gros fichiers) : empreinte des empreintes de blocs"""
+        def hash_chunk(offset):
+            chunk_hash = DuplicateManager.new_hasher(algorithm)
+            with open(filepath, "rb", buffering=0) as f:
+                f.seek(offset)
+                remaining = chunk_size
+                while remaining:
+                    block = f.read(min(DuplicateManager.BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    if throttle:
+                        throttle(len(block))
+                    chunk_hash.update(block)
+                    remaining -= len(block)
+            return chunk_hash.digest()
+        
+        try:
+            size = os.path.getsize(filepath)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                leaves = list(executor.map(hash_chunk, range(0, max(size, 1), chunk_size)))
+            root = DuplicateManager.new_hasher(algorithm)
+            root.update(f"{size}:{chunk_size}:".encode())
+            for leaf in leaves:
+                root.update(leaf)
+            return root.hexdigest()
+        except Exception as e:
+            print(f"Erreur calcul hash par blocs: {e}")
+            return None
+
+    @staticmethod
+    def index_key(digest, algorithm):
+        """Clé d'index : empreinte SHA-256 seule (format historique), sinon préfixée par l'algorithme"""
+        if digest is None:
+            return None
+        return digest if algorithm == "sha256" else f"{algorithm}:{digest}"
+
+    @staticmethod
+    def entry_path(entry):
+        """Chemin archivé d'une entrée d'index (ancienne forme : chaîne seule)"""
+        return entry if isinstance(entry, str) else entry.get("path", "")
+
+    @staticmethod
+    def entry_algorithm(entry):
+        return "sha256" if isinstance(entry, str) else entry.get("algo", "sha256")
+
     @staticmethod
     def is_duplicate(file_hash, index_data):
         """Vérifie si un fichier existe déjà dans l'index"""
         return file_hash in index_data
 
-class MetadataManager:
-    """Gestionnaire des métadonnées pour fichiers audio/vidéo"""
+class MediaPayloadHasher:
+    """Empreinte du contenu audio/vidéo seul : balises ID3 (MP3) et atomes de métadonnées (MP4) ignorés"""
+    EXTENSIONS = (".mp3", ".mp4", ".m4a", ".m4v")
+
     @staticmethod
-    def tag_file(filepath, category, subcategory):
-        """Injecte des métadonnées dans les fichiers"""
+    def synchsafe(data):
+        return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+    @staticmethod
+    def payload_ranges(filepath):
+        """Plages (position, longueur) du contenu, ou None si le format n'est pas reconnu"""
         ext = os.path.splitext(filepath)[1].lower()
-        try:
+        with open(filepath, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
             if ext == ".mp3":
-                try:
-                    audio = EasyID3(filepath)
-                except:
-                    audio = EasyID3()
-                    audio.save(filepath)
-                    audio = EasyID3(filepath)
-                
-                audio['genre'] = category
-                audio['album'] = subcategory
-                audio['artist'] = "MALKOGED AI"
-                audio.save()
-                
-            elif ext in [".mp4", ".m4a", ".m4v"]:
-                try:
-                    video = MP4(filepath)
-                except:
-                    video = MP4()
-                
-                video["\xa9gen"] = category  # Tag Genre
-                video["\xa9alb"] = subcategory  # Tag Album/Projet
-                video["\xa9art"] = "MALKOGED AI"
-                video.save()
-                
+                start = 0
+                while True:  # Balises ID3v2 (éventuellement successives) en tête
+                    f.seek(start)
+                    header = f.read(10)
+                    if len(header) < 10 or header[:3] != b"ID3":
+                        break
+                    footer = 10 if header[5] & 0x10 else 0
+                    start += 10 + MediaPayloadHasher.synchsafe(header[6:10]) + footer
+                end = size
+                if size - start >= 128:
+                    f.seek(size - 128)
+                    if f.read(3) == b"TAG":  # ID3v1 en fin de fichier
+                        end -= 128
+                return [(start, max(0, end - start))]
+            if ext in (".mp4", ".m4a", ".m4v"):
+                # Seuls les atomes 'mdat' (flux audio/vidéo) comptent ; 'moov' porte les balises
+                ranges = []
+                offset = 0
+                while offset + 8 <= size:
+                    f.seek(offset)
+                    box_size, box_type = struct.unpack(">I4s", f.read(8))
+                    header_size = 8
+                    if box_size == 1:
+                        box_size = struct.unpack(">Q", f.read(8))[0]
+                        header_size = 16
+                    elif box_size == 0:
+                        box_size = size - offset
+                    if box_size < header_size:
+                        return None  # Conteneur corrompu
+                    if box_type == b"mdat":
+                        ranges.append((offset + header_size, box_size - header_size))
+                    offset += box_size
+                return ranges or None
+        return None
+
+    @staticmethod
+    def get_payload_hash(filepath, algorithm="sha256", throttle=None):
+        """Empreinte des plages de contenu (fichier entier si le format n'est pas reconnu)"""
+        try:
+            ranges = MediaPayloadHasher.payload_ranges(filepath)
+            if ranges is None:
+                return DuplicateManager.get_file_hash(filepath, algorithm, throttle)
+            payload_hash = DuplicateManager.new_hasher(algorithm)
+            with open(filepath, "rb") as f:
+                for offset, length in ranges:
+                    f.seek(offset)
+                    while length > 0:
+                        block = f.read(min(DuplicateManager.BLOCK_SIZE, length))
+                        if not block:
+                            break
+                        if throttle:
+                            throttle(len(block))
+                        payload_hash.update(block)
+                        length -= len(block)
+            return payload_hash.hexdigest()
         except Exception as e:
-            print(f"Erreur tagging {filepath}: {e}")
+            print(f"Erreur calcul hash du contenu média: {e}")
+            return None
 
-class ClassificationEngine:
-    """Moteur de classification IA DeepSeek avec création automatique de catégories"""
-    def __init__(self):
-        self.config = ConfigManager.load_config()
-        self.typology = self.config.get("typology", {})
-        self.api_available = self.config.get("api_active", True) and API_KEY and API_KEY != "TA_CLE_API_ICI"
-        self.auto_create_categories = self.config.get("auto_create_categories", True)
+class FileIndex(dict):
+    """Index des archives : empreinte -> fiche (source, chemin, taille, catégorie, date...),
+    avec index secondaires tenus à jour à chaque écriture"""
+    FIELDS = ["path", "source", "size", "mtime", "category", "subcategory", "method", "archived_at", "algo"]
 
-    def reload_typology(self):
-        """Recharge la typologie depuis le fichier de configuration"""
-        self.config = ConfigManager.load_config()
-        self.typology = self.config.get("typology", {})
-        self.auto_create_categories = self.config.get("auto_create_categories", True)
-        return self.typology
+    def __init__(self, data=None):
+        super().__init__()
+        self.by_path = {}
+        self.by_source = {}
+        self.by_category = {}  # catégorie -> {empreintes}
+        self.category_sizes = {}
+        self.dates = []  # (archived_at, empreinte) trié pour les requêtes par période
+        self.on_change = None  # Appelé avec chaque fiche ajoutée ou retirée (archive à réécrire)
+        self.registry = None  # Registre des archives dont l'index provient (fiches masquées à réécrire)
+        self.update(data or {})
 
-    def extract_text_from_pdf(self, filepath):
-        """Extrait le texte d'un PDF"""
-        text = ""
-        try:
-            with pdfplumber.open(filepath) as pdf:
-                for page in pdf.pages[:50]:  # Limité à 50 pages pour performance
-                    extracted = page.extract_text()
-                    if extracted:
-                        text += extracted + "\n"
-        except Exception as e:
-            print(f"Erreur extraction PDF {filepath}: {e}")
-        return text
+    @staticmethod
+    def normalize(entry):
+        """Fiche complète ; les anciennes entrées (chemin seul) sont complétées à partir de l'arborescence"""
+        record = {"path": entry, "algo": "sha256"} if isinstance(entry, str) else dict(entry)
+        if "category" not in record:
+            # Arborescence d'archive : <destination>/<catégorie>/<sous-catégorie>/<fichier>
+            folder = os.path.dirname(record.get("path", ""))
+            record["subcategory"] = os.path.basename(folder)
+            record["category"] = os.path.basename(os.path.dirname(folder))
+        return record
 
-    def analyze_filename(self, filename):
-        """Analyse le nom de fichier pour déterminer la catégorie"""
-        filename_lower = filename.lower()
-        
-        # Règles de classification basées sur le nom
-        rules = {
-            "JURIDIQUE": ["bail", "acte", "contrat", "legal", "juridique"],
-            "TECHNIQUE": ["diagnostic", "technique", "plan", "devis", "video", "photo"],
-            "COMPTABILITE": ["facture", "compte", "bancaire", "impôt", "fiscal"],
-            "ADMINISTRATIF": ["assurance", "courrier", "identite", "administratif"]
-        }
-        
-        for category, keywords in rules.items():
-            if any(keyword in filename_lower for keyword in keywords):
-                return category
-        
-        return None  # Retourne None si aucune catégorie ne correspond
-    
-    def extract_text(self, filepath):
-        """Extrait le texte de différents types de fichiers"""
-        ext = os.path.splitext(filepath)[1].lower()
-        text = ""
-        try:
-            if ext == ".pdf":
-                text = self.extract_text_from_pdf(filepath)
-            elif ext == ".docx":
-                doc = docx.Document(filepath)
-                text = "\n".join([para.text for para in doc.paragraphs])
-            elif ext == ".xlsx":
-                wb = openpyxl.load_workbook(filepath, read_only=True)
-                # On lit les premières lignes de chaque feuille pour le contexte
-                for sheet in wb.worksheets[:2]:
-                    for row in sheet.iter_rows(max_row=20, values_only=True):
-                        text += " ".join([str(cell) for cell in row if cell]) + "\n"
-            elif ext == ".pptx":
-                prs = Presentation(filepath)
-                for slide in prs.slides[:5]:
-                    for shape in slide.shapes:
-                        if hasattr(shape, "text"):
-                            text += shape.text + "\n"
-        except Exception as e:
-            print(f"Erreur d'extraction sur {ext}: {e}")
-        return text
-    
-    def call_deepseek_api(self, prompt_text):
-        """Appelle l'API DeepSeek pour classification"""
+    def _link(self, key, record):
+        self.by_path[record.get("path")] = key
+        if record.get("source"):
+            self.by_source.setdefault(record["source"], set()).add(key)
+        category = record.get("category", "")
+        self.by_category.setdefault(category, set()).add(key)
+        self.category_sizes[category] = self.category_sizes.get(category, 0) + (record.get("size") or 0)
+        if record.get("archived_at"):
+            bisect.insort(self.dates, (record["archived_at"], key))
+
+    def _unlink(self, key, record):
+        if self.by_path.get(record.get("path")) == key:
+            del self.by_path[record["path"]]
+        self.by_source.get(record.get("source"), set()).discard(key)
+        category = record.get("category", "")
+        self.by_category.get(category, set()).discard(key)
+        if not self.by_category.get(category):
+            self.by_category.pop(category, None)
+            self.category_sizes.pop(category, None)
+        else:
+            self.category_sizes[category] -= record.get("size") or 0
+        if record.get("archived_at"):
+            position = bisect.bisect_left(self.dates, (record["archived_at"], key))
+            if position < len(self.dates) and self.dates[position] == (record["archived_at"], key):
+                del self.dates[position]
+
+    def __setitem__(self, key, entry):
+        record = self.normalize(entry)
+        if key in self:
+            previous = dict.__getitem__(self, key)
+            self._unlink(key, previous)
+            if self.on_change and previous.get("path") != record.get("path"):
+                self.on_change(previous)  # Fiche déplacée vers une autre archive
+        dict.__setitem__(self, key, record)
+        self._link(key, record)
+        if self.on_change:
+            self.on_change(record)
+
+    def __delitem__(self, key):
+        record = dict.__getitem__(self, key)
+        self._unlink(key, record)
+        dict.__delitem__(self, key)
+        if self.on_change:
+            self.on_change(record)
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        record = dict.__getitem__(self, key)
+        del self[key]
+        return record
+
+    def setdefault(self, key, entry=None):
+        if key not in self:
+            self[key] = entry
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, entry in dict(*args, **kwargs).items():
+            self[key] = entry
+
+    def clear(self):
+        dict.clear(self)
+        for secondary in (self.by_path, self.by_source, self.by_category, self.category_sizes):
+            secondary.clear()
+        self.dates.clear()
+
+    # ---- Requêtes ----
+    def find_by_path(self, path):
+        """Empreinte d'un fichier archivé, ou None"""
+        return self.by_path.get(path)
+
+    def find_by_source(self, source):
+        """Fiches archivées depuis ce fichier source"""
+        return [dict.__getitem__(self, key) for key in self.by_source.get(source, ())]
+
+    def category_counts(self):
+        return {category: len(keys) for category, keys in self.by_category.items()}
+
+    def archived_between(self, start, end=None):
+        """Fiches archivées entre deux dates ISO (bornes incluses)"""
+        low = bisect.bisect_left(self.dates, (start,))
+        high = len(self.dates) if end is None else bisect.bisect_right(self.dates, (end + "\uffff",))
+        return [dict.__getitem__(self, key) for _, key in self.dates[low:high]]
+
+    def total_size(self):
+        return sum(self.category_sizes.values())
+
+    def to_dataframe(self):
+        """Export analytique (pandas) : une ligne par fiche, colonnes typées"""
+        if pd is None:
+            raise ValueError("Module pandas non installé (pip install pandas)")
+        frame = pd.DataFrame.from_records(list(self.values()), index=list(self.keys()), columns=self.FIELDS)
+        frame.index.name = "hash"
+        frame["archived_at"] = pd.to_datetime(frame["archived_at"], errors="coerce")
+        frame["mtime"] = pd.to_datetime(frame["mtime"], unit="s", errors="coerce")
+        frame["size"] = pd.to_numeric(frame["size"], errors="coerce").astype("Int64")
+        for column in ("category", "subcategory", "method", "algo"):
+            frame[column] = frame[column].astype("category")
+        return frame
+
+    def export(self, path):
+        """Écrit l'index en Parquet ou CSV selon l'extension"""
+        frame = self.to_dataframe()
+        if path.lower().endswith(".parquet"):
+            frame.to_parquet(path)
+        else:
+            frame.to_csv(path, sep=";")
+        return len(frame)
+
+class BloomFilter:
+    """Filtre de Bloom des empreintes d'une archive : « peut-être présente » ou « absente à coup sûr »"""
+    MAGIC = b"GBF1"
+    HEADER = struct.Struct(">4sBIQ")  # Signature, nombre de fonctions, nombre d'empreintes, nombre de bits
+
+    def __init__(self, nbits, hashes, bits=None, count=0):
+        self.nbits = nbits
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray((nbits + 7) // 8)
+        self.count = count
+
+    @staticmethod
+    def for_keys(keys, error_rate=0.01):
+        """Filtre dimensionné pour ces empreintes (marge pour les ajouts avant la prochaine sauvegarde)"""
+        keys = list(keys)
+        capacity = max(1024, 2 * len(keys))
+        nbits = int(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        bloom = BloomFilter(nbits, max(1, round(nbits / capacity * math.log(2))))
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    def _positions(self, key):
+        # Double hachage : k positions à partir de deux valeurs de 64 bits
+        first, second = struct.unpack(">QQ", hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest())
+        return [(first + i * second) % self.nbits for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def to_bytes(self):
+        return self.HEADER.pack(self.MAGIC, self.hashes, self.count, self.nbits) + bytes(self.bits)
+
+    @staticmethod
+    def from_bytes(data):
+        magic, hashes, count, nbits = BloomFilter.HEADER.unpack_from(data)
+        if magic != BloomFilter.MAGIC:
+            raise ValueError("Filtre de Bloom invalide")
+        return BloomFilter(nbits, hashes, bytearray(data[BloomFilter.HEADER.size:]), count)
+
+class ArchiveRegistry:
+    """Archives connues, une par dossier de destination : chaque racine porte son index et le filtre de Bloom
+    de ses empreintes dans <racine>/.malkoged. Seules les archives rattachées et montées sont consultées,
+    et l'index d'une archive n'est chargé qu'au premier doublon possible signalé par son filtre"""
+
+    def __init__(self, path=ARCHIVES_FILE, error_rate=0.01):
+        self.path = path
+        self.error_rate = error_rate
+        self.archives = {}  # Racine -> {"attached", "added", "records", "algos"}
+        self.filters = {}  # Racine en ligne -> BloomFilter (None : pas encore de filtre)
+        self.loaded = set()  # Racines dont l'index est dans l'index commun
+        self.dirty = set()  # Racines modifiées depuis la dernière sauvegarde
+        self.shadowed = {}  # Racine -> fiches masquées par le même contenu dans une autre archive
+        self.index = None
+        self._loading = False
+        self.lock = threading.RLock()
+        self.load_registry()
+        self.migrate_legacy()
+
+    # --- Registre
+    def load_registry(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.archives = json.load(f).get("archives", {})
+            except Exception as e:
+                print(f"Erreur chargement registre des archives: {e}")
+
+    def save_registry(self):
+        with self.lock:
+            data = {"archives": self.archives}
+            try:
+                with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=4, ensure_ascii=False)
+                os.replace(self.path + ".tmp", self.path)
+            except Exception as e:
+                print(f"Erreur sauvegarde registre des archives: {e}")
+
+    @staticmethod
+    def root_of(path):
+        # Arborescence d'archive : <destination>/<catégorie>/<sous-catégorie>/<fichier>
+        return os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(path))))
+
+    @staticmethod
+    def meta_path(root, name):
+        return os.path.join(root, ARCHIVE_META_DIR, name)
+
+    def online(self):
+        """Archives rattachées dont le support est présent"""
+        return [root for root, info in self.archives.items() if info.get("attached", True) and os.path.isdir(root)]
+
+    def algorithms(self):
+        """Algorithmes d'empreinte présents dans les archives en ligne (sans charger leurs index)"""
+        return {algo for root in self.online() for algo in self.archives[root].get("algos", ["sha256"])}
+
+    def unmigrated(self, settings):
+        """Archives en ligne non vides indexées sous d'autres réglages d'empreinte (ou avant leur suivi)"""
+        return [root for root in self.online()
+                if self.archives[root].get("records") and self.archives[root].get("hashing") != settings]
+
+    def mark_migrated(self, settings):
+        """Note que les archives en ligne sont indexées sous les réglages d'empreinte 'settings'"""
+        with self.lock:
+            for root in self.online():
+                self.archives[root]["hashing"] = settings
+        self.save_registry()
+
+    # --- Index commun
+    def open(self, index, loaded=False):
+        """Associe l'index commun ; seuls les filtres sont lus ('loaded' : index déjà complet)"""
+        self.index = index
+        index.on_change = self._changed
+        index.registry = self
+        for root in self.online():
+            if loaded:
+                self.loaded.add(root)
+            else:
+                self.filters[root] = self.read_filter(root)
+
+    def _changed(self, record):
+        if not self._loading:
+            self.dirty.add(self.root_of(record.get("path", "")))
+
+    def read_filter(self, root):
         try:
-            headers = {
-                "Authorization": f"Bearer {API_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {"role": "system", "content": "Tu es un assistant spécialisé dans la classification et l'indexation documentaires."},
-                    {"role": "user", "content": prompt_text}
-                ],
-                "temperature": 0.1,
-                "max_tokens": 500
-            }
-            
-            response = requests.post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
-            
+            with open(self.meta_path(root, "bloom.bin"), "rb") as f:
+                return BloomFilter.from_bytes(f.read())
+        except FileNotFoundError:
+            return None
         except Exception as e:
-            print(f"Erreur API DeepSeek: {e}")
+            print(f"Erreur lecture filtre {root}: {e}")
             return None
 
-    def suggest_new_category(self, content_text, filename):
-        """Demande à l'IA de suggérer une nouvelle catégorie et sous-catégorie"""
-        try:
-            prompt = f"""
-            Analyse ce document pour créer une classification pertinente :
-            
-            Nom du fichier: {filename}
-            
+    def read_index(self, root):
+        path = self.meta_path(root, "index.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def loaded_records(self, root):
+        """Fiches d'une archive chargée, masquées comprises ; None si elle n'est pas chargée (appelant : verrou)"""
+        with self.lock:
+            if root not in self.loaded or self.index is None:
+                return None
+            records = {key: record for key, record in self.index.items() if self.root_of(record["path"]) == root}
+            records.update(self.shadowed.get(root, {}))
+            return records
+
+    def stored_records(self, root):
+        """Fiches d'une archive lues sur son support, sans les charger dans l'index commun"""
+        records = self.read_index(root)
+        records.update(self.read_pending().get(root, {}))
+        return records
+
+    def load(self, root):
+        """Charge l'index d'une archive dans l'index commun (appelant : verrou de l'index)"""
+        with self.lock:
+            if root in self.loaded or self.index is None:
+                return
+            try:
+                records = self.read_index(root)
+            except Exception as e:
+                print(f"Erreur chargement index {root}: {e}")
+                return
+            pending = self.take_pending(root)
+            # Même contenu déjà présent dans une autre archive : la fiche reste dans l'index de son archive
+            self.shadowed[root] = {key: records.pop(key) for key in [key for key in records if key in self.index]
+                                   if self.root_of(self.index[key]["path"]) != root}
+            self._loading = True
+            try:
+                self.index.update(records)
+            finally:
+                self._loading = False
+            self.index.update(pending)  # Fiches en attente du support : à écrire sur l'archive
+            self.loaded.add(root)
+            self.filters.pop(root, None)
+
+    def load_all(self):
+        for root in self.online():
+            self.load(root)
+
+    def candidates(self, key):
+        """Archives non chargées pouvant contenir cette empreinte"""
+        with self.lock:
+            return [root for root in self.online() if root not in self.loaded
+                    and (self.filters.get(root) is None or key in self.filters[root])]
+
+    def lookup(self, key):
+        """Fiche d'une empreinte : index commun, puis archives signalées par leur filtre"""
+        entry = self.index.get(key)
+        if entry is None:
+            for root in self.candidates(key):
+                self.load(root)
+                entry = self.index.get(key)
+                if entry is not None:
+                    break
+        return entry
+
+    # --- Rattachement
+    def attach(self, root):
+        """Inscrit ou rattache une archive (dossier de destination, support amovible rebranché)"""
+        root = os.path.abspath(root)
+        with self.lock:
+            info = self.archives.setdefault(root, {"added": datetime.now().isoformat(timespec="seconds")})
+            changed = not info.get("attached", False)
+            info["attached"] = True
+            if root not in self.loaded and root not in self.filters and os.path.isdir(root):
+                self.filters[root] = self.read_filter(root)
+        if changed:
+            self.save_registry()
+        return root
+
+    def detach(self, root):
+        """Détache une archive : son index est sauvegardé puis retiré de l'index commun (appelant : verrou)"""
+        root = os.path.abspath(root)
+        with self.lock:
+            if root not in self.archives:
+                raise ValueError(f"Archive inconnue: {root}")
+            if self.index is not None and root in self.loaded:
+                records = {key: record for key, record in self.index.items() if self.root_of(record["path"]) == root}
+                if root in self.dirty:
+                    self.write(root, records)
+                self.shadowed.pop(root, None)
+                self._loading = True
+                try:
+                    for key in records:
+                        del self.index[key]
+                    # Même contenu dans une autre archive chargée : sa fiche masquée redevient visible
+                    for hidden in self.shadowed.values():
+                        for key in [key for key in hidden if key not in self.index]:
+                            self.index[key] = hidden.pop(key)
+                finally:
+                    self._loading = False
+            self.loaded.discard(root)
+            self.shadowed.pop(root, None)
+            self.filters.pop(root, None)
+            self.dirty.discard(root)
+            self.archives[root]["attached"] = False
+        self.save_registry()
+
+    # --- Écriture
+    def write(self, root, records):
+        """Écrit l'index et le filtre d'une archive (fiches mises en attente si le support est absent)"""
+        if not os.path.isdir(root):
+            self.put_pending(root, records)
+            return
+        os.makedirs(os.path.join(root, ARCHIVE_META_DIR), exist_ok=True)
+        for name, payload in (("index.json", json.dumps(records, ensure_ascii=False).encode("utf-8")),
+                              ("bloom.bin", BloomFilter.for_keys(records, self.error_rate).to_bytes())):
+            path = self.meta_path(root, name)
+            with open(path + ".tmp", "wb") as f:
+                f.write(payload)
+            os.replace(path + ".tmp", path)
+        info = self.archives.setdefault(root, {"added": datetime.now().isoformat(timespec="seconds"),
+                                               "attached": True})
+        info["records"] = len(records)
+        info["algos"] = sorted({DuplicateManager.entry_algorithm(record) for record in records.values()}
+                               or {"sha256"})
+        info.update(self.summarize(records))
+
+    @staticmethod
+    def summarize(records, days=31):
+        """Résumé d'une archive gardé dans le registre : statistiques sans charger son index"""
+        since = datetime.fromtimestamp(time.time() - days * 86400).isoformat(timespec="seconds")[:10]
+        categories, archived = {}, {}
+        size = 0
+        for record in records.values():
+            category = record.get("category", "")
+            categories[category] = categories.get(category, 0) + 1
+            size += record.get("size") or 0
+            day = (record.get("archived_at") or "")[:10]
+            if day >= since:
+                archived[day] = archived.get(day, 0) + 1
+        return {"bytes": size, "categories": categories, "archived_days": archived}
+
+    def save(self, records, all_roots=False):
+        """Répartit une copie de l'index commun par archive et réécrit les archives modifiées"""
+        with self.lock:
+            roots = set(self.dirty)
+            self.dirty.clear()
+            if all_roots:
+                roots |= set(self.online())
+        if not roots and not all_roots:
+            return
+        partitions = {root: {} for root in roots}
+        for key, record in records.items():
+            root = self.root_of(DuplicateManager.entry_path(record))
+            if all_roots:
+                partitions.setdefault(root, {})[key] = record
+            elif root in partitions:
+                partitions[root][key] = record
+        for root, partition in partitions.items():
+            try:
+                with self.lock:
+                    hidden = dict(self.shadowed.get(root, {}))
+                    loaded = root in self.loaded
+                if not loaded and os.path.isdir(root):
+                    stored = self.read_index(root)
+                    if all_roots:
+                        # Contenu rattaché à une autre archive dans l'index complet : copie locale conservée
+                        hidden = dict({key: record for key, record in stored.items()
+                                       if key in records and key not in partition}, **hidden)
+                    else:
+                        # Index non chargé : seules les nouvelles fiches sont en mémoire
+                        partition = dict(stored, **partition)
+                for key, record in hidden.items():
+                    partition.setdefault(key, record)
+                self.write(root, partition)
+            except Exception as e:
+                print(f"Erreur sauvegarde index {root}: {e}")
+                with self.lock:
+                    self.dirty.add(root)
+        self.save_registry()
+
+    def put_pending(self, root, records):
+        pending = self.read_pending()
+        pending.setdefault(root, {}).update(records)
+        with open(ARCHIVES_PENDING_FILE, "w", encoding="utf-8") as f:
+            json.dump(pending, f, ensure_ascii=False)
+
+    def read_pending(self):
+        if not os.path.exists(ARCHIVES_PENDING_FILE):
+            return {}
+        with open(ARCHIVES_PENDING_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def take_pending(self, root):
+        pending = self.read_pending()
+        records = pending.pop(root, {})
+        if records:
+            if pending:
+                with open(ARCHIVES_PENDING_FILE, "w", encoding="utf-8") as f:
+                    json.dump(pending, f, ensure_ascii=False)
+            else:
+                os.remove(ARCHIVES_PENDING_FILE)
+        return records
+
+    def migrate_legacy(self):
+        """Répartit l'ancien index global entre les archives (une seule fois)"""
+        if not os.path.exists(INDEX_FILE):
+            return
+        try:
+            with open(INDEX_FILE, "r", encoding="utf-8") as f:
+                legacy = FileIndex(json.load(f))
+            partitions = {}
+            for key, record in legacy.items():
+                partitions.setdefault(self.root_of(record["path"]), {})[key] = dict(record)
+            for root, records in partitions.items():
+                existing = {}
+                if os.path.isdir(root):
+                    existing = self.read_index(root)
+                self.write(root, dict(records, **existing))
+            self.save_registry()
+            os.replace(INDEX_FILE, INDEX_FILE + ".migrated")
+            print(f"Index global réparti entre {len(partitions)} archive(s)")
+        except Exception as e:
+            print(f"Erreur migration de l'index global: {e}")
+
+class PackStore:
+    """Petits documents regroupés dans de gros fichiers : chaque blob (compressé par zlib s'il y gagne)
+    est ajouté en fin de pack derrière un en-tête (clé, tailles) ; sa position est conservée dans
+    la fiche d'index et la lecture se fait par projection mémoire (mmap)"""
+    MAGIC = b"GPK1"
+    HEADER = struct.Struct(">4sBHIQ")  # Signature, compressé, longueur de la clé, taille stockée, taille d'origine
+    _maps = {}
+    _maps_lock = threading.Lock()
+
+    def __init__(self, root, max_pack_bytes=1024 ** 3, level=6):
+        self.root = root
+        self.directory = os.path.join(root, PACK_DIR_NAME)
+        self.max_pack_bytes = max_pack_bytes
+        self.level = level
+        self.lock = threading.Lock()
+
+    def packs(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                      if name.endswith(PACK_EXTENSION))
+
+    def active(self, exclude=None):
+        """Pack en cours de remplissage ('exclude' : pack en cours de compactage)"""
+        packs = self.packs()
+        if packs and packs[-1] != exclude and os.path.getsize(packs[-1]) < self.max_pack_bytes:
+            return packs[-1]
+        number = int(os.path.basename(packs[-1])[5:-len(PACK_EXTENSION)]) + 1 if packs else 1
+        return os.path.join(self.directory, f"pack-{number:05d}{PACK_EXTENSION}")
+
+    def append_bytes(self, key, data, mtime=None, exclude=None):
+        """Ajoute un blob ; retourne sa position (champ 'pack' de la fiche d'index)"""
+        compressed = zlib.compress(data, self.level)
+        stored, is_compressed = (compressed, 1) if len(compressed) < len(data) else (data, 0)
+        key_bytes = key.encode("utf-8")
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self.active(exclude)
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(self.HEADER.pack(self.MAGIC, is_compressed, len(key_bytes), len(stored), len(data)))
+                f.write(key_bytes)
+                f.write(stored)
+                f.flush()
+                os.fsync(f.fileno())  # Le fichier d'origine est supprimé juste après
+        return {"file": path, "offset": offset + self.HEADER.size + len(key_bytes), "length": len(stored),
+                "compressed": bool(is_compressed), "size": len(data), "mtime": mtime}
+
+    def append(self, key, filepath):
+        with open(filepath, "rb") as f:
+            data = f.read()
+        return self.append_bytes(key, data, os.stat(filepath).st_mtime)
+
+    @staticmethod
+    def read(entry):
+        """Contenu d'un blob (champ 'pack' d'une fiche d'index)"""
+        end = entry["offset"] + entry["length"]
+        with PackStore._maps_lock:
+            mapped = PackStore._maps.get(entry["file"])
+            if mapped is None or len(mapped) < end:  # Pack agrandi depuis la projection
+                if mapped is not None:
+                    mapped.close()
+                with open(entry["file"], "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                PackStore._maps[entry["file"]] = mapped
+            data = mapped[entry["offset"]:end]
+        return zlib.decompress(data) if entry.get("compressed") else data
+
+    @staticmethod
+    def release(path):
+        """Ferme la projection d'un pack (avant sa suppression)"""
+        with PackStore._maps_lock:
+            mapped = PackStore._maps.pop(path, None)
+            if mapped is not None:
+                mapped.close()
+
+    @staticmethod
+    def blob_size(key, entry):
+        """Place occupée dans le pack, en-tête compris"""
+        return PackStore.HEADER.size + len(key.encode("utf-8")) + entry["length"]
+
+    @staticmethod
+    def extract(entry, dest_path):
+        os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+        with open(dest_path + ".tmp", "wb") as f:
+            f.write(PackStore.read(entry))
+        os.replace(dest_path + ".tmp", dest_path)
+        if entry.get("mtime"):
+            os.utime(dest_path, (entry["mtime"], entry["mtime"]))
+
+    @staticmethod
+    @contextmanager
+    def materialized(record):
+        """Chemin lisible d'un document archivé (copie temporaire s'il est rangé dans un pack)"""
+        entry = record.get("pack") if isinstance(record, dict) else None
+        if entry is None:
+            yield DuplicateManager.entry_path(record)
+            return
+        handle, path = tempfile.mkstemp(suffix=os.path.splitext(record["path"])[1])
+        try:
+            with os.fdopen(handle, "wb") as f:
+                f.write(PackStore.read(entry))
+            yield path
+        finally:
+            os.remove(path)
+
+class ContentHasher:
+    """Empreintes de contenu selon l'algorithme configuré (préfiltre rapide, blocs parallèles)"""
+    def __init__(self, config):
+        self.algorithm = config.get("hash_algorithm", "sha256")
+        if self.algorithm not in DuplicateManager.ALGORITHMS:
+            print(f"Algorithme d'empreinte inconnu: {self.algorithm}, SHA-256 utilisé")
+            self.algorithm = "sha256"
+        self.tree_min_bytes = config.get("tree_hash_min_mb", 256) * 1024 * 1024
+        self.chunk_size = config.get("tree_hash_chunk_mb", 64) * 1024 * 1024
+        self.workers = config.get("hash_workers", 4)
+        self.media_payload = config.get("media_payload_hash", False)
+
+    @property
+    def confirms_with_sha256(self):
+        return self.algorithm == "xxh3+sha256"
+
+    @property
+    def settings(self):
+        """Réglages dont dépend la clé d'un fichier : un index créé sous d'autres réglages est à migrer"""
+        return f"{self.algorithm};payload={int(bool(self.media_payload))};tree={self.tree_min_bytes}"
+
+    def algorithm_for(self, filepath, size):
+        """Algorithme effectif pour ce fichier (contenu média seul, blocs parallèles si volumineux)"""
+        primary = "xxh3" if self.confirms_with_sha256 else self.algorithm
+        if self.media_payload and filepath.lower().endswith(MediaPayloadHasher.EXTENSIONS):
+            # Jamais par blocs : l'empreinte de la piste reste séquentielle quelle que soit la taille,
+            # pour que la clé et sa confirmation SHA-256 ne dépendent pas de 'tree_hash_min_mb'
+            return f"{primary}-payload"
+        if primary != "sha256" and size >= self.tree_min_bytes:
+            return f"{primary}-tree"
+        return primary
+
+    def may_have_indexed(self, algorithm, filepath, size):
+        """Un réglage antérieur a-t-il pu indexer ce fichier avec cet algorithme (type et taille du fichier)"""
+        if algorithm.endswith("-payload"):
+            return filepath.lower().endswith(MediaPayloadHasher.EXTENSIONS)
+        if algorithm.endswith("-tree"):
+            return size >= self.tree_min_bytes
+        return True
+
+    @staticmethod
+    def confirmation_algorithm(algorithm):
+        """Algorithme de confirmation d'un doublon trouvé par le préfiltre xxh3"""
+        return "sha256-payload" if algorithm.endswith("-payload") else "sha256"
+
+    def key_for(self, filepath, algorithm, throttle=None):
+        """Clé d'index d'un fichier pour un algorithme donné (suffixes '-tree' / '-payload' compris)"""
+        if algorithm.endswith("-payload"):
+            digest = MediaPayloadHasher.get_payload_hash(filepath, algorithm[:-8], throttle)
+        elif algorithm.endswith("-tree"):
+            digest = DuplicateManager.get_tree_hash(filepath, algorithm[:-5], self.chunk_size, self.workers, throttle)
+        else:
+            digest = DuplicateManager.get_file_hash(filepath, algorithm, throttle)
+        return DuplicateManager.index_key(digest, algorithm)
+
+    def key_for_entry(self, entry, algorithm, throttle=None):
+        """Clé d'index d'un document archivé, fichier ou blob d'un pack"""
+        pack = entry.get("pack") if isinstance(entry, dict) else None
+        if pack is None:
+            return self.key_for(DuplicateManager.entry_path(entry), algorithm, throttle)
+        if algorithm.endswith(("-payload", "-tree")):
+            with PackStore.materialized(entry) as path:
+                return self.key_for(path, algorithm, throttle)
+        try:
+            data = PackStore.read(pack)
+            if throttle:
+                throttle(len(data))
+            file_hash = DuplicateManager.new_hasher(algorithm)
+            file_hash.update(data)
+            return DuplicateManager.index_key(file_hash.hexdigest(), algorithm)
+        except Exception as e:
+            print(f"Erreur lecture pack: {e}")
+            return None
+
+    def hash_file(self, filepath, size=None):
+        """Retourne (clé d'index, algorithme)"""
+        size = os.path.getsize(filepath) if size is None else size
+        algorithm = self.algorithm_for(filepath, size)
+        return self.key_for(filepath, algorithm), algorithm
+
+class IndexMigrator:
+    """Recalcule en arrière-plan les empreintes de l'index avec l'algorithme configuré"""
+    SAVE_EVERY = 200
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.cancelled = threading.Event()
+        self.progress = {"total": 0, "done": 0, "missing": 0}
+        self.finished = False
+
+    def pending_keys(self):
+        """Empreintes à recalculer ; les archives sont lues une à une sans être chargées"""
+        hasher = self.pipeline.hasher
+        pending = {}
+        for root in self.pipeline.archives.online():
+            for key, entry in self.pipeline.archive_records(root).items():
+                path = DuplicateManager.entry_path(entry)
+                pack = entry.get("pack") if isinstance(entry, dict) else None
+                try:
+                    expected = hasher.algorithm_for(path, pack["size"] if pack else os.path.getsize(path))
+                except OSError:
+                    continue
+                if DuplicateManager.entry_algorithm(entry) != expected:
+                    pending[key] = None  # Même contenu dans deux archives : une seule fois
+        if not pending:
+            self.pipeline.archives.mark_migrated(hasher.settings)
+        self.pipeline.migration_pending = bool(pending)
+        return list(pending)
+
+    def run(self, on_progress=None, pending=None):
+        pipeline = self.pipeline
+        pending = self.pending_keys() if pending is None else pending
+        self.progress["total"] = len(pending)
+        for number, old_key in enumerate(pending, start=1):
+            if self.cancelled.is_set():
+                break
+            with pipeline.index_lock:
+                entry = pipeline.archives.lookup(old_key)  # Archive chargée au besoin pour y être réécrite
+            if entry is None:
+                continue
+            path = DuplicateManager.entry_path(entry)
+            pack = entry.get("pack") if isinstance(entry, dict) else None
+            if not os.path.exists(pack["file"] if pack else path):
+                self.progress["missing"] += 1
+                continue
+            # Hachage hors verrou : l'ingestion continue pendant la migration
+            if pack:
+                algorithm = pipeline.hasher.algorithm_for(path, pack["size"])
+                new_key = pipeline.hasher.key_for_entry(entry, algorithm)
+            else:
+                new_key, algorithm = pipeline.hasher.hash_file(path)
+            if new_key is None:
+                continue
+            with pipeline.index_lock:
+                record = dict(entry) if isinstance(entry, dict) else {"path": entry}
+                if algorithm in ("xxh3", "xxh3-tree") and DuplicateManager.entry_algorithm(entry) == "sha256":
+                    record["sha256"] = old_key  # Confirmation des doublons sans relire l'archive
+                if record.get("content_hash"):
+                    # Média balisé : la nouvelle empreinte est celle du fichier archivé (inutile sur la piste seule)
+                    if algorithm.endswith("-payload"):
+                        record.pop("content_hash")
+                    else:
+                        record["content_hash"] = new_key
+                record["algo"] = algorithm
+                pipeline.file_index.pop(old_key, None)
+                pipeline.file_index[new_key] = record
+                if old_key in pipeline.perceptual_index.data:
+                    pipeline.perceptual_index.data[new_key] = pipeline.perceptual_index.data.pop(old_key)
+            self.progress["done"] = number
+            if number % self.SAVE_EVERY == 0:
+                pipeline.save()
+            if on_progress:
+                on_progress(dict(self.progress))
+        if not self.cancelled.is_set():
+            pipeline.archives.mark_migrated(pipeline.hasher.settings)
+            pipeline.migration_pending = False  # Plus d'empreinte à rapprocher à l'ingestion
+        pipeline.refresh_index_algorithms()
+        pipeline.save()
+        self.finished = True
+        return self.progress
+
+class PerceptualHashManager:
+    """Empreintes perceptuelles (aHash/dHash/pHash) pour détecter les images visuellement identiques"""
+    HASH_SIZE = 8
+    DCT_SIZE = 32
+    _dct_matrix = None
+
+    @staticmethod
+    def is_available():
+        return np is not None and Image is not None
+
+    @staticmethod
+    def _get_dct_matrix():
+        """Matrice DCT-II orthonormée (calculée une seule fois)"""
+        if PerceptualHashManager._dct_matrix is None:
+            n = PerceptualHashManager.DCT_SIZE
+            k = np.arange(n).reshape(-1, 1)
+            x = np.arange(n).reshape(1, -1)
+            matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * x + 1) * k / (2 * n))
+            matrix[0, :] /= np.sqrt(2.0)
+            PerceptualHashManager._dct_matrix = matrix.astype(np.float32)
+        return PerceptualHashManager._dct_matrix
+
+    @staticmethod
+    def _bits_to_hex(bits):
+        return np.packbits(bits.flatten()).tobytes().hex()
+
+    @staticmethod
+    def compute_hashes(filepath):
+        """Calcule aHash, dHash et pHash (64 bits, hexadécimal) d'une image réduite"""
+        if not PerceptualHashManager.is_available():
+            return None
+        size = PerceptualHashManager.HASH_SIZE
+        dct_size = PerceptualHashManager.DCT_SIZE
+        try:
+            with Image.open(filepath) as img:
+                # Décodage JPEG directement à résolution réduite
+                img.draft("L", (dct_size * 4, dct_size * 4))
+                gray = img.convert("L")
+                pixels_dct = np.asarray(gray.resize((dct_size, dct_size), Image.BILINEAR), dtype=np.float32)
+                pixels_d = np.asarray(gray.resize((size + 1, size), Image.BILINEAR), dtype=np.float32)
+                pixels_a = np.asarray(gray.resize((size, size), Image.BILINEAR), dtype=np.float32)
+
+            ahash = pixels_a > pixels_a.mean()
+            dhash = pixels_d[:, 1:] > pixels_d[:, :-1]
+
+            dct = PerceptualHashManager._get_dct_matrix()
+            low_freq = (dct @ pixels_dct @ dct.T)[:size, :size]
+            phash = low_freq > np.median(low_freq.flatten()[1:])  # Sans la composante continue
+
+            return {
+                "ahash": PerceptualHashManager._bits_to_hex(ahash),
+                "dhash": PerceptualHashManager._bits_to_hex(dhash),
+                "phash": PerceptualHashManager._bits_to_hex(phash)
+            }
+        except Exception as e:
+            print(f"Erreur hash perceptuel {filepath}: {e}")
+            return None
+
+    @staticmethod
+    def hamming_distance(hash_a, hash_b):
+        return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+class BKTree:
+    """Arbre BK pour les recherches par distance de Hamming sur des empreintes de 64 bits"""
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, hash_hex, payload):
+        value = int(hash_hex, 16)
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [payload], {}]
+            return
+        node = self.root
+        while True:
+            distance = bin(node[0] ^ value).count("1")
+            if distance == 0:
+                node[1].append(payload)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [payload], {}]
+                return
+            node = child
+
+    def search(self, hash_hex, max_distance):
+        """Retourne [(distance, payload)] pour toutes les empreintes à moins de max_distance"""
+        if self.root is None:
+            return []
+        value = int(hash_hex, 16)
+        results = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = bin(node[0] ^ value).count("1")
+            if distance <= max_distance:
+                results.extend((distance, payload) for payload in node[1])
+            # Inégalité triangulaire : seuls ces sous-arbres peuvent contenir des candidats
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda item: item[0])
+        return results
+
+class PerceptualIndex:
+    """Index des empreintes perceptuelles des images archivées (empreinte SHA-256 -> hashes)"""
+    def __init__(self, data=None, threshold=6):
+        self.data = data if data is not None else {}
+        self.threshold = threshold
+        self.tree = BKTree()
+        for file_hash, entry in self.data.items():
+            if entry.get("phash"):
+                self.tree.add(entry["phash"], file_hash)
+
+    def add(self, file_hash, hashes, path):
+        if not hashes:
+            return
+        self.data[file_hash] = dict(hashes, path=path)
+        self.tree.add(hashes["phash"], file_hash)
+
+    def find_similar(self, hashes):
+        """Cherche une image visuellement identique (pHash et dHash sous le seuil)"""
+        if not hashes:
+            return None
+        for distance, file_hash in self.tree.search(hashes["phash"], self.threshold):
+            entry = self.data.get(file_hash, {})
+            if PerceptualHashManager.hamming_distance(entry.get("dhash", "0"), hashes["dhash"]) <= self.threshold:
+                return {"hash": file_hash, "path": entry.get("path", ""), "distance": distance}
+        return None
+
+class MetadataManager:
+    """Gestionnaire des métadonnées pour fichiers audio/vidéo"""
+    ID3_PADDING = 1024  # Réserve pour des modifications ultérieures sans réécriture
+
+    @staticmethod
+    def _id3_frame(frame_id, value, version):
+        if version == 4:
+            body = b"\x03" + value.encode("utf-8")
+            size = bytes((len(body) >> shift) & 0x7F for shift in (21, 14, 7, 0))
+        else:
+            body = b"\x01" + value.encode("utf-16")
+            size = struct.pack(">I", len(body))
+        return frame_id.encode("ascii") + size + b"\x00\x00" + body
+
+    @staticmethod
+    def _read_id3_frames(src, header, replaced):
+        """Trames de la balise ID3v2 existante (sauf celles remplacées) ; None si non prise en charge"""
+        version, flags = header[3], header[5]
+        if version not in (3, 4) or flags & 0xC0:
+            return None  # ID3v2.2, désynchronisation ou en-tête étendu : balisage classique
+        tag_size = MediaPayloadHasher.synchsafe(header[6:10])
+        data = src.read(tag_size)
+        frames = []
+        position = 0
+        while position + 10 <= len(data) and data[position] != 0:
+            frame_id = data[position:position + 4].decode("latin-1")
+            size_bytes = data[position + 4:position + 8]
+            frame_size = MediaPayloadHasher.synchsafe(size_bytes) if version == 4 else struct.unpack(">I", size_bytes)[0]
+            if frame_id not in replaced:
+                frames.append(data[position:position + 10 + frame_size])
+            position += 10 + frame_size
+        return version, frames, 10 + tag_size + (10 if flags & 0x10 else 0)
+
+    @staticmethod
+    def copy_with_tags(source, dest, category, subcategory):
+        """Copie un MP3 en écrivant les balises au passage (une seule écriture) ; False si impossible"""
+        tags = {"TCON": category, "TALB": subcategory, "TPE1": "MALKOGED AI"}
+        try:
+            with open(source, "rb") as src:
+                header = src.read(10)
+                version, frames, payload_start = 3, [], 0
+                if header[:3] == b"ID3":
+                    existing = MetadataManager._read_id3_frames(src, header, tags)
+                    if existing is None:
+                        return False
+                    version, frames, payload_start = existing
+                body = b"".join(frames) + b"".join(MetadataManager._id3_frame(frame_id, value, version)
+                                                    for frame_id, value in tags.items())
+                body += bytes(MetadataManager.ID3_PADDING)
+                size = bytes((len(body) >> shift) & 0x7F for shift in (21, 14, 7, 0))
+                with open(dest, "wb") as out:
+                    out.write(b"ID3" + bytes((version, 0, 0)) + size + body)
+                    src.seek(payload_start)
+                    shutil.copyfileobj(src, out, DuplicateManager.BLOCK_SIZE)
+            shutil.copystat(source, dest)
+            return True
+        except Exception as e:
+            print(f"Erreur balisage pendant la copie {source}: {e}")
+            return False
+
+    @staticmethod
+    def tag_file(filepath, category, subcategory):
+        """Injecte des métadonnées dans les fichiers"""
+        ext = os.path.splitext(filepath)[1].lower()
+        try:
+            if ext == ".mp3":
+                try:
+                    audio = EasyID3(filepath)
+                except:
+                    audio = EasyID3()
+                    audio.save(filepath)
+                    audio = EasyID3(filepath)
+                
+                audio['genre'] = category
+                audio['album'] = subcategory
+                audio['artist'] = "MALKOGED AI"
+                audio.save()
+                
+            elif ext in [".mp4", ".m4a", ".m4v"]:
+                try:
+                    video = MP4(filepath)
+                except:
+                    video = MP4()
+                
+                video["\xa9gen"] = category  # Tag Genre
+                video["\xa9alb"] = subcategory  # Tag Album/Projet
+                video["\xa9art"] = "MALKOGED AI"
+                video.save()
+                
+        except Exception as e:
+            print(f"Erreur tagging {filepath}: {e}")
+
+class ApiCassette:
+    """Enregistrement / relecture des appels DeepSeek (empreinte de requête -> réponse)"""
+    MODES = ("off", "record", "replay", "auto")
+
+    def __init__(self, path=CASSETTE_FILE, mode="off", replay_latency_ms=0, use_recorded_latency=False):
+        self.path = path
+        self.mode = mode if mode in self.MODES else "off"
+        self.replay_latency_ms = replay_latency_ms
+        self.use_recorded_latency = use_recorded_latency
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.mode != "off":
+            self.load()
+
+    @staticmethod
+    def from_config(config):
+        return ApiCassette(config.get("api_cassette_file", CASSETTE_FILE),
+                           config.get("api_cassette_mode", "off"),
+                           config.get("api_replay_latency_ms", 0),
+                           config.get("api_replay_recorded_latency", False))
+
+    @staticmethod
+    def fingerprint(payload):
+        """Empreinte stable de la requête (modèle, messages, paramètres)"""
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["k"]] = entry
+        except Exception as e:
+            # Une fin de fichier tronquée (arrêt brutal) n'invalide pas les entrées déjà lues
+            print(f"Erreur lecture cassette API: {e}")
+
+    def replay(self, payload):
+        """Retourne la réponse enregistrée (ou None) en simulant la latence demandée"""
+        entry = self.entries.get(self.fingerprint(payload))
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        delay_ms = entry.get("ms", 0) if self.use_recorded_latency else self.replay_latency_ms
+        if delay_ms:
+            time.sleep(delay_ms / 1000.0)
+        return entry["r"]
+
+    def record(self, payload, response_text, elapsed_s):
+        entry = {"k": self.fingerprint(payload), "r": response_text, "ms": round(elapsed_s * 1000)}
+        with self.lock:
+            if entry["k"] in self.entries:
+                return
+            self.entries[entry["k"]] = entry
+            try:
+                # Chaque ajout est un membre gzip : le fichier reste lisible même après un arrêt brutal
+                with gzip.open(self.path, "at", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+            except Exception as e:
+                print(f"Erreur écriture cassette API: {e}")
+
+class TextCache:
+    """Texte extrait des documents, conservé par empreinte de contenu dans des sous-dossiers
+    (ab/cd/<clé>.txt.gz) ; au-delà de 'text_cache_max_mb', les textes les moins relus sont supprimés"""
+    max_bytes = 512 * 1024 * 1024
+    _size = None  # Taille du cache, mesurée au premier ajout puis tenue à jour
+    _lock = threading.Lock()
+
+    @staticmethod
+    def configure(config):
+        TextCache.max_bytes = config.get("text_cache_max_mb", 512) * 1024 * 1024
+
+    @staticmethod
+    def _name(key):
+        return re.sub(r"[^0-9A-Za-z_-]", "_", key) + ".txt.gz"
+
+    @staticmethod
+    def _path(key):
+        # Répartition par préfixe : pas de dossier unique de plusieurs millions de fichiers
+        name = TextCache._name(key)
+        digest = hashlib.md5(name.encode("utf-8")).hexdigest()
+        return os.path.join(TEXT_CACHE_DIR, digest[:2], digest[2:4], name)
+
+    @staticmethod
+    def get(key):
+        path = TextCache._path(key)
+        if not os.path.exists(path):
+            legacy = os.path.join(TEXT_CACHE_DIR, TextCache._name(key))  # Cache à plat des versions précédentes
+            if not os.path.exists(legacy):
+                return None
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(legacy, path)
+            except OSError:
+                path = legacy
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                text = f.read()
+            os.utime(path)  # Date de dernière lecture : les textes relus sont gardés en priorité
+            return text
+        except Exception as e:
+            print(f"Erreur lecture cache texte: {e}")
+            return None
+
+    @staticmethod
+    def put(key, text):
+        path = TextCache._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                f.write(text)
+            written = os.path.getsize(path)
+        except Exception as e:
+            print(f"Erreur écriture cache texte: {e}")
+            return
+        with TextCache._lock:
+            if TextCache._size is None:
+                TextCache._size = TextCache.disk_usage()
+            else:
+                TextCache._size += written
+            if TextCache._size <= TextCache.max_bytes:
+                return
+        TextCache.prune()
+
+    @staticmethod
+    def _entries():
+        for folder, _, names in os.walk(TEXT_CACHE_DIR):
+            for name in names:
+                if name.endswith(".txt.gz"):
+                    path = os.path.join(folder, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    @staticmethod
+    def disk_usage():
+        return sum(size for _, size, _ in TextCache._entries())
+
+    @staticmethod
+    def prune(target_ratio=0.9):
+        """Supprime les textes les moins récemment lus jusqu'à 90 % de la taille maximale"""
+        with TextCache._lock:
+            entries = sorted(TextCache._entries(), key=lambda entry: entry[2])
+            size = sum(entry[1] for entry in entries)
+            target = TextCache.max_bytes * target_ratio
+            removed = 0
+            for path, entry_size, _ in entries:
+                if size <= target:
+                    break
+                try:
+                    os.remove(path)
+                    size -= entry_size
+                    removed += 1
+                except OSError as e:
+                    print(f"Erreur nettoyage cache texte: {e}")
+            TextCache._size = size
+        return removed
+
+class OCREngine:
+    """Reconnaissance de caractères (Tesseract local) pour les PDF numérisés et les images : pages traitées
+    en parallèle dans des processus, arrêt dès que le texte suffit à la classification, texte conservé
+    par empreinte de page (une page déjà lue n'est jamais relue)"""
+    _installed = None
+
+    def __init__(self, config):
+        self.enabled = config.get("ocr_enabled", False)
+        self.languages = config.get("ocr_languages", "fra+eng")
+        self.resolution = config.get("ocr_resolution", 200)
+        self.max_chars = config.get("ocr_max_chars", 4000)
+        self.max_pages = config.get("ocr_max_pages", 20)
+        self.min_text_chars = config.get("ocr_min_text_chars", 20)
+        self.workers = config.get("ocr_workers", 0) or max(1, (os.cpu_count() or 2) // 2)
+        self.slots = threading.BoundedSemaphore(self.workers)  # Pages en cours, tous documents confondus
+        self.executor = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def is_installed():
+        if OCREngine._installed is None:
+            OCREngine._installed = False
+            if pytesseract is not None and Image is not None:
+                try:
+                    pytesseract.get_tesseract_version()
+                    OCREngine._installed = True
+                except Exception:
+                    pass
+            if not OCREngine._installed:
+                print("OCR indisponible : pytesseract, Pillow ou Tesseract non installé")
+        return OCREngine._installed
+
+    @property
+    def available(self):
+        return self.enabled and OCREngine.is_installed()
+
+    def needed(self, filepath, text):
+        """Vrai si le document est un scan ou une image sans texte exploitable"""
+        return (filepath.lower().endswith((".pdf",) + IMAGE_EXTENSIONS)
+                and len(text.strip()) < self.min_text_chars and self.available)
+
+    def _pool(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self.executor
+
+    def page_keys(self, filepath):
+        """(numéro de page, empreinte) des pages à lire ; l'empreinte d'une page de PDF porte sur ses images"""
+        settings = f"{self.languages}|{self.resolution}".encode("utf-8")
+        if filepath.lower().endswith(IMAGE_EXTENSIONS):
+            digest = hashlib.sha256(settings)
+            with open(filepath, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            return [(0, digest.hexdigest())]
+        keys = []
+        with pdfplumber.open(filepath) as pdf:
+            for number, page in enumerate(pdf.pages[:self.max_pages]):
+                digest = hashlib.sha256(settings)
+                digest.update(f"{page.width}x{page.height}|{getattr(page, 'rotation', 0)}".encode("utf-8"))
+                if page.images:
+                    for image in page.images:
+                        digest.update(image["stream"].get_rawdata() or b"")
+                else:
+                    digest.update(f"{os.path.abspath(filepath)}|{os.path.getmtime(filepath)}|{number}".encode("utf-8"))
+                keys.append((number, digest.hexdigest()))
+        return keys
+
+    @staticmethod
+    def recognize(filepath, page_number, resolution, languages):
+        """Texte d'une page (exécuté dans un processus de la réserve)"""
+        if filepath.lower().endswith(IMAGE_EXTENSIONS):
+            with Image.open(filepath) as image:
+                return pytesseract.image_to_string(image, lang=languages)
+        with pdfplumber.open(filepath) as pdf:
+            image = pdf.pages[page_number].to_image(resolution=resolution).original
+        return pytesseract.image_to_string(image, lang=languages)
+
+    def extract(self, filepath):
+        """Texte reconnu, page après page, jusqu'à 'ocr_max_chars' caractères"""
+        try:
+            pages = self.page_keys(filepath)
+        except Exception as e:
+            print(f"Erreur OCR {filepath}: {e}")
+            return ""
+        texts = {}
+        missing = []
+        for number, key in pages:
+            cached = TextCache.get(f"ocr-{key}")
+            if cached is not None:
+                texts[number] = cached
+            else:
+                missing.append((number, key))
+        
+        # Pages lues dans l'ordre, au plus 'workers' à la fois pour l'ensemble des documents en cours :
+        # le budget atteint, on n'en soumet plus
+        order = [number for number, _ in pages]
+        running = {}
+        remaining = list(missing)
+        collected, position = "", 0
+        
+        def submit_more():
+            # Attente d'une place seulement si aucune page de ce document n'est en cours
+            while remaining and len(running) < self.workers and self.slots.acquire(blocking=not running):
+                number, key = remaining.pop(0)
+                try:
+                    future = self._pool().submit(OCREngine.recognize, filepath, number, self.resolution,
+                                                 self.languages)
+                except Exception:
+                    self.slots.release()
+                    raise
+                future.add_done_callback(lambda done: self.slots.release())  # Aussi à l'annulation
+                running[number] = (key, future)
+        
+        def budget_reached():
+            nonlocal collected, position
+            while position < len(order) and order[position] in texts:
+                collected += texts[order[position]] + "\n"
+                position += 1
+            return len(collected) >= self.max_chars
+        
+        try:
+            if not budget_reached():  # Pages en cache suffisantes : aucune page soumise
+                submit_more()
+            while running and not budget_reached():
+                number = min(running)  # Page suivante dans l'ordre du document
+                key, future = running.pop(number)
+                try:
+                    text = future.result()
+                    TextCache.put(f"ocr-{key}", text)
+                except Exception as e:
+                    print(f"Erreur OCR page {number + 1} de {filepath}: {e}")
+                    text = ""
+                texts[number] = text
+                submit_more()
+        finally:
+            for key, future in running.values():
+                if not future.cancel():
+                    # Page déjà en cours de lecture : son texte est conservé pour la prochaine fois
+                    future.add_done_callback(lambda done, key=key: TextCache.put(f"ocr-{key}", done.result())
+                                             if not done.cancelled() and done.exception() is None else None)
+        budget_reached()
+        return collected[:self.max_chars]
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+                self.executor = None
+
+class ExcerptSelector:
+    """Choix local des passages les plus représentatifs d'un document, dans un budget de jetons.
+
+    Chaque phrase est notée par la fréquence de ses mots dans le document (les en-têtes, adresses et
+    mentions légales partagent peu de vocabulaire avec le corps du texte) et par sa densité en mots
+    de la typologie. Les phrases retenues sont rendues dans leur ordre d'origine."""
+    CHARS_PER_TOKEN = 4
+    MIN_SEGMENT_CHARS = 25
+    KEYWORD_WEIGHT = 2.0
+    WORD_RE = re.compile(r"[a-zàâäçéèêëîïôöùûüÿœæ]{3,}")
+    SEGMENT_RE = re.compile(r"(?<=[.!?;:])\s+|\n+")
+    STOPWORDS = {
+        "les", "des", "une", "est", "pour", "par", "dans", "sur", "avec", "que", "qui", "pas", "plus",
+        "sont", "aux", "ces", "cette", "son", "ses", "leur", "leurs", "nous", "vous", "ils", "elle",
+        "été", "être", "avoir", "fait", "tout", "tous", "mais", "ou", "donc", "car", "entre", "sans",
+        "sous", "votre", "vos", "notre", "nos", "the", "and", "for", "with", "this", "that", "from"
+    }
+
+    @staticmethod
+    def estimate_tokens(text):
+        return (len(text) + ExcerptSelector.CHARS_PER_TOKEN - 1) // ExcerptSelector.CHARS_PER_TOKEN
+
+    @staticmethod
+    def words(text):
+        return [w for w in ExcerptSelector.WORD_RE.findall(text.lower()) if w not in ExcerptSelector.STOPWORDS]
+
+    @staticmethod
+    def typology_keywords(typology):
+        """Mots des noms de catégories et de sous-catégories"""
+        keywords = set()
+        for category, subcategories in typology.items():
+            for name in [category] + list(subcategories):
+                keywords.update(ExcerptSelector.words(name.replace("_", " ")))
+        return keywords
+
+    @staticmethod
+    def segments(text):
+        """Phrases ou lignes porteuses de texte, sans doublons ni lignes de chiffres"""
+        result, seen = [], set()
+        for part in ExcerptSelector.SEGMENT_RE.split(text):
+            part = " ".join(part.split())
+            if len(part) < ExcerptSelector.MIN_SEGMENT_CHARS or part.lower() in seen:
+                continue
+            # Numéros, montants, références, tableaux : peu utiles au classement
+            if sum(c.isalpha() for c in part) < 0.6 * len(part):
+                continue
+            seen.add(part.lower())
+            result.append(part)
+        return result
+
+    @staticmethod
+    def select(text, token_budget=300, keywords=()):
+        budget = token_budget * ExcerptSelector.CHARS_PER_TOKEN
+        text = text or ""
+        if len(text) <= budget:
+            return text
+        segments = ExcerptSelector.segments(text)
+        segment_words = [ExcerptSelector.words(segment) for segment in segments]
+        frequency = {}
+        for words in segment_words:
+            for word in words:
+                frequency[word] = frequency.get(word, 0) + 1
+        total = sum(frequency.values())
+        if not total:
+            return text[:budget]
+
+        scored = []
+        for i, words in enumerate(segment_words):
+            if not words:
+                continue
+            centrality = sum(frequency[w] for w in words) / (total * len(words) ** 0.5)
+            density = sum(1 for w in words if w in keywords) / len(words)
+            # Léger avantage au début du document à score égal (objet, titre)
+            position = 0.05 * (1 - i / len(segments))
+            scored.append((centrality * len(frequency) + ExcerptSelector.KEYWORD_WEIGHT * density + position, i))
+
+        chosen, used = [], 0
+        for _, i in sorted(scored, reverse=True):
+            length = len(segments[i]) + 1
+            if used + length > budget:
+                continue
+            chosen.append(i)
+            used += length
+        if not chosen:
+            return text[:budget]
+        return "\n".join(segments[i] for i in sorted(chosen))
+
+class OOXMLExtractor:
+    """Extraction de texte légère des documents Office : lecture en flux des seules parties XML
+    utiles du conteneur zip (sans modèle objet complet), arrêt dès que le contenu suffit"""
+    @staticmethod
+    def _local(tag):
+        return tag.rsplit("}", 1)[-1]
+
+    @staticmethod
+    def _part_targets(archive, part, relations_part):
+        """Parties référencées par 'part' dans l'ordre du document (feuilles, diapositives)"""
+        base = posixpath.dirname(part)
+        targets = {}
+        with archive.open(relations_part) as f:
+            for _, elem in ET.iterparse(f):
+                if OOXMLExtractor._local(elem.tag) == "Relationship":
+                    target = elem.get("Target", "")
+                    targets[elem.get("Id")] = target.lstrip("/") if target.startswith("/") \
+                        else posixpath.normpath(posixpath.join(base, target))
+        ordered = []
+        with archive.open(part) as f:
+            for _, elem in ET.iterparse(f):
+                if OOXMLExtractor._local(elem.tag) in ("sheet", "sldId"):
+                    rel_id = next((v for k, v in elem.attrib.items() if OOXMLExtractor._local(k) == "id"
+                                   and k.startswith("{")), None)
+                    if rel_id in targets:
+                        ordered.append(targets[rel_id])
+        return ordered
+
+    @staticmethod
+    def _paragraphs(stream, paragraph_tag, text_tag, max_chars):
+        """Texte des paragraphes d'une partie XML, interrompu au-delà de 'max_chars'"""
+        lines = []
+        total = 0
+        for _, elem in ET.iterparse(stream):
+            if OOXMLExtractor._local(elem.tag) != paragraph_tag:
+                continue
+            line = "".join(node.text or "" for node in elem.iter() if OOXMLExtractor._local(node.tag) == text_tag)
+            elem.clear()
+            lines.append(line)
+            total += len(line) + 1
+            if total >= max_chars:
+                break
+        return lines
+
+    @staticmethod
+    def extract_docx(filepath, max_chars=50000):
+        with zipfile.ZipFile(filepath) as archive:
+            with archive.open("word/document.xml") as f:
+                return "\n".join(OOXMLExtractor._paragraphs(f, "p", "t", max_chars))
+
+    @staticmethod
+    def extract_pptx(filepath, max_slides=5, max_chars=50000):
+        text = ""
+        with zipfile.ZipFile(filepath) as archive:
+            slides = OOXMLExtractor._part_targets(archive, "ppt/presentation.xml",
+                                                  "ppt/_rels/presentation.xml.rels")
+            for slide in slides[:max_slides]:
+                with archive.open(slide) as f:
+                    for line in OOXMLExtractor._paragraphs(f, "p", "t", max_chars - len(text)):
+                        text += line + "\n"
+                if len(text) >= max_chars:
+                    break
+        return text
+
+    @staticmethod
+    def extract_xlsx(filepath, max_sheets=2, max_rows=20):
+        with zipfile.ZipFile(filepath) as archive:
+            sheets = OOXMLExtractor._part_targets(archive, "xl/workbook.xml", "xl/_rels/workbook.xml.rels")
+            rows = []
+            for sheet in sheets[:max_sheets]:
+                with archive.open(sheet) as f:
+                    for _, elem in ET.iterparse(f):
+                        if OOXMLExtractor._local(elem.tag) != "row":
+                            continue
+                        if int(elem.get("r", len(rows) + 1)) > max_rows:
+                            break  # Seules les premières lignes servent au contexte
+                        cells = []
+                        for cell in elem:
+                            if OOXMLExtractor._local(cell.tag) != "c":
+                                continue
+                            cell_type = cell.get("t", "n")
+                            if cell_type == "inlineStr":
+                                value = "".join(n.text or "" for n in cell.iter() if OOXMLExtractor._local(n.tag) == "t")
+                            else:
+                                value = next((n.text for n in cell if OOXMLExtractor._local(n.tag) == "v"), None)
+                            if value:
+                                cells.append((cell_type, value))
+                        elem.clear()
+                        rows.append(cells)
+            
+            # Chaînes partagées lues seulement jusqu'au dernier indice utilisé
+            wanted = {int(v) for cells in rows for t, v in cells if t == "s"}
+            shared = {}
+            if wanted and "xl/sharedStrings.xml" in archive.namelist():
+                last = max(wanted)
+                with archive.open("xl/sharedStrings.xml") as f:
+                    position = 0
+                    for _, elem in ET.iterparse(f):
+                        if OOXMLExtractor._local(elem.tag) != "si":
+                            continue
+                        if position in wanted:
+                            shared[position] = "".join(n.text or "" for n in elem.iter()
+                                                       if OOXMLExtractor._local(n.tag) == "t")
+                        elem.clear()
+                        if position >= last:
+                            break
+                        position += 1
+        
+        text = ""
+        for cells in rows:
+            values = [OOXMLExtractor._cell_text(t, v, shared) for t, v in cells]
+            text += " ".join(value for value in values if value) + "\n"
+        return text
+
+    @staticmethod
+    def _cell_text(cell_type, value, shared):
+        """Texte d'une cellule tel que le donne le repli openpyxl (str de la valeur ; zéro et FAUX omis)"""
+        if cell_type == "s":
+            return shared.get(int(value), "")
+        if cell_type == "b":
+            return "True" if value == "1" else ""
+        if cell_type == "n":
+            number = float(value) if any(c in value for c in ".eE") else int(value)
+            return str(number) if number else ""
+        return value
+
+class CircuitBreaker:
+    """Coupe-circuit d'un service distant : après 'failures' échecs consécutifs, les appels sont
+    refusés immédiatement ; un seul appel d'essai est autorisé toutes les 'probe_s' secondes"""
+    def __init__(self, failures=3, probe_s=60):
+        self.failures = max(1, failures)
+        self.probe_s = probe_s
+        self.errors = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.probing else "open"
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.probe_s:
+                return False
+            self.probing = True  # Appel d'essai : les autres restent refusés jusqu'à sa réponse
+            return True
+
+    def record(self, ok):
+        with self.lock:
+            self.probing = False
+            if ok:
+                if self.opened_at is not None:
+                    print("API de nouveau disponible")
+                self.errors = 0
+                self.opened_at = None
+                return
+            self.errors += 1
+            if self.opened_at is not None or self.errors >= self.failures:
+                if self.opened_at is None:
+                    print(f"API suspendue après {self.errors} échecs consécutifs")
+                self.opened_at = time.monotonic()
+
+class ClassificationEngine:
+    """Moteur de classification IA DeepSeek avec création automatique de catégories"""
+    def __init__(self):
+        self.config = ConfigManager.load_config()
+        self.typology = self.config.get("typology", {})
+        self.api_available = self.config.get("api_active", True) and API_KEY and API_KEY != "TA_CLE_API_ICI"
+        self.auto_create_categories = self.config.get("auto_create_categories", True)
+        self.cassette = ApiCassette.from_config(self.config)
+        self.typology_lock = threading.Lock()
+        self.deferred_mode = self.config.get("api_deferred_mode", "auto")
+        self.breaker = CircuitBreaker(self.config.get("api_breaker_failures", 3),
+                                      self.config.get("api_breaker_probe_s", 60))
+        self.api_state = threading.local()  # Échec du dernier appel, propre à chaque thread
+        self.ocr = OCREngine(self.config)
+
+    def reload_typology(self):
+        """Recharge la typologie depuis le fichier de configuration"""
+        self.config = ConfigManager.load_config()
+        self.typology = self.config.get("typology", {})
+        self.auto_create_categories = self.config.get("auto_create_categories", True)
+        self.deferred_mode = self.config.get("api_deferred_mode", "auto")
+        if self.config.get("api_cassette_mode", "off") != self.cassette.mode:
+            self.cassette = ApiCassette.from_config(self.config)
+        return self.typology
+
+    def extract_text_from_pdf(self, filepath):
+        """Extrait le texte d'un PDF"""
+        text = ""
+        try:
+            with pdfplumber.open(filepath) as pdf:
+                for page in pdf.pages[:50]:  # Limité à 50 pages pour performance
+                    extracted = page.extract_text()
+                    if extracted:
+                        text += extracted + "\n"
+        except Exception as e:
+            print(f"Erreur extraction PDF {filepath}: {e}")
+        return text
+
+    def analyze_filename(self, filename):
+        """Analyse le nom de fichier pour déterminer la catégorie"""
+        filename_lower = filename.lower()
+        
+        # Règles de classification basées sur le nom
+        rules = {
+            "JURIDIQUE": ["bail", "acte", "contrat", "legal", "juridique"],
+            "TECHNIQUE": ["diagnostic", "technique", "plan", "devis", "video", "photo"],
+            "COMPTABILITE": ["facture", "compte", "bancaire", "impôt", "fiscal"],
+            "ADMINISTRATIF": ["assurance", "courrier", "identite", "administratif"]
+        }
+        
+        for category, keywords in rules.items():
+            if any(keyword in filename_lower for keyword in keywords):
+                return category
+        
+        return None  # Retourne None si aucune catégorie ne correspond
+    
+    def extract_text(self, filepath):
+        """Extrait le texte de différents types de fichiers"""
+        ext = os.path.splitext(filepath)[1].lower()
+        size = os.path.getsize(filepath) if os.path.exists(filepath) else 0
+        with metrics.stage("extraction", size) as stage:
+            text = self._extract_text_by_type(filepath, ext) if ext not in IMAGE_EXTENSIONS else ""
+            if not text:
+                stage["outcome"] = "empty"
+        if self.ocr.needed(filepath, text):
+            with metrics.stage("ocr", size) as stage:
+                text = self.ocr.extract(filepath) or text
+                if not text.strip():
+                    stage["outcome"] = "empty"
+        return text
+
+    def _extract_text_by_type(self, filepath, ext):
+        if ext in (".docx", ".xlsx", ".pptx") and self.config.get("ooxml_fast_extraction", True):
+            try:
+                max_chars = self.config.get("ooxml_max_chars", 50000)
+                if ext == ".docx":
+                    return OOXMLExtractor.extract_docx(filepath, max_chars)
+                if ext == ".xlsx":
+                    return OOXMLExtractor.extract_xlsx(filepath)
+                return OOXMLExtractor.extract_pptx(filepath, max_chars=max_chars)
+            except Exception as e:
+                # Conteneur inhabituel : repli sur les bibliothèques complètes
+                print(f"Extraction rapide impossible sur {ext}, repli: {e}")
+        return self._extract_text_with_libraries(filepath, ext)
+
+    def _extract_text_with_libraries(self, filepath, ext):
+        text = ""
+        try:
+            if ext == ".pdf":
+                text = self.extract_text_from_pdf(filepath)
+            elif ext == ".docx":
+                doc = docx.Document(filepath)
+                text = "\n".join([para.text for para in doc.paragraphs])
+            elif ext == ".xlsx":
+                wb = openpyxl.load_workbook(filepath, read_only=True)
+                # On lit les premières lignes de chaque feuille pour le contexte
+                for sheet in wb.worksheets[:2]:
+                    for row in sheet.iter_rows(max_row=20, values_only=True):
+                        text += " ".join([str(cell) for cell in row if cell]) + "\n"
+            elif ext == ".pptx":
+                prs = Presentation(filepath)
+                for slide in prs.slides[:5]:
+                    for shape in slide.shapes:
+                        if hasattr(shape, "text"):
+                            text += shape.text + "\n"
+        except Exception as e:
+            print(f"Erreur d'extraction sur {ext}: {e}")
+        return text
+    
+    def call_deepseek_api(self, prompt_text):
+        """Appelle l'API DeepSeek pour classification (avec enregistrement / relecture optionnels)"""
+        payload = {
+            "model": "deepseek-chat",
+            "messages": [
+                {"role": "system", "content": "Tu es un assistant spécialisé dans la classification et l'indexation documentaires."},
+                {"role": "user", "content": prompt_text}
+            ],
+            "temperature": 0.1,
+            "max_tokens": 500
+        }
+        mode = self.cassette.mode
+        self.api_state.failed = False
+        
+        with metrics.stage("api", len(prompt_text.encode("utf-8"))) as stage:
+            if mode in ("replay", "auto"):
+                result = self.cassette.replay(payload)
+                if result is not None:
+                    stage["outcome"] = "replay"
+                    return result
+                if mode == "replay":
+                    # Relecture stricte : aucun accès réseau
+                    stage["outcome"] = "replay_miss"
+                    print("Cassette API: requête absente de l'enregistrement")
+                    return None
+            
+            if not self.breaker.allow():
+                # API en échec : refus immédiat plutôt qu'une attente du délai réseau par fichier
+                stage["outcome"] = "circuit_open"
+                self.api_state.failed = True
+                return None
+            
+            start = time.perf_counter()
+            result = self._post_deepseek(payload)
+            self.breaker.record(result is not None)
+            if result is None:
+                stage["outcome"] = "error"
+                self.api_state.failed = True
+            elif mode in ("record", "auto"):
+                self.cassette.record(payload, result, time.perf_counter() - start)
+        return result
+
+    def _post_deepseek(self, payload):
+        try:
+            headers = {
+                "Authorization": f"Bearer {API_KEY}",
+                "Content-Type": "application/json"
+            }
+            
+            response = requests.post(DEEPSEEK_API_URL, headers=headers, json=payload,
+                                     timeout=self.config.get("api_timeout_s", 30))
+            response.raise_for_status()
+            return response.json()["choices"][0]["message"]["content"]
+            
+        except Exception as e:
+            print(f"Erreur API DeepSeek: {e}")
+            return None
+
+    def build_excerpt(self, content_text):
+        """Extrait du document envoyé à l'IA"""
+        if self.config.get("excerpt_mode", "salience") != "salience":
+            return content_text[:1500]
+        keywords = ExcerptSelector.typology_keywords(self.typology)
+        return ExcerptSelector.select(content_text, self.config.get("excerpt_token_budget", 300), keywords)
+
+    def suggest_new_category(self, content_text, filename):
+        """Demande à l'IA de suggérer une nouvelle catégorie et sous-catégorie"""
+        try:
+            prompt = f"""
+            Analyse ce document pour créer une classification pertinente :
+            
+            Nom du fichier: {filename}
+            
             Contenu (extrait):
-            --- {content_text[:1500]} ---
+            --- {self.build_excerpt(content_text)} ---
             
             Tu es un expert en gestion documentaire et en classification documentaire.
             
@@ -281,7 +2521,19 @@ class ClassificationEngine:
         
         return None
 
-    def auto_classify_with_creation(self, content_text, filename, existing_typology):
+    def provisional_classification(self, content_text, filename, existing_typology):
+        """Classement par les règles locales en attendant la réponse de l'IA"""
+        category = self.analyze_filename(filename) or "GENERAL"
+        suggested_sub = self.suggest_subcategory_from_content(content_text.lower(), category, existing_typology)
+        return {
+            "category": category,
+            "subcategory": suggested_sub or "Divers",
+            "created_new": False,
+            "provisional": True,
+            "reason": "Classement provisoire, IA en attente"
+        }
+
+    def auto_classify_with_creation(self, content_text, filename, existing_typology, defer=True):
         """Classification avec création automatique de catégories"""
         # Essaie d'abord de trouver une catégorie existante
         filename_category = self.analyze_filename(filename)
@@ -299,7 +2551,12 @@ class ClassificationEngine:
         
         # Si aucune catégorie existante ne correspond, crée une nouvelle
         if self.auto_create_categories:
+            if defer and self.deferred_mode == "always":
+                return self.provisional_classification(content_text, filename, existing_typology)
             ai_suggestion = self.suggest_new_category(content_text, filename)
+            if ai_suggestion is None and self.deferred_mode != "off" and getattr(self.api_state, "failed", False):
+                # API lente ou indisponible : archivage immédiat, classification IA reprise plus tard
+                return self.provisional_classification(content_text, filename, existing_typology)
             
             if ai_suggestion:
                 new_category = ai_suggestion.get("category", "AUTRE")
@@ -324,126 +2581,2683 @@ class ClassificationEngine:
             "reason": "Catégorie par défaut"
         }
 
-    def suggest_subcategory_from_content(self, content_text, category, existing_typology):
-        """Suggère une sous-catégorie basée sur le contenu"""
-        if not content_text or len(content_text) < 50:
-            return None
+    def suggest_subcategory_from_content(self, content_text, category, existing_typology):
+        """Suggère une sous-catégorie basée sur le contenu"""
+        if not content_text or len(content_text) < 50:
+            return None
+        
+        # Règles de sous-catégories par catégorie
+        rules = {
+            "JURIDIQUE": {
+                "bail": "Baux",
+                "contrat": "Contrats",
+                "acte": "Actes",
+                "procès": "Contentieux",
+                "tribunal": "Contentieux"
+            },
+            "TECHNIQUE": {
+                "diagnostic": "Diagnostics",
+                "devis": "Devis",
+                "plan": "Plans",
+                "photo": "Photos",
+                "video": "Vidéos",
+                "visite": "Visites"
+            },
+            "COMPTABILITE": {
+                "facture": "Factures",
+                "relevé": "Relevés",
+                "impôt": "Impôts",
+                "taxe": "Impôts",
+                "bancaire": "Relevés_Bancaires"
+            },
+            "ADMINISTRATIF": {
+                "assurance": "Assurances",
+                "courrier": "Courriers",
+                "identité": "Identité",
+                "permis": "Permis",
+                "autorisation": "Autorisations"
+            }
+        }
+        
+        if category in rules:
+            for keyword, subcategory in rules[category].items():
+                if keyword in content_text:
+                    return subcategory
+        
+        return None
+
+    def analyze_document(self, filepath, content_text=None, cache_key=None, defer=True, persist=True):
+        """Analyse un document et retourne sa classification avec création automatique de catégories si besoin
+        (texte fourni ou lu dans le cache du texte extrait si 'cache_key' est donné ; 'defer' autorise le
+        classement provisoire sans appel à l'IA en mode 'always' ; sans 'persist', simulation : la typologie
+        n'est pas modifiée, la création n'est que signalée par 'created_new')"""
+        filename = os.path.basename(filepath)
+        
+        # Classification initiale par nom de fichier
+        predicted_category = self.analyze_filename(filename)
+        predicted_sub = "Divers"
+        created_new = False
+        reason = ""
+        method = "nommage"
+        
+        # Extraction du contenu pour analyse approfondie
+        supported_ext = ('.pdf', '.docx', '.xlsx', '.pptx') + (IMAGE_EXTENSIONS if self.ocr.enabled else ())
+        use_cache = cache_key is not None and self.config.get("text_cache", True)
+        if content_text is None and use_cache:
+            content_text = TextCache.get(cache_key)
+            if content_text is not None and self.ocr.needed(filepath, content_text):
+                content_text = None  # Texte mis en cache avant l'activation de l'OCR
+        if content_text is None:
+            content_text = ""
+            if filepath.lower().endswith(supported_ext):
+                content_text = self.extract_text(filepath)
+                if use_cache:
+                    TextCache.put(cache_key, content_text)
+        
+        # Si l'API est disponible et nous avons du contenu
+        if self.api_available and len(content_text) > 10:
+            try:
+                # Classification intelligente avec création automatique
+                classification_result = self.auto_classify_with_creation(
+                    content_text, 
+                    filename, 
+                    self.typology,
+                    defer
+                )
+                
+                predicted_category = classification_result["category"]
+                predicted_sub = classification_result["subcategory"]
+                created_new = classification_result.get("created_new", False)
+                reason = classification_result.get("reason", "")
+                method = "provisoire" if classification_result.get("provisional") else "ia"
+                
+                # Simulation (plan de classement) : la création n'est que signalée
+                if persist:
+                    with self.typology_lock:  # Lots parallèles : une seule mise à jour à la fois
+                        # Si une nouvelle catégorie a été créée, l'ajouter à la typologie
+                        if created_new and predicted_category not in self.typology:
+                            self.typology[predicted_category] = [predicted_sub]
+                            # Sauvegarder automatiquement la nouvelle typologie
+                            self.config["typology"] = self.typology
+                            ConfigManager.save_config(self.config)
+                            print(f"Nouvelle catégorie créée: {predicted_category} > {predicted_sub}")
+                    
+                        # Si la catégorie existe mais pas la sous-catégorie, l'ajouter
+                        elif predicted_category in self.typology and predicted_sub not in self.typology[predicted_category]:
+                            self.typology[predicted_category].append(predicted_sub)
+                            self.config["typology"] = self.typology
+                            ConfigManager.save_config(self.config)
+                            print(f"Nouvelle sous-catégorie ajoutée: {predicted_category} > {predicted_sub}")
+                    
+            except Exception as e:
+                print(f"Erreur analyse IA avec création: {e}")
+                # Fallback sur la classification par nom
+                if not predicted_category:
+                    predicted_category = "GENERAL"
+        
+        # Si pas d'analyse IA possible, utiliser la classification par nom
+        elif not predicted_category:
+            predicted_category = "GENERAL"
+        
+        # Nommage standardisé
+        doc_date = datetime.now().strftime("%Y%m%d")
+        clean_filename = filename.replace(" ", "_").replace("(", "").replace(")", "")
+        
+        # Ajouter un marqueur si nouvelle catégorie créée
+        status_prefix = "🌟 NOUVELLE " if created_new else ""
+        
+        new_name = f"{doc_date}_{predicted_category}_{predicted_sub}_{clean_filename}"
+        if method == "provisoire":
+            status = "⏳ Classement provisoire (IA en attente)"
+        else:
+            status = f"{status_prefix}Classé par IA" if self.api_available else "Classé par nommage"
+        
+        return {
+            "original_path": filepath,
+            "filename": filename,
+            "category": predicted_category,
+            "subcategory": predicted_sub,
+            "new_name": new_name,
+            "status": status,
+            "created_new": created_new,
+            "reason": reason,
+            "method": method
+        }
+
+class JobManifest:
+    """Manifeste de lot persistant : étape atteinte et résultats intermédiaires de chaque fichier"""
+    STAGES = ["pending", "hashed", "classified", "copied", "verified", "tagged", "done"]
+    FINAL_STAGES = ("done", "duplicate")
+
+    def __init__(self, data, path, checkpoint_interval=2.0):
+        self.data = data
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # Une seule écriture du manifeste à la fois
+        self._last_save = 0.0
+
+    @staticmethod
+    def create(file_list, dest_dir, delete_source=False, checkpoint_interval=2.0):
+        job_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        data = {
+            "job_id": job_id,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "updated": None,
+            "status": "running",
+            "dest_dir": dest_dir,
+            "delete_source": delete_source,
+            "summary": {},
+            "files": {}
+        }
+        job = JobManifest(data, os.path.join(JOBS_DIR, f"{job_id}.json"), checkpoint_interval)
+        job.add_files(file_list)
+        job.save()
+        return job
+
+    @staticmethod
+    def load(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return JobManifest(json.load(f), path)
+        except Exception as e:
+            print(f"Erreur chargement lot {path}: {e}")
+            return None
+
+    @staticmethod
+    def list_jobs():
+        """Tous les lots connus, du plus récent au plus ancien"""
+        if not os.path.isdir(JOBS_DIR):
+            return []
+        jobs = [JobManifest.load(os.path.join(JOBS_DIR, name))
+                for name in sorted(os.listdir(JOBS_DIR), reverse=True) if name.endswith(".json")]
+        return [job for job in jobs if job is not None]
+
+    @staticmethod
+    def reached(state, stage):
+        """Vrai si l'état d'un fichier a déjà franchi l'étape donnée"""
+        current = state.get("stage", "pending")
+        if current in JobManifest.FINAL_STAGES:
+            return True
+        return JobManifest.STAGES.index(current) >= JobManifest.STAGES.index(stage)
+
+    @property
+    def job_id(self):
+        return self.data["job_id"]
+
+    @property
+    def files(self):
+        return self.data["files"]
+
+    @property
+    def dest_dir(self):
+        return self.data["dest_dir"]
+
+    @property
+    def delete_source(self):
+        return self.data.get("delete_source", False)
+
+    @property
+    def status(self):
+        return self.data.get("status", "running")
+
+    def add_files(self, file_list):
+        with self.lock:
+            for filepath in file_list:
+                self.data["files"].setdefault(filepath, {"stage": "pending"})
+
+    def entry(self, filepath):
+        with self.lock:
+            return self.data["files"].setdefault(filepath, {"stage": "pending"})
+
+    def progress(self):
+        """Nombre de fichiers par étape (+ erreurs)"""
+        counts = {"total": 0, "errors": 0}
+        with self.lock:
+            for state in self.data["files"].values():
+                counts["total"] += 1
+                counts[state["stage"]] = counts.get(state["stage"], 0) + 1
+                if state.get("error"):
+                    counts["errors"] += 1
+        return counts
+
+    def save(self):
+        """Écriture atomique du manifeste"""
+        with self.save_lock:
+            self._write()
+
+    def _write(self):
+        with self.lock:
+            self.data["updated"] = datetime.now().isoformat(timespec="seconds")
+            # Copie de l'état de chaque fichier : les traitements parallèles continuent pendant l'écriture
+            data = dict(self.data, files={path: dict(state) for path, state in self.data["files"].items()})
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._last_save = time.monotonic()
+        except Exception as e:
+            print(f"Erreur sauvegarde lot {self.job_id}: {e}")
+
+    def checkpoint(self):
+        """Sauvegarde périodique pendant le traitement (ignorée si un autre thread sauvegarde déjà)"""
+        if time.monotonic() - self._last_save < self.checkpoint_interval:
+            return
+        if self.save_lock.acquire(blocking=False):
+            try:
+                self._write()
+            finally:
+                self.save_lock.release()
+
+    def finish(self, summary):
+        self.data["summary"] = {k: v for k, v in summary.items() if k != "new_categories"}
+        self.data["status"] = "failed" if summary.get("errors") else "completed"
+        self.save()
+
+    def delete(self):
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            print(f"Erreur suppression lot {self.job_id}: {e}")
+
+class FolderScanner:
+    """Parcours de dossier en flux (os.scandir) : les fichiers sont traités dès leur découverte"""
+    _END = object()
+
+    def __init__(self, extensions=SUPPORTED_EXTENSIONS, skip_patterns=None, skip_paths=None, queue_size=10000):
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.skip_patterns = skip_patterns or []
+        self.skip_paths = {os.path.normcase(os.path.abspath(p)) for p in (skip_paths or [])}
+        self.queue_size = queue_size
+        self.discovered = 0
+        self.finished = False
+        self.cancelled = threading.Event()
+
+    def _skip_dir(self, entry):
+        if any(fnmatch.fnmatch(entry.name, pattern) for pattern in self.skip_patterns):
+            return True
+        return os.path.normcase(os.path.abspath(entry.path)) in self.skip_paths
+
+    def scan(self, root):
+        """Générateur de (chemin, taille, mtime) réutilisant les données stat des DirEntry"""
+        stack = [root]
+        while stack and not self.cancelled.is_set():
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    subdirs = []
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not self._skip_dir(entry):
+                                    subdirs.append(entry.path)
+                            elif entry.name.lower().endswith(self.extensions) and entry.is_file():
+                                stat = entry.stat()
+                                self.discovered += 1
+                                yield entry.path, stat.st_size, stat.st_mtime
+                        except OSError as e:
+                            print(f"Erreur lecture {entry.path}: {e}")
+                    # Ordre alphabétique conservé à la sortie de la pile
+                    stack.extend(sorted(subdirs, reverse=True))
+            except OSError as e:
+                print(f"Erreur parcours {directory}: {e}")
+
+    def stream(self, root):
+        """Parcourt 'root' dans un thread producteur et renvoie un itérateur de chemins (file bornée)"""
+        candidates = queue.Queue(maxsize=self.queue_size)
+        
+        def producer():
+            try:
+                for filepath, _, _ in self.scan(root):
+                    candidates.put(filepath)
+            finally:
+                self.finished = True
+                candidates.put(self._END)
+        
+        threading.Thread(target=producer, daemon=True).start()
+        return iter(candidates.get, self._END)
+
+class DuplicateScanJob:
+    """Recherche de doublons en arrière-plan : hachage parallèle borné, pause / annulation, rapport complet"""
+    def __init__(self, root, workers=4, visual_mode=False, threshold=6, skip_patterns=None, hasher=None):
+        self.root = root
+        self.hasher = hasher or ContentHasher({})
+        self.workers = max(1, workers)
+        self.visual_mode = visual_mode
+        self.threshold = threshold
+        self.skip_patterns = skip_patterns or []
+        self.running = threading.Event()
+        self.running.set()
+        self.cancelled = threading.Event()
+        self.events = queue.Queue()  # Progression et résultats partiels pour l'interface
+        self.groups = {}  # empreinte -> {"size", "paths"}
+        self.candidates = {}  # empreinte xxh3 -> {"size", "paths", "algo"} : à confirmer en SHA-256
+        self.visual_duplicates = []
+        self.progress = {"discovered": 0, "to_hash": 0, "hashed": 0, "bytes_hashed": 0, "phase": "scan"}
+        self.finished = False
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.running.set()
+
+    def _hash_one(self, filepath, size, want_image_hash):
+        self.running.wait()
+        if self.cancelled.is_set():
+            return filepath, size, None, None, None
+        file_hash, algorithm = self.hasher.hash_file(filepath, size)
+        image_hashes = PerceptualHashManager.compute_hashes(filepath) if want_image_hash else None
+        return filepath, size, file_hash, algorithm, image_hashes
+
+    def _confirm_one(self, filepath, algorithm):
+        self.running.wait()
+        if self.cancelled.is_set():
+            return filepath, None
+        return filepath, self.hasher.key_for(filepath, self.hasher.confirmation_algorithm(algorithm))
+
+    def _add_duplicate(self, file_hash, filepath, size):
+        group = self.groups.setdefault(file_hash, {"size": size, "paths": []})
+        group["paths"].append(filepath)
+        if len(group["paths"]) > 1:
+            self.events.put(("duplicate", (filepath, group["paths"][0], size)))
+        return len(group["paths"]) > 1
+
+    def _confirm(self, executor):
+        """Préfiltre xxh3 : seuls les fichiers d'un même groupe sont relus en SHA-256"""
+        self.progress["phase"] = "confirm"
+        self.events.put(("progress", dict(self.progress)))
+        futures = []
+        for file_hash, group in self.candidates.items():
+            if len(group["paths"]) < 2:
+                self.groups.setdefault(file_hash, {"size": group["size"], "paths": list(group["paths"])})
+                continue
+            futures.extend(executor.submit(self._confirm_one, path, group["algo"]) for path in group["paths"])
+        sizes = {path: group["size"] for group in self.candidates.values() for path in group["paths"]}
+        for future in futures:
+            filepath, confirmed = future.result()
+            if confirmed is not None:
+                self._add_duplicate(confirmed, filepath, sizes[filepath])
+
+    def run(self):
+        """Parcours, préfiltre par taille puis hachage parallèle des seuls candidats"""
+        scanner = FolderScanner(extensions=("",), skip_patterns=self.skip_patterns)
+        scanner.cancelled = self.cancelled
+        by_size = {}
+        images = []
+        for filepath, size, _ in scanner.scan(self.root):
+            by_size.setdefault(size, []).append(filepath)
+            if self.visual_mode and filepath.lower().endswith(IMAGE_EXTENSIONS):
+                images.append((filepath, size))
+            self.progress["discovered"] += 1
+            if self.progress["discovered"] % 500 == 0:
+                self.events.put(("progress", dict(self.progress)))
+        
+        # Une taille unique ne peut pas être un doublon binaire : inutile de lire le fichier
+        image_set = {path for path, _ in images}
+        tasks = [(path, size) for size, paths in by_size.items() if len(paths) > 1 for path in paths]
+        queued = {path for path, _ in tasks}
+        tasks += [(path, size) for path, size in images if path not in queued]
+        self.progress.update(to_hash=len(tasks), phase="hash")
+        self.events.put(("progress", dict(self.progress)))
+        
+        image_tree = BKTree()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = set()
+            task_iter = iter(tasks)
+            while True:
+                # File d'attente bornée : pas plus de 4 tâches en vol par thread
+                while len(pending) < self.workers * 4 and not self.cancelled.is_set():
+                    task = next(task_iter, None)
+                    if task is None:
+                        break
+                    path, size = task
+                    pending.add(executor.submit(self._hash_one, path, size,
+                                                self.visual_mode and path in image_set))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    filepath, size, file_hash, algorithm, image_hashes = future.result()
+                    if file_hash is None:
+                        continue
+                    self.progress["hashed"] += 1
+                    self.progress["bytes_hashed"] += size
+                    if algorithm.startswith("xxh3"):
+                        # Collision possible du préfiltre : doublon signalé après confirmation
+                        group = self.candidates.setdefault(file_hash, {"size": size, "paths": [], "algo": algorithm})
+                        group["paths"].append(filepath)
+                        is_duplicate = len(group["paths"]) > 1
+                    else:
+                        is_duplicate = self._add_duplicate(file_hash, filepath, size)
+                    if not is_duplicate and image_hashes:
+                        matches = image_tree.search(image_hashes["phash"], self.threshold)
+                        if matches:
+                            visual = (filepath, matches[0][1], matches[0][0])
+                            self.visual_duplicates.append(visual)
+                            self.events.put(("visual", visual))
+                        else:
+                            image_tree.add(image_hashes["phash"], filepath)
+                self.events.put(("progress", dict(self.progress)))
+            if self.candidates and not self.cancelled.is_set():
+                self._confirm(executor)
+        
+        self.progress["phase"] = "cancelled" if self.cancelled.is_set() else "done"
+        self.finished = True
+        self.events.put(("done", self.summary()))
+
+    def duplicate_groups(self):
+        return {h: g for h, g in self.groups.items() if len(g["paths"]) > 1}
+
+    def summary(self):
+        groups = self.duplicate_groups()
+        return {
+            "groups": len(groups),
+            "duplicates": sum(len(g["paths"]) - 1 for g in groups.values()),
+            "reclaimable_bytes": sum(g["size"] * (len(g["paths"]) - 1) for g in groups.values()),
+            "visual_duplicates": len(self.visual_duplicates),
+            "files_scanned": self.progress["discovered"],
+            "files_hashed": self.progress["hashed"],
+            "status": self.progress["phase"]
+        }
+
+    def export(self, path):
+        """Exporte le rapport complet (CSV ou JSON selon l'extension)"""
+        groups = self.duplicate_groups()
+        if path.lower().endswith(".json"):
+            report = {
+                "root": self.root,
+                "summary": self.summary(),
+                "groups": [{"hash": h, "size": g["size"], "keep": g["paths"][0], "duplicates": g["paths"][1:]}
+                           for h, g in groups.items()],
+                "visual_duplicates": [{"file": f, "similar_to": o, "distance": d}
+                                      for f, o, d in self.visual_duplicates]
+            }
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=4, ensure_ascii=False)
+            return
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(["groupe", "type", "empreinte", "taille", "chemin", "conserver", "octets_recuperables"])
+            for number, (file_hash, group) in enumerate(groups.items(), start=1):
+                for position, filepath in enumerate(group["paths"]):
+                    writer.writerow([number, "binaire", file_hash, group["size"], filepath,
+                                     "oui" if position == 0 else "non", 0 if position == 0 else group["size"]])
+            for number, (filepath, original, distance) in enumerate(self.visual_duplicates, start=len(groups) + 1):
+                writer.writerow([number, f"visuel (distance {distance})", "", "", original, "oui", 0])
+                writer.writerow([number, f"visuel (distance {distance})", "", os.path.getsize(filepath)
+                                 if os.path.exists(filepath) else "", filepath, "non", ""])
+
+# ==================== PIPELINE D'INGESTION ====================
+class ClassificationPlan:
+    """Plan de classement simulé : destination prévue de chaque fichier, relu en bloc puis exécuté"""
+    COLUMNS = ["source", "size", "hash", "algo", "status", "category", "subcategory", "new_name",
+               "dest_path", "method", "created_new", "reason", "duplicate_of", "image_hashes"]
+
+    def __init__(self, dest_dir, rows=None):
+        self.dest_dir = dest_dir
+        self.rows = rows or []
+
+    def save(self, path):
+        """Écrit le plan en CSV (';') ou en Parquet (pandas) selon l'extension"""
+        rows = [dict(row, dest_dir=self.dest_dir) for row in self.rows]
+        columns = self.COLUMNS + ["dest_dir"]
+        if path.lower().endswith(".parquet"):
+            if pd is None:
+                raise ValueError("Module pandas non installé (pip install pandas pyarrow)")
+            pd.DataFrame.from_records(rows, columns=columns).to_parquet(path, index=False)
+            return
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns, delimiter=";", extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+
+    @staticmethod
+    def load(path):
+        if path.lower().endswith(".parquet"):
+            if pd is None:
+                raise ValueError("Module pandas non installé (pip install pandas pyarrow)")
+            frame = pd.read_parquet(path)
+            rows = frame.astype(object).where(frame.notna(), None).to_dict("records")
+        else:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                rows = list(csv.DictReader(f, delimiter=";"))
+        for row in rows:
+            row["size"] = int(row["size"]) if row.get("size") not in (None, "") else 0
+            row["created_new"] = str(row.get("created_new")) == "True"
+        dest_dir = rows[0]["dest_dir"] if rows else ""
+        return ClassificationPlan(dest_dir, rows)
+
+    def summary(self):
+        """Nombre de fichiers et volume par catégorie, plus doublons et erreurs"""
+        categories = {}
+        counts = {"new": 0, "duplicate": 0, "error": 0}
+        for row in self.rows:
+            counts[row["status"]] = counts.get(row["status"], 0) + 1
+            if row["status"] == "new":
+                entry = categories.setdefault(row["category"], {"files": 0, "bytes": 0, "subcategories": set(),
+                                                                "created_new": False})
+                entry["files"] += 1
+                entry["bytes"] += row.get("size") or 0
+                entry["subcategories"].add(row["subcategory"])
+                entry["created_new"] = entry["created_new"] or row.get("created_new", False)
+        return {"counts": counts, "categories": dict(sorted(categories.items()))}
+
+    def summary_text(self):
+        summary = self.summary()
+        lines = [f"{summary['counts']['new']} fichier(s) à classer, {summary['counts']['duplicate']} doublon(s), "
+                 f"{summary['counts']['error']} erreur(s)", ""]
+        for category, entry in summary["categories"].items():
+            marker = "🌟 " if entry["created_new"] else ""
+            lines.append(f"{marker}{category}: {entry['files']} fichier(s), {entry['bytes'] / 1024 ** 2:.1f} Mo, "
+                         f"{len(entry['subcategories'])} sous-catégorie(s)")
+        return "\n".join(lines)
+
+class BatchReportWriter:
+    """Rapport de lot en ajout seul (JSONL ou CSV ';') : une ligne par fichier, écrite dès son résultat"""
+    COLUMNS = ["processed_at", "source", "outcome", "filename", "category", "subcategory", "new_name", "path",
+               "method", "hash", "created_new", "reason", "status", "error"]
+    XLSX_MAX_ROWS = 1048575  # Limite d'une feuille Excel (hors en-tête)
+
+    def __init__(self, path):
+        self.path = path
+        self.format = "csv" if path.lower().endswith(".csv") else "jsonl"
+        self.lock = threading.Lock()
+        self.rows = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        header = not os.path.exists(path) or os.path.getsize(path) == 0  # Lot repris : on complète le rapport
+        self.file = open(path, "a", encoding="utf-8", newline="")
+        self.writer = None
+        if self.format == "csv":
+            self.writer = csv.DictWriter(self.file, fieldnames=self.COLUMNS, delimiter=";", extrasaction="ignore")
+            if header:
+                self.writer.writeheader()
+
+    @staticmethod
+    def row_for(filepath, state, result):
+        """Ligne de rapport à partir de l'état du fichier et de son résultat (None en cas d'exception)"""
+        result = result or {}
+        status = result.get("status", "")
+        if not result or "ERREUR" in status:
+            outcome = "error"
+        elif result.get("is_duplicate"):
+            outcome = "duplicate"
+        else:
+            outcome = "archived"
+        return {
+            "processed_at": datetime.now().isoformat(timespec="seconds"),
+            "source": filepath,
+            "outcome": outcome,
+            "filename": result.get("filename", os.path.basename(filepath)),
+            "category": result.get("category", ""),
+            "subcategory": result.get("subcategory", ""),
+            "new_name": result.get("new_name", ""),
+            "path": result.get("path", "") if outcome == "archived" else "",
+            "method": (state.get("classification") or {}).get("method", ""),
+            "hash": state.get("hash") or "",
+            "created_new": bool(result.get("created_new", False)),
+            "reason": result.get("reason", ""),
+            "status": status,
+            "error": state.get("error") or ""
+        }
+
+    def write(self, row):
+        with self.lock:
+            if self.writer is not None:
+                self.writer.writerow(row)
+            else:
+                self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self.file.flush()  # Ligne lisible même si le traitement est interrompu
+            self.rows += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    @staticmethod
+    def read(path):
+        """Lignes d'un rapport, lues en flux"""
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            if path.lower().endswith(".csv"):
+                yield from csv.DictReader(f, delimiter=";")
+            else:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+    @staticmethod
+    def to_xlsx(path, xlsx_path=None):
+        """Convertit un rapport en classeur Excel (openpyxl en écriture seule : mémoire constante)"""
+        xlsx_path = xlsx_path or os.path.splitext(path)[0] + ".xlsx"
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet, rows = None, 0
+        for row in BatchReportWriter.read(path):
+            if sheet is None or rows >= BatchReportWriter.XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet(f"Rapport {len(workbook.worksheets) + 1}")
+                sheet.append(BatchReportWriter.COLUMNS)
+                rows = 0
+            sheet.append([row.get(column, "") for column in BatchReportWriter.COLUMNS])
+            rows += 1
+        if sheet is None:
+            workbook.create_sheet("Rapport 1").append(BatchReportWriter.COLUMNS)
+        workbook.save(xlsx_path)
+        return xlsx_path
+
+class AdaptiveLimit:
+    """Concurrence adaptative (AIMD) : augmentation progressive tant que les latences restent proches
+    de la meilleure observée, division par deux en cas de ralentissement ou d'erreur"""
+    def __init__(self, initial, maximum, minimum=1):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.baseline = None
+        self.lock = threading.Lock()
+
+    @property
+    def current(self):
+        return int(self.limit)
+
+    def observe(self, latency, ok=True):
+        with self.lock:
+            # Référence lentement croissante : un minimum ancien ne bloque pas la file indéfiniment
+            self.baseline = latency if self.baseline is None else min(latency, self.baseline * 1.05)
+            if not ok or latency > 2 * self.baseline:
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+class DeviceIOScheduler:
+    """Accès disque par périphérique (st_dev) : concurrence limitée selon le type de disque
+    (séquentielle pour un disque rotatif ou USB, large pour un SSD) et ordre de lecture par
+    dossier puis inode sur les disques rotatifs"""
+    def __init__(self, config):
+        self.enabled = config.get("io_scheduling", True)
+        self.limits = {"hdd": max(1, config.get("io_hdd_concurrency", 1)),
+                       "ssd": max(1, config.get("io_ssd_concurrency", 8)),
+                       None: max(1, config.get("io_default_concurrency", 4))}
+        self.kinds = {}
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def device_of(path):
+        """Périphérique d'un chemin, ou de son plus proche parent existant (destination à créer)"""
+        while True:
+            try:
+                return os.stat(path).st_dev
+            except OSError:
+                parent = os.path.dirname(path)
+                if not parent or parent == path:
+                    return None
+                path = parent
+
+    @staticmethod
+    def detect_kind(device):
+        """'hdd' (rotatif ou USB), 'ssd', ou None si inconnu (Linux : /sys/dev/block)"""
+        try:
+            base = os.path.realpath(f"/sys/dev/block/{os.major(device)}:{os.minor(device)}")
+        except (AttributeError, TypeError, ValueError):
+            return None  # os.major indisponible (Windows) ou périphérique inconnu
+        if not os.path.exists(base):
+            return None  # Système de fichiers réseau ou virtuel
+        if "/usb" in base:
+            return "hdd"
+        for candidate in (base, os.path.dirname(base)):  # Partition : attributs portés par le disque
+            try:
+                with open(os.path.join(candidate, "queue", "rotational"), "r") as f:
+                    return "hdd" if f.read().strip() == "1" else "ssd"
+            except OSError:
+                continue
+        return None
+
+    def kind(self, device):
+        with self.lock:
+            if device not in self.kinds:
+                self.kinds[device] = self.detect_kind(device) if device is not None else None
+            return self.kinds[device]
+
+    def limit(self, device):
+        return self.limits[self.kind(device)]
+
+    def sequential(self, device):
+        return self.kind(device) == "hdd"
+
+    def _semaphore(self, device):
+        with self.lock:
+            if device not in self.semaphores:
+                kind = self.kinds.get(device)
+                self.semaphores[device] = threading.BoundedSemaphore(self.limits[kind])
+            return self.semaphores[device]
+
+    @contextmanager
+    def acquire(self, *paths):
+        """Réserve les disques des chemins donnés (source, destination) le temps d'un accès"""
+        if not self.enabled:
+            yield
+            return
+        devices = sorted({self.device_of(path) for path in paths} - {None})
+        for device in devices:
+            self.kind(device)
+        semaphores = [self._semaphore(device) for device in devices]  # Ordre fixe : pas d'interblocage
+        for semaphore in semaphores:
+            semaphore.acquire()
+        try:
+            yield
+        finally:
+            for semaphore in reversed(semaphores):
+                semaphore.release()
+
+class BatchScheduler:
+    """Ordonnancement d'un lot : coût estimé de chaque fichier (taille, type, état déjà atteint),
+    petits fichiers d'abord, travail local et classification IA menés en parallèle dans deux files
+    dont la concurrence s'adapte aux latences observées. Chaque file est répartie par disque source :
+    travail local limité par disque (ordre dossier / inode sur disque rotatif), disques servis à tour de rôle"""
+    API_EXTENSIONS = ('.pdf', '.docx', '.xlsx', '.pptx')
+    LOOKAHEAD = 512  # Fichiers examinés d'avance (liste en flux)
+    FILE_OVERHEAD_S = 0.005
+
+    def __init__(self, pipeline, keep_order=False):
+        config = pipeline.config
+        self.pipeline = pipeline
+        self.keep_order = keep_order  # Ordre imposé (exécution d'un plan trié par position sur disque)
+        local_workers = config.get("scheduler_local_workers", 4)
+        self.lanes = {
+            "local": AdaptiveLimit(max(1, local_workers // 2), local_workers),
+            "api": AdaptiveLimit(config.get("scheduler_api_initial_concurrency", 2),
+                                 config.get("scheduler_api_max_concurrency", 8))
+        }
+        self.seconds_per_byte = 1 / (100 * 1024 * 1024)  # Estimation initiale : 100 Mo/s
+        self.api_latency = 2.0
+        self.errors = 0  # Fichiers dont le traitement a levé une exception
+
+    def estimate(self, filepath, state):
+        """File ('local' ou 'api') et coût estimé en secondes"""
+        if state["stage"] in JobManifest.FINAL_STAGES or self.keep_order:
+            return "local", 0.0
+        try:
+            size = os.path.getsize(filepath)
+        except OSError:
+            size = 0
+        cost = self.FILE_OVERHEAD_S + size * self.seconds_per_byte
+        engine = self.pipeline.classification_engine
+        if engine.api_available and filepath.lower().endswith(self.API_EXTENSIONS) \
+                and not JobManifest.reached(state, "classified"):
+            return "api", cost + self.api_latency
+        return "local", cost
+
+    def observe(self, lane, elapsed, size, result):
+        ok = "ERREUR" not in result.get("status", "ERREUR")
+        if result.get("is_duplicate"):
+            return  # Aucun appel IA ni copie : non représentatif
+        local_part = self.FILE_OVERHEAD_S + size * self.seconds_per_byte
+        if lane == "api":
+            self.api_latency = 0.8 * self.api_latency + 0.2 * max(0.0, elapsed - local_part)
+            self.lanes["api"].observe(elapsed, ok)
+        else:
+            if size >= 1024 * 1024:
+                self.seconds_per_byte = 0.8 * self.seconds_per_byte + 0.2 * elapsed / size
+            # Latence ramenée à la taille : un gros fichier n'est pas un ralentissement
+            self.lanes["local"].observe(elapsed / max(size, 64 * 1024), ok)
+
+    def run(self, file_list, handle, state_for):
+        """Appelle 'handle(chemin)' pour chaque fichier dans l'ordre choisi par l'ordonnanceur ;
+        renvoie le nombre de fichiers dont le traitement a levé une exception"""
+        feed = queue.Queue(maxsize=self.LOOKAHEAD)
+        feed_done = threading.Event()
+        
+        def feeder():
+            try:
+                for filepath in file_list:
+                    feed.put(filepath)
+            finally:
+                feed_done.set()
+        
+        threading.Thread(target=feeder, daemon=True).start()
+        io = self.pipeline.io
+        queues = {}  # (file, disque) -> tas (clé de tri, ordre d'arrivée, chemin, taille)
+        running = {"local": 0, "api": 0}
+        running_devices = {}  # Travail local en cours par disque
+        pending = {}
+        order = 0
+        workers = self.lanes["local"].maximum + self.lanes["api"].maximum
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                while sum(len(q) for q in queues.values()) < self.LOOKAHEAD:
+                    try:
+                        filepath = feed.get_nowait()
+                    except queue.Empty:
+                        break
+                    try:
+                        stat = os.stat(filepath)
+                        device, inode, size = stat.st_dev, stat.st_ino, stat.st_size
+                    except OSError:
+                        device, inode, size = None, 0, 0
+                    lane, cost = self.estimate(filepath, state_for(filepath))
+                    if lane == "local" and not self.keep_order and io.enabled and io.sequential(device):
+                        key = (os.path.dirname(filepath), inode)  # Lecture dans l'ordre du disque
+                    else:
+                        key = (cost,)
+                    heapq.heappush(queues.setdefault((lane, device), []), (key, order, filepath, size))
+                    order += 1
+                
+                for lane in running:
+                    lane_queues = [(device, q) for (queue_lane, device), q in queues.items() if queue_lane == lane and q]
+                    dispatched = True
+                    while dispatched and running[lane] < self.lanes[lane].current:
+                        dispatched = False
+                        for device, device_queue in lane_queues:  # Disques servis à tour de rôle
+                            if not device_queue or running[lane] >= self.lanes[lane].current:
+                                continue
+                            if lane == "local" and io.enabled and running_devices.get(device, 0) >= io.limit(device):
+                                continue
+                            _, _, filepath, size = heapq.heappop(device_queue)
+                            future = executor.submit(handle, filepath)
+                            pending[future] = (lane, device, time.perf_counter(), size, filepath)
+                            running[lane] += 1
+                            if lane == "local":
+                                running_devices[device] = running_devices.get(device, 0) + 1
+                            dispatched = True
+                
+                if not pending:
+                    if feed_done.is_set() and feed.empty():
+                        break
+                    time.sleep(0.01)  # En attente du parcours de dossier
+                    continue
+                done, _ = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+                for future in done:
+                    lane, device, start, size, filepath = pending.pop(future)
+                    running[lane] -= 1
+                    if lane == "local":
+                        running_devices[device] -= 1
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # Le lot continue : la file d'attente et le parcours ne restent pas bloqués
+                        print(f"Erreur traitement {filepath}: {e}")
+                        self.errors += 1
+                        result = {}
+                    self.observe(lane, time.perf_counter() - start, size, result)
+        return self.errors
+
+class IngestionPipeline:
+    """Cœur d'ingestion sans interface graphique (utilisé par MainApp et les outils en ligne de commande)"""
+    def __init__(self, config=None, file_index=None, perceptual_index=None, classification_engine=None):
+        self.config = config if config is not None else ConfigManager.load_config()
+        # Index par archive : seuls les filtres de Bloom sont lus, les index le sont à la demande
+        self.archives = ArchiveRegistry(error_rate=self.config.get("archive_bloom_error_rate", 0.01))
+        preloaded = file_index is not None
+        self.file_index = file_index if isinstance(file_index, FileIndex) else FileIndex(file_index)
+        self.archives.open(self.file_index, loaded=preloaded)
+        if perceptual_index is None:
+            perceptual_index = PerceptualIndex(ConfigManager.load_phash_index(),
+                                               self.config.get("phash_threshold", 6))
+        self.perceptual_index = perceptual_index
+        self.classification_engine = classification_engine or ClassificationEngine()
+        self.persist_index = True  # Désactivé par les nœuds d'ingestion répartie (segments d'index)
+        self.hasher = ContentHasher(self.config)
+        self.index_lock = threading.RLock()
+        self.save_lock = threading.Lock()
+        self.in_flight = {}  # Empreinte -> (événement, thread) pendant son traitement
+        self.deferred = DeferredClassifier(self)
+        self.io = DeviceIOScheduler(self.config)
+        self.pack_stores = {}  # Racine d'archive -> PackStore
+        self.active_jobs = set()  # Lots en cours de traitement dans ce processus (pas de reprise en double)
+        self.running_batches = 0
+        self.migration_pending = False  # Fiches d'un autre algorithme à rapprocher (IndexMigrator)
+        self.refresh_index_algorithms()
+        metrics.configure(self.config)
+        TextCache.configure(self.config)
+
+    def refresh_index_algorithms(self):
+        """Algorithmes présents dans l'index (plusieurs pendant une migration)"""
+        with self.index_lock:
+            self.index_algorithms = self.archives.algorithms() | {DuplicateManager.entry_algorithm(e)
+                                                                  for e in self.file_index.values()}
+            if self.archives.unmigrated(self.hasher.settings):
+                self.migration_pending = True  # Jusqu'à ce qu'IndexMigrator ne trouve plus rien à migrer
+
+    def load_archives(self):
+        """Charge l'index de toutes les archives en ligne (outils qui modifient l'ensemble des fiches)"""
+        with self.index_lock:
+            self.archives.load_all()
+
+    def archive_records(self, root):
+        """Copie des fiches d'une archive pour un parcours en lecture seule : l'index chargé
+        s'il l'est, sinon celui du support, sans l'ajouter à l'index commun"""
+        with self.index_lock:
+            records = self.archives.loaded_records(root)
+        return records if records is not None else self.archives.stored_records(root)
+
+    def index_summary(self, since):
+        """Statistiques de toutes les archives en ligne : index commun et résumés du registre
+        pour les archives non chargées ('since' : date ISO des archivages récents)"""
+        with self.index_lock:
+            summary = {"records": len(self.file_index), "recent": len(self.file_index.archived_between(since)),
+                       "bytes": self.file_index.total_size(), "categories": self.file_index.category_counts()}
+            unloaded = [root for root in self.archives.online() if root not in self.archives.loaded]
+        for root in unloaded:
+            info = self.archives.archives.get(root, {})
+            summary["records"] += info.get("records", 0)
+            summary["recent"] += sum(count for day, count in info.get("archived_days", {}).items()
+                                     if day >= since[:10])
+            summary["bytes"] += info.get("bytes", 0)
+            for category, count in info.get("categories", {}).items():
+                summary["categories"][category] = summary["categories"].get(category, 0) + count
+        return summary
+
+    def attach_archive(self, root):
+        """Rattache une archive ; son index est chargé (destination d'un lot)"""
+        with self.index_lock:
+            root = self.archives.attach(root)
+            if not self.archives.archives[root].get("records"):
+                self.archives.archives[root]["hashing"] = self.hasher.settings  # Archive neuve : rien à migrer
+            self.archives.load(root)
+        self.refresh_index_algorithms()
+        return root
+
+    def detach_archive(self, root):
+        with self.index_lock:
+            self.archives.detach(root)
+        self.refresh_index_algorithms()
+
+    def pack_store(self, root):
+        root = os.path.abspath(root)
+        with self.index_lock:
+            if root not in self.pack_stores:
+                self.pack_stores[root] = PackStore(root, self.config.get("pack_max_mb", 1024) * 1024 * 1024)
+            return self.pack_stores[root]
+
+    def find_duplicate(self, filepath, file_hash, algorithm):
+        """Entrée d'index identique au fichier, ou None"""
+        with self.index_lock:
+            entry = self.archives.lookup(file_hash)
+        if entry is not None and algorithm.startswith("xxh3"):
+            # Préfiltre rapide : confirmation SHA-256 avant de déclarer un doublon
+            confirmation = self.hasher.confirmation_algorithm(algorithm)
+            archived_sha = entry.get(confirmation) if isinstance(entry, dict) else None
+            if archived_sha is None:
+                archived_sha = self.hasher.key_for_entry(entry, confirmation)
+                if isinstance(entry, dict):
+                    entry[confirmation] = archived_sha
+            if self.hasher.key_for(filepath, confirmation) != archived_sha:
+                return None
+        if entry is not None or not self.migration_pending:
+            return entry
+        # Migration en cours : l'archive peut encore être indexée avec un autre algorithme,
+        # parmi ceux qu'un réglage antérieur a pu appliquer à ce type et cette taille de fichier
+        size = os.path.getsize(filepath)
+        for other in list(self.index_algorithms):
+            if other == algorithm or other.startswith("xxh3") or \
+                    not self.hasher.may_have_indexed(other, filepath, size):
+                continue
+            with self.index_lock:
+                entry = self.archives.lookup(self.hasher.key_for(filepath, other))
+            if entry is not None:
+                return entry
+        return None
+
+    def save(self):
+        """Sauvegarde les index sur disque (copie prise sous verrou : lots et tâches de fond concurrents)"""
+        if self.persist_index:
+            with self.save_lock:
+                with self.index_lock:
+                    file_index = dict(self.file_index)
+                    phash_index = dict(self.perceptual_index.data)
+                self.archives.save(file_index)
+                ConfigManager.save_phash_index(phash_index)
+                self.deferred.save()
+        metrics.flush()
+
+    def process_batch(self, file_list, dest_dir, delete_source=False, on_progress=None, on_result=None, job=None,
+                      sources=None):
+        """Traite une liste de fichiers et retourne un résumé du lot (repris depuis 'job' si fourni ;
+        'sources' : dossiers et fichiers d'origine d'un flux, reparcourus si le lot est repris)"""
+        streaming = not isinstance(file_list, (list, tuple))
+        self.attach_archive(dest_dir)
+        if job is None and self.config.get("resumable_jobs", True):
+            # En flux, les fichiers sont ajoutés au manifeste au fil de leur découverte
+            job = JobManifest.create([] if streaming else file_list, dest_dir, delete_source,
+                                     self.config.get("job_checkpoint_interval_s", 2))
+            if streaming and sources:
+                job.data["sources"] = [os.path.abspath(source) for source in sources]
+        if streaming and job is not None and job.data.get("sources"):
+            file_list = self._track_scan(file_list, job)
+        summary = {"processed": 0, "duplicates": 0, "errors": 0, "new_categories": [],
+                   "job_id": job.job_id if job else None, "total": 0}
+        total = None if streaming else len(file_list)
+        summary_lock = threading.Lock()
+        state_for = job.entry if job else (lambda filepath: {"stage": "pending"})
+        report = None
+        if self.config.get("batch_report", True):
+            report_id = job.job_id if job else f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+            extension = "csv" if self.config.get("batch_report_format", "jsonl") == "csv" else "jsonl"
+            try:
+                report = BatchReportWriter(os.path.join(REPORTS_DIR, f"{report_id}.{extension}"))
+                summary["report"] = report.path
+            except Exception as e:
+                print(f"Erreur création rapport de lot: {e}")
+        
+        def handle(filepath):
+            state = state_for(filepath)
+            try:
+                if state["stage"] in JobManifest.FINAL_STAGES and state.get("result"):
+                    # Déjà traité avant l'interruption : on restaure l'index sans retraiter
+                    result = state["result"]
+                    self._restore_index(state)
+                else:
+                    result = self.process_file(filepath, dest_dir, delete_source=delete_source, state=state)
+            except Exception as e:
+                print(f"Erreur traitement {filepath}: {e}")
+                state["error"] = str(e)
+                result = None
+            
+            with summary_lock:
+                # Mise à jour progression
+                summary["total"] += 1
+                if on_progress:
+                    on_progress(summary["total"], total)
+                if result is None:
+                    summary["errors"] += 1
+                elif result.get("is_duplicate", False):
+                    summary["duplicates"] += 1
+                elif "ERREUR" in result["status"]:
+                    summary["errors"] += 1
+                else:
+                    summary["processed"] += 1
+                    # Si une nouvelle catégorie a été créée, la suivre
+                    if result.get("created_new", False):
+                        summary["new_categories"].append({
+                            "category": result["category"],
+                            "subcategory": result["subcategory"],
+                            "file": result["filename"],
+                            "reason": result.get("reason", "")
+                        })
+                if on_result and result is not None:
+                    on_result(result)
+                if report is not None and not state.get("reported"):
+                    try:
+                        report.write(BatchReportWriter.row_for(filepath, state, result))
+                        state["reported"] = True  # Lot repris : pas de seconde ligne pour ce fichier
+                    except Exception as e:
+                        print(f"Erreur écriture rapport de lot: {e}")
+            if job:
+                job.checkpoint()  # Hors verrou : les autres fichiers avancent pendant l'écriture
+            return result or {}
+        
+        with self.index_lock:
+            self.running_batches += 1
+        if job:
+            self.active_jobs.add(job.job_id)
+        try:
+            if self.config.get("batch_scheduling", True):
+                scheduler = BatchScheduler(self, keep_order=bool(job and job.data.get("ordered")))
+                summary["errors"] += scheduler.run(file_list, handle, state_for)
+            else:
+                for filepath in file_list:
+                    handle(filepath)
+            
+            # Sauvegarde index
+            self.save()
+            if report is not None and self.config.get("batch_report_xlsx", False):
+                try:
+                    summary["report_xlsx"] = BatchReportWriter.to_xlsx(report.path)  # Lignes déjà écrites sur disque
+                except Exception as e:
+                    print(f"Erreur conversion Excel du rapport: {e}")
+            if job:
+                job.finish(summary)
+        finally:
+            if report is not None:
+                try:
+                    report.close()
+                except Exception as e:
+                    print(f"Erreur fermeture rapport de lot: {e}")
+            if job:
+                self.active_jobs.discard(job.job_id)
+            with self.index_lock:
+                self.running_batches -= 1
+                idle = not self.running_batches
+            if idle:
+                self.close()  # Processus d'OCR libérés entre deux lots
+        return summary
+
+    def close(self):
+        """Libère les ressources de traitement (réserve de processus d'OCR, recréée au besoin)"""
+        self.classification_engine.ocr.shutdown()
+
+    @staticmethod
+    def _track_scan(file_list, job):
+        """Flux d'un lot : note la fin du parcours des sources dans le manifeste"""
+        yield from file_list
+        job.data["scan_complete"] = True
+
+    def stream_sources(self, sources, dest_dir, skip=()):
+        """Chemins des sources (dossiers parcourus en flux, fichiers tels quels), hors chemins 'skip'"""
+        for source in sources:
+            if os.path.isdir(source):
+                scanner = FolderScanner(SUPPORTED_EXTENSIONS, self.config.get("scan_skip_patterns", []),
+                                        skip_paths=[dest_dir])
+                for filepath in scanner.stream(source):
+                    if filepath not in skip:
+                        yield filepath
+            elif os.path.abspath(source) not in skip:
+                yield os.path.abspath(source)
+
+    def resume_job(self, job, on_progress=None, on_result=None):
+        """Reprend un lot interrompu là où il s'est arrêté"""
+        job.data["status"] = "running"
+        file_list = list(job.files)
+        if job.data.get("sources") and not job.data.get("scan_complete"):
+            # Parcours en flux interrompu : fichiers connus d'abord, puis les sources reparcourues
+            known = set(file_list)
+            file_list = itertools.chain(file_list, self.stream_sources(job.data["sources"], job.dest_dir, known))
+        return self.process_batch(file_list, job.dest_dir, job.delete_source,
+                                  on_progress=on_progress, on_result=on_result, job=job)
+
+    def plan_batch(self, file_list, dest_dir, on_progress=None):
+        """Simulation : empreintes et classification seules, aucune copie ; renvoie le plan de classement"""
+        plan = ClassificationPlan(dest_dir)
+        planned = {}  # Empreinte -> destination prévue (doublons internes au lot)
+        plan_lock = threading.Lock()
         
-        # Règles de sous-catégories par catégorie
-        rules = {
-            "JURIDIQUE": {
-                "bail": "Baux",
-                "contrat": "Contrats",
-                "acte": "Actes",
-                "procès": "Contentieux",
-                "tribunal": "Contentieux"
-            },
-            "TECHNIQUE": {
-                "diagnostic": "Diagnostics",
-                "devis": "Devis",
-                "plan": "Plans",
-                "photo": "Photos",
-                "video": "Vidéos",
-                "visite": "Visites"
-            },
-            "COMPTABILITE": {
-                "facture": "Factures",
-                "relevé": "Relevés",
-                "impôt": "Impôts",
-                "taxe": "Impôts",
-                "bancaire": "Relevés_Bancaires"
-            },
-            "ADMINISTRATIF": {
-                "assurance": "Assurances",
-                "courrier": "Courriers",
-                "identité": "Identité",
-                "permis": "Permis",
-                "autorisation": "Autorisations"
-            }
-        }
+        def handle(filepath):
+            state = {"stage": "pending"}
+            row = {"source": filepath, "status": "new", "created_new": False}
+            try:
+                row["size"] = os.path.getsize(filepath)
+                duplicate = self._hash_and_classify(filepath, state, persist=False)
+                row.update(hash=state.get("hash"), algo=state.get("hash_algo"))
+                if duplicate is not None:
+                    row.update(status="duplicate", duplicate_of=duplicate["status"])
+                else:
+                    classification = state["classification"]
+                    with plan_lock:
+                        earlier = planned.get(state["hash"])
+                        if earlier is None:
+                            planned[state["hash"]] = os.path.join(dest_dir, classification["category"],
+                                                                  classification["subcategory"],
+                                                                  classification["new_name"])
+                    if earlier is not None:
+                        row.update(status="duplicate", duplicate_of=earlier)
+                    else:
+                        row.update({key: classification.get(key, "") for key in
+                                    ("category", "subcategory", "new_name", "method", "reason")},
+                                   created_new=classification.get("created_new", False),
+                                   dest_path=planned[state["hash"]])
+                        if state.get("image_hashes"):
+                            row["image_hashes"] = json.dumps(state["image_hashes"])
+            except Exception as e:
+                print(f"Erreur simulation {filepath}: {e}")
+                row.update(status="error", reason=str(e))
+            finally:
+                self._release(state.get("hash"))
+            with plan_lock:
+                plan.rows.append(row)
+                if on_progress:
+                    on_progress(len(plan.rows), None)
+            return {"status": "ERREUR" if row["status"] == "error" else "ok",
+                    "is_duplicate": row["status"] == "duplicate"}
         
-        if category in rules:
-            for keyword, subcategory in rules[category].items():
-                if keyword in content_text:
-                    return subcategory
+        BatchScheduler(self).run(file_list, handle, lambda filepath: {"stage": "pending"})
+        return plan
+
+    def prepare_plan_job(self, plan, delete_source=False):
+        """Manifeste d'exécution d'un plan : fichiers triés par position sur disque, classification reprise du plan"""
+        def disk_position(row):
+            try:
+                stat = os.stat(row["source"])
+                return stat.st_dev, stat.st_ino, row["source"]
+            except OSError:
+                return 0, 0, row["source"]
+        
+        rows = sorted(plan.rows, key=disk_position)
+        job = JobManifest.create([row["source"] for row in rows], plan.dest_dir, delete_source,
+                                 self.config.get("job_checkpoint_interval_s", 2))
+        job.data["ordered"] = True
+        for row in rows:
+            state = job.files[row["source"]]
+            if row["status"] == "duplicate":
+                state.update(stage="duplicate", result={
+                    "filename": os.path.basename(row["source"]), "category": "DOUBLON", "subcategory": "",
+                    "status": f"DOUBLON ({os.path.basename(row.get('duplicate_of') or '')[:20]}...)",
+                    "color": "orange", "path": row["source"], "is_duplicate": True, "created_new": False})
+            elif row["status"] == "new":
+                existing = self.find_duplicate(row["source"], row["hash"], row["algo"]) \
+                    if os.path.exists(row["source"]) else None
+                if existing is not None:
+                    continue  # Archivé entre-temps : traitement normal, signalé comme doublon
+                state.update(stage="classified", hash=row["hash"], hash_algo=row["algo"], classification={
+                    "original_path": row["source"], "filename": os.path.basename(row["source"]),
+                    "category": row["category"], "subcategory": row["subcategory"], "new_name": row["new_name"],
+                    "status": "Classé selon le plan", "created_new": False,
+                    "reason": row.get("reason", ""), "method": row.get("method", "")})
+                if row.get("image_hashes"):
+                    state["image_hashes"] = json.loads(row["image_hashes"])
+        job.save()
+        return job
+
+    def execute_plan(self, plan, delete_source=False, on_progress=None, on_result=None):
+        """Applique un plan : copies parallèles dans l'ordre du disque, sans nouvelle classification"""
+        return self.resume_job(self.prepare_plan_job(plan, delete_source), on_progress, on_result)
+
+    def _restore_index(self, state):
+        """Réinscrit dans l'index un fichier archivé dont l'index n'avait pas été sauvegardé"""
+        if JobManifest.reached(state, "verified") and state.get("hash") and state.get("dest_path"):
+            with self.index_lock:
+                self.file_index.setdefault(state["hash"], self._index_record(state))
+            if state.get("image_hashes"):
+                self.perceptual_index.add(state["hash"], state["image_hashes"], state["dest_path"])
+
+    def process_file(self, filepath, dest_dir, delete_source=False, state=None):
+        """Traite un fichier individuel : doublon, classification, copie, vérification, tagging"""
+        metrics.begin_file(filepath)
+        outcome = "error"
+        state = state if state is not None else {"stage": "pending"}
+        try:
+            result = self._process_file(filepath, dest_dir, delete_source, state)
+            if result.get("is_duplicate", False):
+                outcome = "duplicate"
+            elif "ERREUR" not in result["status"]:
+                outcome = "archived"
+            return result
+        finally:
+            self._release(state.get("hash"))
+            metrics.end_file(outcome)
+
+    def _hash_and_classify(self, filepath, state, persist=True):
+        """Empreinte, détection des doublons puis classification ; résultat 'DOUBLON' ou None
+        (sans 'persist' : simulation, la typologie n'est pas modifiée)"""
+        filename = os.path.basename(filepath)
+        # 1. Vérification doublon (inutile si le fichier a déjà été classé avant une interruption)
+        if not JobManifest.reached(state, "hashed"):
+            with self.io.acquire(filepath), metrics.stage("hashing", os.path.getsize(filepath)) as stage:
+                file_hash, hash_algo = self.hasher.hash_file(filepath)
+                if file_hash is None:
+                    stage["outcome"] = "error"
+            state.update(stage="hashed", hash=file_hash, hash_algo=hash_algo)
+        file_hash = state["hash"]
+        hash_algo = state.get("hash_algo", "sha256")
         
+        if not JobManifest.reached(state, "classified"):
+            self._claim(file_hash)  # Même contenu traité en parallèle : le second attend le premier
+            existing = self.find_duplicate(filepath, file_hash, hash_algo)
+            if existing is not None:
+                result = {
+                    "filename": filename,
+                    "category": "DOUBLON",
+                    "subcategory": "",
+                    "status": f"DOUBLON ({os.path.basename(DuplicateManager.entry_path(existing))[:20]}...)",
+                    "color": "orange",
+                    "path": filepath,
+                    "is_duplicate": True,
+                    "created_new": False
+                }
+                state.update(stage="duplicate", result=result)
+                return result
+            
+            # 1b. Doublon visuel (image redimensionnée, recompressée ou ré-exportée)
+            if (filepath.lower().endswith(IMAGE_EXTENSIONS) and self.config.get("visual_duplicates", True)
+                    and PerceptualHashManager.is_available()):
+                state["image_hashes"] = PerceptualHashManager.compute_hashes(filepath)
+                with self.index_lock:
+                    similar = self.perceptual_index.find_similar(state["image_hashes"])
+                if similar:
+                    result = {
+                        "filename": filename,
+                        "category": "DOUBLON",
+                        "subcategory": "",
+                        "status": f"DOUBLON VISUEL ({os.path.basename(similar['path'])[:20]}...)",
+                        "color": "orange",
+                        "path": filepath,
+                        "is_duplicate": True,
+                        "created_new": False
+                    }
+                    state.update(stage="duplicate", result=result)
+                    return result
+            
+            # 2. Classification avec création automatique
+            state["classification"] = self.classification_engine.analyze_document(filepath, cache_key=file_hash,
+                                                                                  persist=persist)
+            state["stage"] = "classified"
         return None
 
-    def analyze_document(self, filepath):
-        """Analyse un document et retourne sa classification avec création automatique de catégories si besoin"""
+    def _claim(self, file_hash):
+        """Réserve une empreinte le temps de son traitement"""
+        while True:
+            with self.index_lock:
+                owner = self.in_flight.get(file_hash)
+                if owner is None or owner[1] == threading.get_ident():
+                    self.in_flight[file_hash] = (threading.Event(), threading.get_ident())
+                    return
+            owner[0].wait()
+
+    def _release(self, file_hash):
+        with self.index_lock:
+            owner = self.in_flight.get(file_hash)
+            if owner is None or owner[1] != threading.get_ident():
+                return
+            del self.in_flight[file_hash]
+        owner[0].set()
+
+    def _process_file(self, filepath, dest_dir, delete_source, state):
         filename = os.path.basename(filepath)
+        state.pop("error", None)
         
-        # Classification initiale par nom de fichier
-        predicted_category = self.analyze_filename(filename)
-        predicted_sub = "Divers"
-        created_new = False
-        reason = ""
+        duplicate = self._hash_and_classify(filepath, state)
+        if duplicate is not None:
+            return duplicate
+        file_hash = state["hash"]
+        hash_algo = state.get("hash_algo", "sha256")
+        classification = state["classification"]
         
-        # Extraction du contenu pour analyse approfondie
-        content_text = ""
-        supported_ext = ('.pdf', '.docx', '.xlsx', '.pptx')
-        if filepath.lower().endswith(supported_ext):
-            content_text = self.extract_text(filepath)
+        # 3. Préparation destination
+        final_dir = os.path.join(dest_dir, classification["category"], classification["subcategory"])
+        os.makedirs(final_dir, exist_ok=True)
         
-        # Si l'API est disponible et nous avons du contenu
-        if self.api_available and len(content_text) > 10:
-            try:
-                # Classification intelligente avec création automatique
-                classification_result = self.auto_classify_with_creation(
-                    content_text, 
-                    filename, 
-                    self.typology
-                )
-                
-                predicted_category = classification_result["category"]
-                predicted_sub = classification_result["subcategory"]
-                created_new = classification_result.get("created_new", False)
-                reason = classification_result.get("reason", "")
-                
-                # Si une nouvelle catégorie a été créée, l'ajouter à la typologie
-                if created_new and predicted_category not in self.typology:
-                    self.typology[predicted_category] = [predicted_sub]
-                    # Sauvegarder automatiquement la nouvelle typologie
-                    self.config["typology"] = self.typology
-                    ConfigManager.save_config(self.config)
-                    print(f"Nouvelle catégorie créée: {predicted_category} > {predicted_sub}")
-                
-                # Si la catégorie existe mais pas la sous-catégorie, l'ajouter
-                elif predicted_category in self.typology and predicted_sub not in self.typology[predicted_category]:
-                    self.typology[predicted_category].append(predicted_sub)
-                    self.config["typology"] = self.typology
-                    ConfigManager.save_config(self.config)
-                    print(f"Nouvelle sous-catégorie ajoutée: {predicted_category} > {predicted_sub}")
-                    
-            except Exception as e:
-                print(f"Erreur analyse IA avec création: {e}")
-                # Fallback sur la classification par nom
-                if not predicted_category:
-                    predicted_category = "GENERAL"
+        dest_path = os.path.join(final_dir, classification["new_name"])
+        state["dest_path"] = dest_path
         
-        # Si pas d'analyse IA possible, utiliser la classification par nom
-        elif not predicted_category:
-            predicted_category = "GENERAL"
+        # 4. Copie
+        if state.get("pack"):
+            file_size = state["pack"]["size"]  # Reprise : document déjà rangé dans un pack
+        else:
+            file_size = os.path.getsize(filepath) if os.path.exists(filepath) else os.path.getsize(dest_path)
+        if not state.get("pack") and (not JobManifest.reached(state, "copied") or not os.path.exists(dest_path)):
+            with self.io.acquire(filepath, final_dir), metrics.stage("copy", file_size):
+                # MP3 balisé pendant la copie : l'empreinte du contenu reste vérifiable
+                tagged = hash_algo.endswith("-payload") and dest_path.lower().endswith(".mp3") and \
+                    MetadataManager.copy_with_tags(filepath, dest_path, classification["category"],
+                                                   classification["subcategory"])
+                if not tagged:
+                    shutil.copy2(filepath, dest_path)
+            state.update(stage="copied", tagged_in_copy=tagged)
         
-        # Nommage standardisé
-        doc_date = datetime.now().strftime("%Y%m%d")
-        clean_filename = filename.replace(" ", "_").replace("(", "").replace(")", "")
+        # 5. Vérification intégrité
+        if not JobManifest.reached(state, "verified"):
+            with self.io.acquire(dest_path), metrics.stage("verify", file_size) as stage:
+                dest_hash = self.hasher.key_for(dest_path, hash_algo)
+                if dest_hash != file_hash:
+                    stage["outcome"] = "mismatch"
+            if dest_hash != file_hash:
+                # Une reprise recopiera le fichier
+                state.update(stage="classified", error="ERREUR Intégrité")
+                return {
+                    "filename": filename,
+                    "category": classification["category"],
+                    "subcategory": classification["subcategory"],
+                    "status": "ERREUR Intégrité",
+                    "color": "red",
+                    "path": dest_path,
+                    "is_duplicate": False,
+                    "created_new": False
+                }
+            state["stage"] = "verified"
         
-        # Ajouter un marqueur si nouvelle catégorie créée
-        status_prefix = "🌟 NOUVELLE " if created_new else ""
+        # 6. Mise à jour index
+        state["archived_at"] = datetime.now().isoformat(timespec="seconds")
+        with self.index_lock:
+            self.file_index[file_hash] = self._index_record(state, filepath)
+            self.index_algorithms.add(hash_algo)
+        if classification.get("method") == "provisoire":
+            self.deferred.enqueue(file_hash)
+        if state.get("image_hashes"):
+            with self.index_lock:
+                self.perceptual_index.add(file_hash, state["image_hashes"], dest_path)
         
-        new_name = f"{doc_date}_{predicted_category}_{predicted_sub}_{clean_filename}"
+        # 7. Tagging métadonnées (si fichier audio/vidéo)
+        if not JobManifest.reached(state, "tagged"):
+            if dest_path.lower().endswith(('.mp3', '.mp4', '.m4a')) and not state.get("tagged_in_copy"):
+                try:
+                    with metrics.stage("tagging", file_size):
+                        MetadataManager.tag_file(dest_path, classification["category"], classification["subcategory"])
+                except:
+                    pass
+                if not hash_algo.endswith("-payload"):
+                    # Les balises modifient l'archive : empreinte de référence pour la vérification d'intégrité
+                    state["content_hash"] = self.hasher.key_for(dest_path, hash_algo)
+                    with self.index_lock:
+                        self.file_index[file_hash] = self._index_record(state, filepath)
+            state["stage"] = "tagged"
         
-        return {
-            "original_path": filepath,
+        # 7b. Petit document : regroupé dans un pack compressé
+        if not state.get("pack") and ArchivePacker.eligible(self.config, dest_path, file_size) \
+                and self.persist_index and not state.get("content_hash"):
+            with self.io.acquire(dest_path), metrics.stage("pack", file_size):
+                state["pack"] = self.pack_store(dest_dir).append(file_hash, dest_path)
+            with self.index_lock:
+                self.file_index[file_hash] = self._index_record(state, filepath)
+            os.remove(dest_path)
+        
+        # 8. Suppression source si option activée
+        source_deleted = False
+        if delete_source:
+            try:
+                os.remove(filepath)
+                source_deleted = True
+            except:
+                pass
+        
+        # 9. Retour résultat
+        status = f"{classification['status']}{' (Source supprimée)' if source_deleted else ''}"
+        
+        result = {
             "filename": filename,
-            "category": predicted_category,
-            "subcategory": predicted_sub,
-            "new_name": new_name,
-            "status": f"{status_prefix}Classé par IA" if self.api_available else "Classé par nommage",
-            "created_new": created_new,
-            "reason": reason
+            "category": classification["category"],
+            "subcategory": classification["subcategory"],
+            "status": status,
+            "color": "#27ae60" if not classification.get("created_new", False) else "#f39c12",
+            "path": dest_path,
+            "is_duplicate": False,
+            "created_new": classification.get("created_new", False),
+            "reason": classification.get("reason", ""),
+            "new_name": classification["new_name"]
+        }
+        state.update(stage="done", result=result)
+        return result
+
+    def _index_record(self, state, source=None):
+        """Fiche d'index à partir de l'état d'un fichier dans le manifeste"""
+        classification = state.get("classification") or {}
+        dest_path = state["dest_path"]
+        pack = state.get("pack")
+        try:
+            stat = os.stat(dest_path)
+            size, mtime = stat.st_size, stat.st_mtime
+        except OSError:
+            size, mtime = (pack["size"], pack["mtime"]) if pack else (None, None)
+        record = {
+            "path": dest_path,
+            "source": source or classification.get("original_path"),
+            "size": size,
+            "mtime": mtime,
+            "category": classification.get("category", ""),
+            "subcategory": classification.get("subcategory", ""),
+            "method": classification.get("method", ""),
+            "archived_at": state.get("archived_at"),
+            "algo": state.get("hash_algo", "sha256")
         }
+        if state.get("content_hash"):
+            record["content_hash"] = state["content_hash"]
+        if pack:
+            record["pack"] = pack
+        return record
+
+class ShardCoordinator:
+    """Ingestion répartie : plusieurs machines se partagent les partitions d'un manifeste et
+    produisent des segments d'index locaux, fusionnés ensuite en un index unique"""
+    def __init__(self, shared_dir):
+        self.shared_dir = shared_dir
+        self.settings_path = os.path.join(shared_dir, "shard.json")
+        self.partitions_dir = os.path.join(shared_dir, "partitions")
+        self.claims_dir = os.path.join(shared_dir, "claims")
+        self.segments_dir = os.path.join(shared_dir, "segments")
+        self.merged_dir = os.path.join(self.segments_dir, "merged")  # Segments déjà fusionnés
+
+    def _partition_name(self, number):
+        return f"part-{number:05d}"
+
+    def load_settings(self):
+        with open(self.settings_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def init(self, manifest_path, partitions, dest_dir):
+        """Découpe le manifeste d'entrée (un chemin par ligne) en partitions"""
+        for folder in (self.partitions_dir, self.claims_dir, self.segments_dir):
+            os.makedirs(folder, exist_ok=True)
+        handles = [open(os.path.join(self.partitions_dir, self._partition_name(i) + ".txt"), "w", encoding="utf-8")
+                   for i in range(partitions)]
+        total = 0
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as manifest:
+                for line in manifest:
+                    filepath = line.strip()
+                    if filepath:
+                        # Répartition circulaire : partitions de taille homogène
+                        handles[total % partitions].write(filepath + "\n")
+                        total += 1
+        finally:
+            for handle in handles:
+                handle.close()
+        settings = {"partitions": partitions, "dest_dir": dest_dir, "manifest": manifest_path,
+                    "files": total, "created": datetime.now().isoformat(timespec="seconds")}
+        with open(self.settings_path, "w", encoding="utf-8") as f:
+            json.dump(settings, f, indent=4, ensure_ascii=False)
+        return settings
+
+    def claim_next(self, node_id, claim_timeout=3600):
+        """Réclame atomiquement la prochaine partition libre (ou abandonnée)"""
+        for number in range(self.load_settings()["partitions"]):
+            name = self._partition_name(number)
+            lock_path = os.path.join(self.claims_dir, name + ".lock")
+            if os.path.exists(os.path.join(self.claims_dir, name + ".done")):
+                continue
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                # Nœud disparu : la réclamation n'est plus rafraîchie
+                try:
+                    if time.time() - os.path.getmtime(lock_path) < claim_timeout:
+                        continue
+                    stale_path = f"{lock_path}.{node_id}.stale"
+                    os.replace(lock_path, stale_path)
+                    if time.time() - os.path.getmtime(stale_path) < claim_timeout:
+                        # Un autre nœud vient de reprendre cette partition
+                        os.replace(stale_path, lock_path)
+                        continue
+                    os.remove(stale_path)
+                    fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                except OSError:
+                    continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(f"{node_id}\t{datetime.now().isoformat(timespec='seconds')}\n")
+            return name
+        return None
+
+    def run_worker(self, node_id, config=None, on_progress=None):
+        """Traite des partitions jusqu'à épuisement et écrit un segment d'index par partition"""
+        config = config if config is not None else ConfigManager.load_config()
+        settings = self.load_settings()
+        claim_timeout = config.get("shard_claim_timeout_s", 3600)
+        # Index de base en lecture seule : les doublons déjà archivés sont ignorés localement
+        base_index = ConfigManager.load_index()
+        base_phash = ConfigManager.load_phash_index()
+        engine = ClassificationEngine()
+        totals = {"partitions": 0, "processed": 0, "duplicates": 0, "errors": 0}
+        
+        while True:
+            name = self.claim_next(node_id, claim_timeout)
+            if name is None:
+                break
+            lock_path = os.path.join(self.claims_dir, name + ".lock")
+            with open(os.path.join(self.partitions_dir, name + ".txt"), "r", encoding="utf-8") as f:
+                files = [line.strip() for line in f if line.strip()]
+            
+            pipeline = IngestionPipeline(config=config, file_index=FileIndex(base_index),
+                                         perceptual_index=PerceptualIndex(dict(base_phash),
+                                                                          config.get("phash_threshold", 6)),
+                                         classification_engine=engine)
+            pipeline.persist_index = False
+            job = JobManifest.create(files, settings["dest_dir"], False, config.get("job_checkpoint_interval_s", 2))
+            
+            def heartbeat(current, total, partition=name):
+                if current % 50 == 0:
+                    os.utime(lock_path)  # Maintient la réclamation active
+                if on_progress:
+                    on_progress(partition, current, total)
+            
+            summary = pipeline.process_batch(files, settings["dest_dir"], on_progress=heartbeat, job=job)
+            
+            segment = {"node": node_id, "partition": name, "index": {}, "phash": {}}
+            for source, state in job.files.items():
+                if state["stage"] == "done" and state.get("hash"):
+                    segment["index"][state["hash"]] = dict(pipeline.file_index[state["hash"]], source=source)
+                    if state.get("image_hashes"):
+                        segment["phash"][state["hash"]] = dict(state["image_hashes"], path=state["dest_path"])
+            segment_path = os.path.join(self.segments_dir, name + ".json")
+            with open(segment_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(segment, f, ensure_ascii=False)
+            os.replace(segment_path + ".tmp", segment_path)
+            open(os.path.join(self.claims_dir, name + ".done"), "w").close()
+            
+            totals["partitions"] += 1
+            for key in ("processed", "duplicates", "errors"):
+                totals[key] += summary[key]
+        return totals
+
+    def merge(self, delete_redundant=True):
+        """Fusionne les segments dans l'index global et résout les doublons entre partitions"""
+        index = ConfigManager.load_index()
+        phash_index = ConfigManager.load_phash_index()
+        aliases = {}
+        if os.path.exists(INDEX_ALIASES_FILE):
+            with open(INDEX_ALIASES_FILE, "r", encoding="utf-8") as f:
+                aliases = json.load(f)
+        stats = {"segments": 0, "added": 0, "cross_shard_duplicates": 0, "blobs_removed": 0}
+        known_aliases = {(alias["path"], alias["node"]) for entries in aliases.values() for alias in entries}
+        merged = []
+        
+        for name in sorted(os.listdir(self.segments_dir)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(self.segments_dir, name), "r", encoding="utf-8") as f:
+                segment = json.load(f)
+            stats["segments"] += 1
+            merged.append(name)
+            for file_hash, record in segment["index"].items():
+                if file_hash not in index:
+                    index[file_hash] = record
+                    if file_hash in segment.get("phash", {}):
+                        phash_index[file_hash] = segment["phash"][file_hash]
+                    stats["added"] += 1
+                    continue
+                kept_path = DuplicateManager.entry_path(index[file_hash])
+                if kept_path == record["path"] or (record["path"], segment["node"]) in known_aliases:
+                    continue  # Segment déjà fusionné
+                # Même contenu archivé par deux nœuds : on garde le premier exemplaire
+                stats["cross_shard_duplicates"] += 1
+                removed = False
+                if delete_redundant and os.path.exists(record["path"]):
+                    try:
+                        os.remove(record["path"])
+                        removed = True
+                        stats["blobs_removed"] += 1
+                    except OSError as e:
+                        print(f"Erreur suppression doublon {record['path']}: {e}")
+                aliases.setdefault(file_hash, []).append({
+                    "path": record["path"], "source": record["source"],
+                    "node": segment["node"], "kept": kept_path, "removed": removed
+                })
+                known_aliases.add((record["path"], segment["node"]))
+        
+        ConfigManager.save_index(index)
+        ConfigManager.save_phash_index(phash_index)
+        with open(INDEX_ALIASES_FILE, "w", encoding="utf-8") as f:
+            json.dump(aliases, f, indent=4, ensure_ascii=False)
+        # Index enregistré : les segments ne seront plus relus par une nouvelle fusion
+        os.makedirs(self.merged_dir, exist_ok=True)
+        for name in merged:
+            os.replace(os.path.join(self.segments_dir, name), os.path.join(self.merged_dir, name))
+        return stats
+
+class ArchiveReorganizer:
+    """Réorganisation de l'archive après modification de la typologie : déplacements minimaux
+    (renommages sur le même disque), reclassement des seuls documents orphelins, index mis à
+    jour via un journal rejoué en cas d'interruption"""
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    @staticmethod
+    def apply_changes(changes, category, subcategory):
+        """(catégorie, sous-catégorie) après modifications ; None = à reclasser"""
+        for change in changes:
+            operation = change["op"]
+            if operation == "rename_category" and category == change["from"]:
+                category = change["to"]
+            elif operation == "delete_category" and category == change["category"]:
+                return None, None
+            elif operation == "rename_subcategory" and (category, subcategory) == (change["category"], change["from"]):
+                subcategory = change["to"]
+            elif operation == "delete_subcategory" and (category, subcategory) == (change["category"], change["subcategory"]):
+                return category, None
+        return category, subcategory
+
+    @staticmethod
+    def affected_categories(changes):
+        return {change.get("from") if change["op"].startswith("rename_category") else change["category"]
+                for change in changes}
+
+    def _reclassify(self, file_hash, record, category, defer=True):
+        """Nouvelle position d'un document dont la catégorie ou la sous-catégorie a disparu"""
+        engine = self.pipeline.classification_engine
+        original_name = os.path.basename(record.get("source") or record["path"])
+        text = TextCache.get(file_hash)
+        if text is None:
+            text = ""
+            if record["path"].lower().endswith(('.pdf', '.docx', '.xlsx', '.pptx')):
+                with PackStore.materialized(record) as path:
+                    text = engine.extract_text(path)
+        if category is None:
+            classification = engine.analyze_document(os.path.join(os.path.dirname(record["path"]), original_name),
+                                                     content_text=text, defer=defer)
+            return classification["category"], classification["subcategory"], classification.get("method", "")
+        remaining = engine.typology.get(category, [])
+        suggested = engine.suggest_subcategory_from_content(text.lower(), category, engine.typology)
+        subcategory = suggested if suggested in remaining else (remaining[0] if remaining else "Divers")
+        return category, subcategory, record.get("method", "")
+
+    def plan(self, changes, on_progress=None):
+        """Déplacements nécessaires, calculés à partir de l'index (seules les catégories touchées sont lues)"""
+        self.pipeline.load_archives()
+        index = self.pipeline.file_index
+        with self.pipeline.index_lock:
+            candidates = [(key, dict(index[key])) for category in self.affected_categories(changes)
+                          for key in index.by_category.get(category, ())]
+        moves = []
+        taken = set()
+        for number, (file_hash, record) in enumerate(candidates, start=1):
+            if on_progress:
+                on_progress(number, len(candidates))
+            old_category, old_subcategory = record.get("category", ""), record.get("subcategory", "")
+            category, subcategory = self.apply_changes(changes, old_category, old_subcategory)
+            method = record.get("method", "")
+            if subcategory is None:
+                category, subcategory, method = self._reclassify(file_hash, record, category)
+            if (category, subcategory) == (old_category, old_subcategory):
+                continue
+            move = self.move_for(file_hash, record, category, subcategory, method, taken)
+            taken.add(move["new"])
+            moves.append(move)
+        return moves
+
+    @staticmethod
+    def move_for(file_hash, record, category, subcategory, method, taken=()):
+        """Déplacement d'un fichier archivé vers (catégorie, sous-catégorie), préfixe du nom compris"""
+        # Arborescence d'archive : <destination>/<catégorie>/<sous-catégorie>/<fichier>
+        old_category, old_subcategory = record.get("category", ""), record.get("subcategory", "")
+        root = os.path.dirname(os.path.dirname(os.path.dirname(record["path"])))
+        name = re.sub(rf"^(\d{{8}})_{re.escape(old_category)}_{re.escape(old_subcategory)}_",
+                      lambda match: f"{match.group(1)}_{category}_{subcategory}_", os.path.basename(record["path"]))
+        new_path = os.path.join(root, category, subcategory, name)
+        stem, ext = os.path.splitext(new_path)
+        suffix = 1
+        while new_path in taken or os.path.exists(new_path):
+            new_path = f"{stem}_{suffix}{ext}"
+            suffix += 1
+        return {"hash": file_hash, "old": record["path"], "new": new_path, "category": category,
+                "subcategory": subcategory, "method": method, "done": False}
+
+    def _write_journal(self, moves):
+        with open(REORG_JOURNAL_FILE + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(moves, f, ensure_ascii=False)
+        os.replace(REORG_JOURNAL_FILE + ".tmp", REORG_JOURNAL_FILE)
+
+    def _apply(self, move):
+        """Déplace un fichier puis met l'index à jour (rejouable sans effet de bord)"""
+        with self.pipeline.index_lock:
+            record = self.pipeline.file_index.get(move["hash"])
+            if isinstance(record, dict) and record.get("pack"):
+                # Document rangé dans un pack : seul son chemin dans l'arborescence change
+                self.pipeline.file_index[move["hash"]] = dict(record, path=move["new"], category=move["category"],
+                                                              subcategory=move["subcategory"], method=move["method"])
+                move["done"] = True
+                return
+        if os.path.exists(move["old"]) and not os.path.exists(move["new"]):
+            os.makedirs(os.path.dirname(move["new"]), exist_ok=True)
+            try:
+                os.rename(move["old"], move["new"])  # Même disque : simple renommage
+            except OSError:
+                shutil.move(move["old"], move["new"])
+        if not os.path.exists(move["new"]):
+            move["done"] = "missing"
+            return
+        with self.pipeline.index_lock:
+            record = self.pipeline.file_index.get(move["hash"])
+            if record is not None:
+                self.pipeline.file_index[move["hash"]] = dict(record, path=move["new"], category=move["category"],
+                                                              subcategory=move["subcategory"], method=move["method"])
+            image_entry = self.pipeline.perceptual_index.data.get(move["hash"])
+            if image_entry is not None:
+                image_entry["path"] = move["new"]
+        move["done"] = True
+
+    def run(self, moves, on_progress=None):
+        """Exécute les déplacements ; le journal permet de terminer après une interruption"""
+        stats = {"moved": 0, "missing": 0, "errors": 0}
+        self._write_journal(moves)
+        for number, move in enumerate(moves, start=1):
+            try:
+                self._apply(move)
+                stats["moved" if move["done"] is True else "missing"] += 1
+            except Exception as e:
+                print(f"Erreur déplacement {move['old']}: {e}")
+                stats["errors"] += 1
+            if number % 100 == 0:
+                self._write_journal(moves)
+            if on_progress:
+                on_progress(number, len(moves))
+        self.pipeline.save()
+        for folder in sorted({os.path.dirname(move["old"]) for move in moves if move["done"] is True}, reverse=True):
+            try:
+                os.removedirs(folder)  # Dossiers de sous-catégories désormais vides
+            except OSError:
+                pass
+        if stats["errors"]:
+            self._write_journal(moves)
+        else:
+            os.remove(REORG_JOURNAL_FILE)
+        return stats
+
+    def recover(self):
+        """Termine une réorganisation interrompue"""
+        if not os.path.exists(REORG_JOURNAL_FILE):
+            return None
+        with open(REORG_JOURNAL_FILE, "r", encoding="utf-8") as f:
+            moves = json.load(f)
+        return self.run(moves)
+
+class DeferredClassifier:
+    """File persistante des documents classés provisoirement (API lente ou indisponible) : la
+    classification IA est reprise en arrière-plan et le fichier déplacé à sa place définitive"""
+    SAVE_EVERY = 50
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.lock = threading.Lock()
+        self.entries = self.load()
+        self.dirty = False
+
+    @staticmethod
+    def load():
+        if not os.path.exists(DEFERRED_QUEUE_FILE):
+            return {}
+        try:
+            with open(DEFERRED_QUEUE_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Erreur chargement file IA en attente: {e}")
+            return {}
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            try:
+                with open(DEFERRED_QUEUE_FILE + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(self.entries, f, ensure_ascii=False)
+                os.replace(DEFERRED_QUEUE_FILE + ".tmp", DEFERRED_QUEUE_FILE)
+                self.dirty = False
+            except Exception as e:
+                print(f"Erreur sauvegarde file IA en attente: {e}")
+
+    def enqueue(self, file_hash):
+        with self.lock:
+            if file_hash not in self.entries:
+                self.entries[file_hash] = {"queued_at": datetime.now().isoformat(timespec="seconds"), "attempts": 0}
+                self.dirty = True
+
+    def pending(self):
+        return len(self.entries)
+
+    def requeue_from_index(self):
+        """Ajoute les fiches provisoires absentes de la file (segments fusionnés, réorganisation)"""
+        keys = {key for root in self.pipeline.archives.online()
+                for key, record in self.pipeline.archive_records(root).items() if record.get("method") == "provisoire"}
+        for key in keys:
+            self.enqueue(key)
+        return len(keys)
+
+    def _resolve(self, file_hash, entry):
+        """Déplacement vers la classification IA ; {} si rien à déplacer, None si l'IA ne répond pas"""
+        if entry.get("move"):
+            return entry["move"]  # Déplacement interrompu : repris tel quel
+        with self.pipeline.index_lock:
+            record = self.pipeline.archives.lookup(file_hash)
+            record = dict(record) if record is not None else None
+        if record is None or record.get("method") != "provisoire":
+            return {}  # Supprimé ou reclassé entre-temps
+        category, subcategory, method = ArchiveReorganizer(self.pipeline)._reclassify(
+            file_hash, record, None, defer=False)
+        if method == "provisoire":
+            return None
+        if (category, subcategory) == (record.get("category"), record.get("subcategory")):
+            with self.pipeline.index_lock:
+                if file_hash in self.pipeline.file_index:
+                    self.pipeline.file_index[file_hash] = dict(self.pipeline.file_index[file_hash], method=method)
+            return {}
+        return ArchiveReorganizer.move_for(file_hash, record, category, subcategory, method)
+
+    def drain(self, on_move=None, stop_event=None):
+        """Reclasse les documents en attente ; s'arrête dès que l'IA ne répond plus"""
+        stats = {"classified": 0, "moved": 0, "waiting": 0, "errors": 0}
+        engine = self.pipeline.classification_engine
+        with self.lock:
+            keys = list(self.entries)
+        if not engine.api_available:
+            stats["waiting"] = len(keys)
+            return stats
+        reorganizer = ArchiveReorganizer(self.pipeline)
+        moved_from = set()
+        for number, file_hash in enumerate(keys, start=1):
+            if stop_event is not None and stop_event.is_set():
+                stats["waiting"] = len(keys) - number + 1
+                break
+            entry = self.entries.get(file_hash)
+            if entry is None:
+                continue
+            try:
+                move = self._resolve(file_hash, entry)
+                if move is None:
+                    with self.lock:
+                        entry["attempts"] = entry.get("attempts", 0) + 1
+                        self.dirty = True
+                    stats["waiting"] = len(keys) - number + 1
+                    break
+                if move:
+                    with self.lock:
+                        entry["move"] = move
+                        self.dirty = True
+                    self.save()  # Journal : le déplacement sera terminé même après une interruption
+                    reorganizer._apply(move)
+                    if move["done"] is True:
+                        stats["moved"] += 1
+                        moved_from.add(os.path.dirname(move["old"]))
+                        if on_move:
+                            on_move(move)
+                stats["classified"] += 1
+                with self.lock:
+                    self.entries.pop(file_hash, None)
+                    self.dirty = True
+            except Exception as e:
+                print(f"Erreur classification différée {file_hash}: {e}")
+                stats["errors"] += 1
+            if number % self.SAVE_EVERY == 0:
+                self.pipeline.save()
+        self.pipeline.save()
+        for folder in sorted(moved_from, reverse=True):
+            try:
+                os.removedirs(folder)  # Dossiers provisoires désormais vides
+            except OSError:
+                pass
+        return stats
+
+    def run_forever(self, stop_event, on_move=None):
+        """Boucle d'arrière-plan : relance la file dès que l'API répond de nouveau"""
+        self.requeue_from_index()
+        while not stop_event.is_set():
+            if self.entries:
+                stats = self.drain(on_move, stop_event)
+                if stats["classified"]:
+                    print(f"Classification IA différée: {stats}")
+            stop_event.wait(self.pipeline.config.get("deferred_retry_s", 60))
+
+class ArchivePacker:
+    """Niveau de stockage en packs : rangement des petits documents déjà archivés, compactage des
+    packs et extraction vers l'arborescence catégorie / sous-catégorie"""
+    SAVE_EVERY = 500
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    @staticmethod
+    def eligible(config, path, size, force=False):
+        """Document à ranger dans un pack (petit, hors MP3/MP4 dont l'empreinte porte sur la piste seule
+        et hors images, dont l'index perceptuel désigne le fichier archivé)"""
+        if not (force or config.get("pack_storage", False)):
+            return False
+        return size is not None and size <= config.get("pack_max_document_kb", 256) * 1024 \
+            and not path.lower().endswith(MediaPayloadHasher.EXTENSIONS + IMAGE_EXTENSIONS)
+
+    @staticmethod
+    def archive_root(path):
+        # Arborescence d'archive : <destination>/<catégorie>/<sous-catégorie>/<fichier>
+        return os.path.dirname(os.path.dirname(os.path.dirname(path)))
+
+    def pack_existing(self, on_progress=None):
+        """Range dans des packs les petits documents de l'archive encore stockés un par un"""
+        pipeline = self.pipeline
+        pipeline.load_archives()
+        with pipeline.index_lock:
+            candidates = [(key, dict(record)) for key, record in pipeline.file_index.items()
+                          if isinstance(record, dict) and not record.get("pack") and not record.get("content_hash")
+                          and self.eligible(pipeline.config, record["path"], record.get("size"), force=True)]
+        stats = {"packed": 0, "missing": 0, "errors": 0}
+        folders = set()
+        for number, (key, record) in enumerate(candidates, start=1):
+            path = record["path"]
+            if not os.path.exists(path):
+                stats["missing"] += 1
+                continue
+            try:
+                with pipeline.io.acquire(path):
+                    entry = pipeline.pack_store(self.archive_root(path)).append(key, path)
+                # Relecture avant suppression : le pack doit restituer le document à l'identique
+                if pipeline.hasher.key_for_entry(dict(record, pack=entry), record.get("algo", "sha256")) != key:
+                    raise ValueError("empreinte différente après rangement")
+                with pipeline.index_lock:
+                    if key in pipeline.file_index:
+                        pipeline.file_index[key] = dict(pipeline.file_index[key], pack=entry)
+                os.remove(path)
+                folders.add(os.path.dirname(path))
+                stats["packed"] += 1
+            except Exception as e:
+                print(f"Erreur rangement en pack {path}: {e}")
+                stats["errors"] += 1
+            if number % self.SAVE_EVERY == 0:
+                pipeline.save()
+            if on_progress:
+                on_progress(number, len(candidates))
+        pipeline.save()
+        for folder in sorted(folders, reverse=True):
+            try:
+                os.removedirs(folder)
+            except OSError:
+                pass
+        return stats
+
+    def compact(self, on_progress=None):
+        """Réécrit les packs dont la part de blobs inutilisés (documents supprimés ou remplacés)
+        dépasse 'pack_compact_ratio' ; le pack en cours de remplissage n'est jamais compacté"""
+        pipeline = self.pipeline
+        pipeline.load_archives()
+        live = {}  # Pack -> {clé: position}
+        with pipeline.index_lock:
+            for key, record in pipeline.file_index.items():
+                if isinstance(record, dict) and record.get("pack"):
+                    live.setdefault(record["pack"]["file"], {})[key] = record["pack"]
+        directories = {os.path.dirname(path) for path in live} | \
+            {store.directory for store in pipeline.pack_stores.values()}
+        ratio = pipeline.config.get("pack_compact_ratio", 0.3)
+        stats = {"packs": 0, "rewritten": 0, "reclaimed_bytes": 0}
+        packs = sorted(os.path.join(directory, name) for directory in directories if os.path.isdir(directory)
+                       for name in os.listdir(directory) if name.endswith(PACK_EXTENSION))
+        for number, path in enumerate(packs, start=1):
+            stats["packs"] += 1
+            store = pipeline.pack_store(os.path.dirname(os.path.dirname(path)))
+            with store.lock:
+                active = store.active()
+            total = os.path.getsize(path)
+            used = sum(PackStore.blob_size(key, entry) for key, entry in live.get(path, {}).items())
+            if path == active or not total or 1 - used / total < ratio:
+                continue
+            moved = {}
+            for key, entry in live.get(path, {}).items():
+                moved[key] = store.append_bytes(key, PackStore.read(entry), entry.get("mtime"), exclude=path)
+            with pipeline.index_lock:
+                for key, entry in moved.items():
+                    record = pipeline.file_index.get(key)
+                    if isinstance(record, dict) and record.get("pack") == live[path][key]:
+                        pipeline.file_index[key] = dict(record, pack=entry)
+            pipeline.save()  # Index à jour avant la suppression de l'ancien pack
+            PackStore.release(path)
+            os.remove(path)
+            stats["rewritten"] += 1
+            stats["reclaimed_bytes"] += total - used
+            if on_progress:
+                on_progress(number, len(packs))
+        return stats
+
+    def extract(self, dest_dir, category=None, include_loose=False, in_place=False):
+        """Restitue les documents en fichiers : vue par catégorie dans 'dest_dir', ou retour à leur
+        emplacement d'origine dans l'archive ('in_place', fin du stockage en packs)"""
+        pipeline = self.pipeline
+        pipeline.load_archives()
+        with pipeline.index_lock:
+            records = [(key, dict(record)) for key, record in pipeline.file_index.items() if isinstance(record, dict)
+                       and (category is None or record.get("category") == category)]
+        stats = {"extracted": 0, "errors": 0}
+        for key, record in records:
+            pack = record.get("pack")
+            if not pack and not include_loose:
+                continue
+            if in_place:
+                target = record["path"]
+            else:
+                target = os.path.join(dest_dir, os.path.relpath(record["path"], self.archive_root(record["path"])))
+            try:
+                if pack:
+                    PackStore.extract(pack, target)
+                elif not in_place:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.copy2(record["path"], target)
+                if in_place and pack:
+                    with pipeline.index_lock:
+                        if key in pipeline.file_index:
+                            restored = dict(pipeline.file_index[key])
+                            restored.pop("pack", None)
+                            pipeline.file_index[key] = restored
+                stats["extracted"] += 1
+            except Exception as e:
+                print(f"Erreur extraction {record['path']}: {e}")
+                stats["errors"] += 1
+        if in_place:
+            pipeline.save()
+        return stats
+
+class TokenBucket:
+    """Limiteur de débit partagé entre threads (octets par seconde)"""
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait_time = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait_time:
+            time.sleep(wait_time)
+
+class IntegrityScrubber:
+    """Vérification continue de l'archive : re-hachage incrémental des fiches d'index sous
+    limite de débit, reprise là où la session précédente s'est arrêtée"""
+    BATCH_SIZE = 100
+
+    def __init__(self, pipeline, config=None):
+        config = config if config is not None else pipeline.config
+        self.pipeline = pipeline
+        self.bucket = TokenBucket(config.get("scrub_bandwidth_mb_s", 20) * 1024 * 1024)
+        self.workers = max(1, config.get("scrub_workers", 2))
+        self.interval = config.get("scrub_interval_h", 24) * 3600
+        self.running = threading.Event()
+        self.running.set()
+        self.stopped = threading.Event()
+        # Blocs lus un à un par le thread de vérification : le disque est rendu entre deux blocs
+        self.hasher = ContentHasher(dict(pipeline.config, hash_workers=1))
+        self.state = self.load_state()
+        self.keys = None  # Empreintes de l'archive en cours de vérification, triées une seule fois
+        self.keys_root = None
+        self.records = {}  # Fiches de cette archive lues au début de son parcours
+
+    @staticmethod
+    def load_state():
+        state = {"archive": "", "cursor": "", "passes": 0, "pass_started": None, "last_pass": None,
+                 "checked": 0, "issues": {"missing": {}, "modified": {}, "orphaned": []}}
+        if os.path.exists(SCRUB_STATE_FILE):
+            try:
+                with open(SCRUB_STATE_FILE, "r", encoding="utf-8") as f:
+                    state.update(json.load(f))
+            except Exception as e:
+                print(f"Erreur chargement état de vérification: {e}")
+        return state
+
+    def save_state(self):
+        try:
+            with open(SCRUB_STATE_FILE + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=4, ensure_ascii=False)
+            os.replace(SCRUB_STATE_FILE + ".tmp", SCRUB_STATE_FILE)
+        except Exception as e:
+            print(f"Erreur sauvegarde état de vérification: {e}")
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def stop(self):
+        self.stopped.set()
+        self.running.set()
+
+    def _check(self, key, record):
+        """Vérifie une fiche : (empreinte, 'ok' / 'missing' / 'modified')"""
+        self.running.wait()
+        pack = record.get("pack")
+        path = pack["file"] if pack else record["path"]
+        if not os.path.exists(path):
+            return key, "missing"
+        expected = record.get("content_hash", key)
+        gate = ExitStack()
+        
+        def throttle(amount):
+            # Disque rendu entre deux blocs pendant l'attente de débit ou la pause (ingestion prioritaire)
+            gate.close()
+            self.bucket.consume(amount)
+            self.running.wait()
+            gate.enter_context(self.pipeline.io.acquire(path))
+        
+        # Un disque rotatif n'est pas lu par plusieurs threads à la fois
+        gate.enter_context(self.pipeline.io.acquire(path))
+        try:
+            actual = self.hasher.key_for_entry(record, record.get("algo", "sha256"), throttle=throttle)
+        finally:
+            gate.close()
+        return key, "ok" if actual == expected else "modified"
+
+    def _record(self, root, key):
+        """Fiche à vérifier (appelant : verrou de l'index) : version à jour si l'archive est chargée"""
+        record = self.pipeline.file_index.get(key)
+        if record is not None and ArchiveRegistry.root_of(record["path"]) == root:
+            return dict(record)
+        if record is None and root in self.pipeline.archives.loaded:
+            return None  # Fiche retirée depuis le début du parcours de l'archive
+        return self.records.get(key)
+
+    def next_batch(self):
+        """Fiches suivant le curseur, archive par archive (ordre des racines puis des empreintes),
+        ou liste vide en fin de passe ; les index des archives ne sont pas chargés"""
+        while True:
+            root = self.state["archive"]
+            if self.keys is None or self.keys_root != root:
+                roots = sorted(self.pipeline.archives.online())
+                if root not in roots:
+                    # Début de passe, ou archive détachée depuis la session précédente
+                    following = [other for other in roots if other > root]
+                    if not following:
+                        return []
+                    root = following[0]
+                    self.state.update(archive=root, cursor="")
+                self.records = self.pipeline.archive_records(root)
+                self.keys, self.keys_root = sorted(self.records), root
+            start = bisect.bisect_right(self.keys, self.state["cursor"])
+            while start < len(self.keys):
+                keys = self.keys[start:start + self.BATCH_SIZE]
+                start += self.BATCH_SIZE
+                with self.pipeline.index_lock:
+                    batch = [(key, self._record(root, key)) for key in keys]
+                batch = [(key, record) for key, record in batch if record is not None]
+                if batch:
+                    return batch
+            following = [other for other in sorted(self.pipeline.archives.online()) if other > root]
+            if not following:
+                return []
+            self.state.update(archive=following[0], cursor="")
+
+    def step(self, executor):
+        """Vérifie un lot ; renvoie False quand la passe est terminée"""
+        if not self.state["pass_started"]:
+            self.state["pass_started"] = datetime.now().isoformat(timespec="seconds")
+        batch = self.next_batch()
+        if not batch:
+            self.finish_pass()
+            return False
+        records = dict(batch)
+        issues = self.state["issues"]
+        for key, outcome in executor.map(lambda item: self._check(*item), batch):
+            for kind in ("missing", "modified"):
+                issues[kind].pop(key, None)
+            if outcome != "ok":
+                issues[outcome][key] = records[key]["path"]
+            self.state["checked"] += 1
+        self.state["cursor"] = batch[-1][0]
+        self.save_state()
+        return True
+
+    def find_orphans(self):
+        """Fichiers présents dans une archive mais absents de son index"""
+        orphans = []
+        for root in sorted(self.pipeline.archives.online()):
+            paths = {DuplicateManager.entry_path(record) for record in self.pipeline.archive_records(root).values()}
+            scanner = FolderScanner(extensions=("",), skip_patterns=[PACK_DIR_NAME, ARCHIVE_META_DIR])
+            for path, _, _ in scanner.scan(root):
+                if path not in paths:
+                    orphans.append(path)
+        return orphans
+
+    def finish_pass(self):
+        self.state["issues"]["orphaned"] = self.find_orphans()
+        self.keys, self.records = None, {}  # Fiches ajoutées pendant la passe : vérifiées à la suivante
+        self.state.update(archive="", cursor="", passes=self.state["passes"] + 1, pass_started=None,
+                          last_pass=datetime.now().isoformat(timespec="seconds"))
+        self.save_state()
+
+    def report(self):
+        issues = self.state["issues"]
+        return {"passes": self.state["passes"], "last_pass": self.state["last_pass"],
+                "checked": self.state["checked"], "cursor": self.state["cursor"],
+                "missing": len(issues["missing"]), "modified": len(issues["modified"]),
+                "orphaned": len(issues["orphaned"])}
+
+    def run_pass(self):
+        """Termine la passe en cours (ligne de commande)"""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while self.step(executor) and not self.stopped.is_set():
+                pass
+        return self.report()
+
+    def run_forever(self):
+        """Boucle d'arrière-plan : passes successives espacées de 'scrub_interval_h'"""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while not self.stopped.is_set():
+                last_pass = self.state["last_pass"]
+                if not self.state["pass_started"] and last_pass and \
+                        time.time() - datetime.fromisoformat(last_pass).timestamp() < self.interval:
+                    self.stopped.wait(60)
+                    continue
+                self.step(executor)
+
+# ==================== SERVICE HTTP ====================
+class IngestionService:
+    """Service HTTP local d'ingestion (postes de numérisation, scripts) : dépôt de fichiers en flux ou
+    de chemins, traités par micro-lots en arrière-plan ; chaque dépôt reçoit un identifiant de suivi"""
+    CHUNK_SIZE = 1024 * 1024
+    KEEP_BATCHES = 50  # Micro-lots terminés gardés en mémoire (les autres sont relus sur disque)
+
+    def __init__(self, pipeline, dest_dir, delete_source=False):
+        config = pipeline.config
+        self.pipeline = pipeline
+        self.dest_dir = os.path.abspath(dest_dir)
+        self.delete_source = delete_source
+        self.token = config.get("service_token", "")
+        if not self.token:
+            # Sans jeton, tout processus local (ou page web) pourrait faire archiver, voire supprimer, des fichiers
+            raise ValueError("Jeton du service requis ('service_token')")
+        self.submission_ttl = config.get("service_submission_ttl_h", 24) * 3600
+        self.batch_max_files = config.get("service_batch_max_files", 1000)
+        self.batch_max_s = config.get("service_batch_max_s", 60)
+        self.batch_idle_s = config.get("service_batch_idle_s", 1.0)
+        self.max_upload = config.get("service_max_upload_mb", 512) * 1024 * 1024
+        self.incoming = queue.Queue()  # (dépôt, chemin) en attente d'un micro-lot
+        self.submissions = {}  # Dépôt -> {"created", "files", "batches": {chemin: lot}, "spool", "finished"}
+        self.batches = {}  # Identifiant de lot -> JobManifest
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.server = None
+
+    # --- Dépôts
+    def submit(self, paths, spool=None):
+        """Enregistre un dépôt (fichiers ou dossiers) ; retourne (identifiant, nombre de fichiers)"""
+        files = []
+        for path in paths:
+            path = os.path.abspath(path)
+            if os.path.isdir(path):
+                scanner = FolderScanner(SUPPORTED_EXTENSIONS, self.pipeline.config.get("scan_skip_patterns", []),
+                                        skip_paths=[self.dest_dir])
+                files.extend(found for found, _, _ in scanner.scan(path))
+            elif os.path.isfile(path):
+                files.append(path)
+            else:
+                raise ValueError(f"Chemin introuvable: {path}")
+        submission_id = uuid.uuid4().hex[:12]
+        self._expire()
+        with self.lock:
+            self.submissions[submission_id] = {"created": datetime.now().isoformat(timespec="seconds"),
+                                               "files": files, "batches": {}, "spool": spool}
+        for path in files:
+            self.incoming.put((submission_id, path))
+        return submission_id, len(files)
+
+    def receive(self, chunks, filename):
+        """Écrit un fichier reçu en flux dans le dossier de dépôt ; retourne (chemin, dossier de dépôt)"""
+        name = re.sub(r'[\\/:*?"<>|\x00-\x1f]', "_", os.path.basename(filename or "")).strip(". ") or "document"
+        spool = os.path.abspath(os.path.join(SERVICE_SPOOL_DIR, uuid.uuid4().hex))
+        os.makedirs(spool)
+        path = os.path.join(spool, name)  # Nom d'origine conservé : il sert au classement
+        received = 0
+        try:
+            with open(path, "wb") as f:
+                for chunk in chunks:
+                    received += len(chunk)
+                    if received > self.max_upload:
+                        raise ValueError(f"Fichier trop volumineux (> {self.max_upload // 1024 ** 2} Mo)")
+                    f.write(chunk)
+        except Exception:
+            shutil.rmtree(spool, ignore_errors=True)
+            raise
+        return path, spool
+
+    # --- Micro-lots
+    def _feed(self, job, item):
+        """Fichiers d'un micro-lot, jusqu'à une pause des dépôts ou au nombre / à la durée maximum"""
+        started = time.monotonic()
+        count = 0
+        while True:
+            submission_id, path = item
+            with self.lock:
+                self.submissions[submission_id]["batches"][path] = job.job_id
+            with job.lock:
+                job.data.setdefault("submissions", {}).setdefault(submission_id, []).append(path)
+            job.add_files([path])
+            yield path
+            count += 1
+            if count >= self.batch_max_files or time.monotonic() - started >= self.batch_max_s:
+                return
+            try:
+                item = self.incoming.get(timeout=self.batch_idle_s)
+            except queue.Empty:
+                return
+
+    def _register(self, job):
+        with self.lock:
+            self.batches[job.job_id] = job
+            finished = [job_id for job_id, batch in self.batches.items() if batch.status != "running"]
+            for job_id in finished[:max(0, len(self.batches) - self.KEEP_BATCHES)]:
+                del self.batches[job_id]
+
+    def _cleanup(self, job):
+        """Supprime les fichiers reçus en flux une fois leur micro-lot terminé ; date la fin des dépôts"""
+        for submission_id in job.data.get("submissions", {}):
+            with self.lock:
+                submission = self.submissions.get(submission_id)
+            if not submission or not all(path in submission["batches"] for path in submission["files"]):
+                continue
+            if submission.get("spool"):
+                shutil.rmtree(submission["spool"], ignore_errors=True)
+            batches = [self._batch(job_id) for job_id in set(submission["batches"].values())]
+            if all(batch is None or batch.status != "running" for batch in batches):
+                with self.lock:
+                    submission["finished"] = time.monotonic()
+        self._expire()
+
+    def _expire(self):
+        """Oublie les dépôts terminés depuis 'service_submission_ttl_h' (leur suivi est relu dans les manifestes)"""
+        now = time.monotonic()
+        with self.lock:
+            expired = [submission_id for submission_id, submission in self.submissions.items()
+                       if submission.get("finished") is not None and now - submission["finished"] > self.submission_ttl]
+            for submission_id in expired:
+                del self.submissions[submission_id]
+
+    def resume_interrupted(self):
+        """Reprend les micro-lots interrompus par un arrêt du service"""
+        for job in JobManifest.list_jobs():
+            if job.data.get("origin") != "service" or job.status != "running":
+                continue
+            for submission_id, paths in job.data.get("submissions", {}).items():
+                with self.lock:
+                    self.submissions.setdefault(submission_id, {
+                        "created": job.data.get("created"), "files": list(paths),
+                        "batches": {path: job.job_id for path in paths}, "spool": None})
+            self._register(job)
+            print(f"Reprise du lot {job.job_id}")
+            self.pipeline.resume_job(job)
+            self._cleanup(job)
+
+    def _dispatch(self):
+        self.resume_interrupted()
+        while not self.stop_event.is_set():
+            try:
+                item = self.incoming.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            job = JobManifest.create([], self.dest_dir, self.delete_source,
+                                     self.pipeline.config.get("job_checkpoint_interval_s", 2))
+            job.data["origin"] = "service"
+            self._register(job)
+            try:
+                # Un seul lot en flux : l'ordonnanceur mène en parallèle les fichiers de tous les clients
+                self.pipeline.process_batch(self._feed(job, item), self.dest_dir, self.delete_source, job=job)
+            except Exception as e:
+                print(f"Erreur micro-lot {job.job_id}: {e}")
+            self._cleanup(job)
+
+    # --- Suivi
+    def _batch(self, job_id):
+        with self.lock:
+            job = self.batches.get(job_id)
+        if job is None:
+            job = JobManifest.load(os.path.join(JOBS_DIR, f"{job_id}.json")) \
+                if os.path.exists(os.path.join(JOBS_DIR, f"{job_id}.json")) else None
+        return job
+
+    def _find_submission(self, submission_id):
+        """Dépôt d'une session précédente, retrouvé dans les manifestes de lots"""
+        files, batches, created = [], {}, None
+        for job in JobManifest.list_jobs():
+            paths = job.data.get("submissions", {}).get(submission_id)
+            if paths:
+                files.extend(paths)
+                batches.update((path, job.job_id) for path in paths)
+                created = job.data.get("created")  # Lots listés du plus récent au plus ancien
+        if not files:
+            return None
+        return {"created": created, "files": files, "batches": batches, "spool": None}
+
+    def status(self, submission_id, details=False):
+        with self.lock:
+            submission = self.submissions.get(submission_id)
+        if submission is None:
+            submission = self._find_submission(submission_id)
+            if submission is None:
+                return None
+        counts = {"total": len(submission["files"]), "queued": 0, "running": 0, "archived": 0,
+                  "duplicates": 0, "errors": 0}
+        files = []
+        jobs = {}  # Chaque micro-lot n'est cherché (ou relu sur disque) qu'une fois par appel
+        for path in submission["files"]:
+            job_id = submission["batches"].get(path)
+            if job_id and job_id not in jobs:
+                jobs[job_id] = self._batch(job_id)
+            job = jobs.get(job_id)
+            state = {}
+            if job is not None:
+                with job.lock:
+                    state = dict(job.files.get(path, {}))
+            result = state.get("result") or {}
+            if job is None:
+                outcome = "queued"
+            elif state.get("error") or "ERREUR" in result.get("status", ""):
+                outcome = "errors"
+            elif state.get("stage") == "duplicate":
+                outcome = "duplicates"
+            elif state.get("stage") == "done":
+                outcome = "archived"
+            else:
+                outcome = "running" if job.status == "running" else "errors"
+            counts[outcome] += 1
+            if details:
+                files.append({"source": path, "batch": job_id, "stage": state.get("stage", "pending"),
+                              "error": state.get("error"), "category": result.get("category"),
+                              "subcategory": result.get("subcategory"), "status": result.get("status"),
+                              "path": result.get("path")})
+        if counts["queued"] or counts["running"]:
+            status = "queued" if counts["queued"] == counts["total"] else "running"
+        else:
+            status = "completed_with_errors" if counts["errors"] else "completed"
+        report = {"job_id": submission_id, "created": submission["created"], "status": status, "counts": counts}
+        if details:
+            report["files"] = files
+        return report
+
+    def health(self):
+        return {"status": "ok", "queued": self.incoming.qsize(), "ai_pending": self.pipeline.deferred.pending(),
+                "api": self.pipeline.classification_engine.breaker.state}
+
+    # --- Serveur
+    def start(self, host="127.0.0.1", port=8765):
+        """Démarre le serveur et le traitement en arrière-plan ; retourne l'adresse effective"""
+        handler = type("Handler", (IngestionRequestHandler,), {"service": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self._dispatch, daemon=True).start()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address
+
+    def stop(self):
+        self.stop_event.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+class IngestionRequestHandler(BaseHTTPRequestHandler):
+    """Routes du service d'ingestion (réponses JSON) :
+    POST /jobs (chemins), POST /jobs/bulk (un chemin par ligne), POST /upload?filename=... (fichier en flux),
+    GET /jobs, GET /jobs/<id>, GET /jobs/<id>/results, GET /health"""
+    service = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, code, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if code >= 400:
+            self.send_header("Connection", "close")  # Corps de requête éventuellement non lu
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        if self.headers.get("Origin") is not None:
+            # Requête émise par une page web : jamais légitime pour ce service local
+            self._send_json(403, {"error": "Requêtes de navigateur refusées"})
+            return False
+        if not secrets.compare_digest(self.headers.get("X-GED-Token", "").encode("utf-8"),
+                                      self.service.token.encode("utf-8")):
+            self._send_json(401, {"error": "Jeton invalide"})
+            return False
+        return True
+
+    def _body_chunks(self):
+        """Corps de la requête par morceaux (Content-Length ou Transfer-Encoding: chunked)"""
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return
+                remaining = size
+                while remaining:
+                    chunk = self.rfile.read(min(IngestionService.CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise ValueError("Envoi interrompu")
+                    remaining -= len(chunk)
+                    yield chunk
+                self.rfile.readline()
+        length = self.headers.get("Content-Length")
+        if length is None:
+            raise ValueError("Content-Length ou Transfer-Encoding: chunked requis")
+        remaining = int(length)
+        while remaining:
+            chunk = self.rfile.read(min(IngestionService.CHUNK_SIZE, remaining))
+            if not chunk:
+                raise ValueError("Envoi interrompu")
+            remaining -= len(chunk)
+            yield chunk
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        parts = [part for part in urlparse(self.path).path.split("/") if part]
+        if parts == ["health"]:
+            self._send_json(200, self.service.health())
+        elif parts == ["jobs"]:
+            with self.service.lock:
+                submission_ids = list(self.service.submissions)
+            self._send_json(200, {"jobs": [self.service.status(sid) for sid in submission_ids]})
+        elif len(parts) in (2, 3) and parts[0] == "jobs" and parts[2:] in ([], ["results"]):
+            report = self.service.status(parts[1], details=len(parts) == 3)
+            if report is None:
+                self._send_json(404, {"error": "Dépôt inconnu"})
+            else:
+                self._send_json(200, report)
+        else:
+            self._send_json(404, {"error": "Route inconnue"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        try:
+            if parts == ["jobs"]:
+                payload = json.loads(b"".join(self._body_chunks()) or b"{}")
+                paths = payload.get("paths")
+                if not isinstance(paths, list) or not paths:
+                    raise ValueError("'paths' : liste de chemins attendue")
+                submission_id, count = self.service.submit(paths)
+            elif parts == ["jobs", "bulk"]:
+                # Liste volumineuse : lue en flux, un chemin par ligne
+                paths, pending = [], b""
+                for chunk in self._body_chunks():
+                    lines = (pending + chunk).split(b"\n")
+                    pending = lines.pop()
+                    paths.extend(line.decode("utf-8").strip() for line in lines)
+                paths.append(pending.decode("utf-8").strip())
+                paths = [path for path in paths if path]
+                if not paths:
+                    raise ValueError("Aucun chemin reçu")
+                submission_id, count = self.service.submit(paths)
+            elif parts == ["upload"]:
+                filename = parse_qs(url.query).get("filename", [""])[0] or self.headers.get("X-Filename", "")
+                if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                    raise ValueError(f"Type de fichier non pris en charge: {filename or '(sans nom)'}")
+                path, spool = self.service.receive(self._body_chunks(), filename)
+                submission_id, count = self.service.submit([path], spool=spool)
+            else:
+                self._send_json(404, {"error": "Route inconnue"})
+                return
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            print(f"Erreur service d'ingestion: {e}")
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(202, {"job_id": submission_id, "files": count, "status_url": f"/jobs/{submission_id}"})
 
 # ==================== INTERFACE UTILISATEUR ====================
 class TypologyWindow(ctk.CTkToplevel):
@@ -461,6 +5275,7 @@ class TypologyWindow(ctk.CTkToplevel):
         self.config = config
         self.on_save = on_save
         self.parent_app = parent
+        self.changes = []  # Renommages / fusions / suppressions à répercuter sur l'archive
         self._build_ui()
         self.draw_items()
 
@@ -503,8 +5318,9 @@ class TypologyWindow(ctk.CTkToplevel):
 
     def refresh_display(self):
         """Rafraîchit l'affichage avec les dernières données"""
-        # Recharger la configuration actuelle
+        # Recharger la configuration actuelle (les modifications non sauvegardées sont abandonnées)
         self.config = ConfigManager.load_config()
+        self.changes = []
         self.draw_items()
 
     def draw_items(self):
@@ -622,7 +5438,10 @@ class TypologyWindow(ctk.CTkToplevel):
             if new_name and new_name != old_name:
                 typology = self.config.get("typology", {})
                 if old_name in typology:
-                    typology[new_name] = typology.pop(old_name)
+                    # Nom existant : fusion des deux catégories
+                    merged = typology.get(new_name, [])
+                    typology[new_name] = merged + [sub for sub in typology.pop(old_name) if sub not in merged]
+                    self.changes.append({"op": "rename_category", "from": old_name, "to": new_name})
                     self.draw_items()
                     messagebox.showinfo("Succès", f"Catégorie renommée: '{old_name}' → '{new_name}'", parent=self)
 
@@ -633,6 +5452,7 @@ class TypologyWindow(ctk.CTkToplevel):
             typology = self.config.get("typology", {})
             if category in typology:
                 del typology[category]
+                self.changes.append({"op": "delete_category", "category": category})
                 self.draw_items()
                 messagebox.showinfo("Succès", f"Catégorie '{category}' supprimée", parent=self)
 
@@ -657,7 +5477,11 @@ class TypologyWindow(ctk.CTkToplevel):
             typology = self.config.get("typology", {})
             if category in typology and old_sub in typology[category]:
                 idx = typology[category].index(old_sub)
-                typology[category][idx] = new_sub
+                if new_sub in typology[category]:
+                    typology[category].pop(idx)  # Fusion avec la sous-catégorie existante
+                else:
+                    typology[category][idx] = new_sub
+                self.changes.append({"op": "rename_subcategory", "category": category, "from": old_sub, "to": new_sub})
                 self.draw_items()
                 messagebox.showinfo("Succès", f"Sous-catégorie renommée: '{old_sub}' → '{new_sub}'", parent=self)
 
@@ -668,15 +5492,249 @@ class TypologyWindow(ctk.CTkToplevel):
             typology = self.config.get("typology", {})
             if category in typology and subcategory in typology[category]:
                 typology[category].remove(subcategory)
+                self.changes.append({"op": "delete_subcategory", "category": category, "subcategory": subcategory})
                 self.draw_items()
                 messagebox.showinfo("Succès", f"Sous-catégorie '{subcategory}' supprimée", parent=self)
 
     def save_and_close(self):
         ConfigManager.save_config(self.config)
-        if self.on_save:
-            self.on_save()
+        changes = self.changes
+        self.changes = []
         messagebox.showinfo("Sauvegarde", "Plan de classement sauvegardé avec succès!", parent=self)
         self.destroy()
+        if self.on_save:
+            self.on_save(changes)
+
+class JobsWindow(ctk.CTkToplevel):
+    """Panneau des traitements : en cours, interrompus et échoués"""
+    STATUS_LABELS = {"running": "⏳ En cours / interrompu", "completed": "✅ Terminé", "failed": "❌ Avec erreurs"}
+
+    def __init__(self, parent, on_resume, active_jobs=()):
+        super().__init__(parent)
+        self.title("Traitements")
+        self.geometry("820x500")
+        self.resizable(True, True)
+        self.on_resume = on_resume
+        self.active_jobs = active_jobs  # Lots en cours dans cette session : ni reprise ni suppression
+        
+        title_frame = ctk.CTkFrame(self, fg_color="transparent")
+        title_frame.pack(fill="x", padx=10, pady=15)
+        ctk.CTkLabel(title_frame, text="🗂️ Traitements", 
+                    font=("Arial", 20, "bold")).pack(side="left", padx=5)
+        ctk.CTkButton(title_frame, text="🔄 Rafraîchir", width=100, height=30,
+                     command=self.draw_items).pack(side="right", padx=5)
+        
+        self.scroll = ctk.CTkScrollableFrame(self)
+        self.scroll.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        self.scroll.grid_columnconfigure(1, weight=1)
+        self.draw_items()
+
+    def draw_items(self):
+        for widget in self.scroll.winfo_children():
+            widget.destroy()
+        
+        jobs = JobManifest.list_jobs()
+        if not jobs:
+            ctk.CTkLabel(self.scroll, text="Aucun traitement enregistré", 
+                        font=("Arial", 16), text_color="#95a5a6").grid(row=0, column=0, pady=50)
+            return
+        
+        for row, job in enumerate(jobs):
+            progress = job.progress()
+            done = sum(progress.get(stage, 0) for stage in JobManifest.FINAL_STAGES)
+            active = job.job_id in self.active_jobs
+            status_text = "⏳ En cours" if active else self.STATUS_LABELS.get(job.status, job.status)
+            ctk.CTkLabel(self.scroll, text=status_text,
+                        anchor="w", width=170).grid(row=row, column=0, padx=5, pady=3, sticky="w")
+            ctk.CTkLabel(self.scroll, text=f"{job.job_id}  •  {done}/{progress['total']} fichiers"
+                                           f"  •  {progress['errors']} erreur(s)\n{job.dest_dir}",
+                        anchor="w", justify="left").grid(row=row, column=1, padx=5, pady=3, sticky="w")
+            
+            btn_frame = ctk.CTkFrame(self.scroll, fg_color="transparent")
+            btn_frame.grid(row=row, column=2, padx=5, pady=3)
+            if active:
+                continue
+            if job.status != "completed":
+                ctk.CTkButton(btn_frame, text="▶️", width=35, height=30,
+                             command=lambda j=job: self.resume(j)).pack(side="left", padx=2)
+            ctk.CTkButton(btn_frame, text="❌", width=35, height=30, fg_color="#e74c3c",
+                         command=lambda j=job: self.delete(j)).pack(side="left", padx=2)
+
+    def resume(self, job):
+        self.on_resume(job)
+        self.destroy()
+
+    def delete(self, job):
+        if messagebox.askyesno("Confirmation", f"Supprimer le manifeste du traitement '{job.job_id}' ?", parent=self):
+            job.delete()
+            self.draw_items()
+
+class DuplicateScanWindow(ctk.CTkToplevel):
+    """Suivi d'une recherche de doublons : progression, résultats partiels, pause / annulation, export"""
+    POLL_MS = 200
+
+    def __init__(self, parent, scan_job):
+        super().__init__(parent)
+        self.title("Vérification des doublons")
+        self.geometry("800x560")
+        self.resizable(True, True)
+        self.scan_job = scan_job
+        
+        ctk.CTkLabel(self, text="🔍 Recherche de doublons", 
+                    font=("Arial", 20, "bold")).pack(anchor="w", padx=15, pady=(15, 0))
+        ctk.CTkLabel(self, text=scan_job.root, font=("Arial", 11), 
+                    text_color="#7f8c8d").pack(anchor="w", padx=15)
+        
+        self.progress_bar = ctk.CTkProgressBar(self, width=760)
+        self.progress_bar.pack(padx=15, pady=(10, 0))
+        self.progress_bar.set(0)
+        self.progress_label = ctk.CTkLabel(self, text="Recherche des fichiers...")
+        self.progress_label.pack(anchor="w", padx=15)
+        
+        self.textbox = ctk.CTkTextbox(self, font=("Courier New", 11))
+        self.textbox.pack(fill="both", expand=True, padx=15, pady=5)
+        
+        btn_frame = ctk.CTkFrame(self, fg_color="transparent")
+        btn_frame.pack(pady=(0, 10))
+        self.pause_button = ctk.CTkButton(btn_frame, text="⏸️ Pause", width=110, command=self.toggle_pause)
+        self.pause_button.pack(side="left", padx=5)
+        self.cancel_button = ctk.CTkButton(btn_frame, text="⏹️ Annuler", width=110, fg_color="#e74c3c",
+                                           command=self.scan_job.cancel)
+        self.cancel_button.pack(side="left", padx=5)
+        self.export_button = ctk.CTkButton(btn_frame, text="💾 Exporter", width=110, state="disabled",
+                                           command=self.export)
+        self.export_button.pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="❌ Fermer", width=100, fg_color="gray",
+                     command=self.close).pack(side="left", padx=5)
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        
+        threading.Thread(target=self.scan_job.run, daemon=True).start()
+        self.poll()
+
+    def poll(self):
+        """Consomme les événements du thread de recherche"""
+        if not self.winfo_exists():
+            return
+        lines = []
+        while True:
+            try:
+                kind, payload = self.scan_job.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                self._show_progress(payload)
+            elif kind == "duplicate":
+                lines.append(f"= {os.path.basename(payload[0])}  ≡  {payload[1]}  ({payload[2] / 1e6:.2f} Mo)")
+            elif kind == "visual":
+                lines.append(f"≈ {os.path.basename(payload[0])}  ~  {os.path.basename(payload[1])}  (distance {payload[2]})")
+            elif kind == "done":
+                self._show_summary(payload)
+                if lines:
+                    self.textbox.insert("end", "\n".join(lines) + "\n")
+                return
+        if lines:
+            self.textbox.insert("end", "\n".join(lines) + "\n")
+            self.textbox.see("end")
+        self.after(self.POLL_MS, self.poll)
+
+    def _show_progress(self, progress):
+        if progress["phase"] == "scan":
+            self.progress_label.configure(text=f"Recherche des fichiers... {progress['discovered']} trouvés")
+            return
+        if progress["phase"] == "confirm":
+            self.progress_label.configure(text="Confirmation SHA-256 des doublons probables...")
+            return
+        total = progress["to_hash"] or 1
+        self.progress_bar.set(progress["hashed"] / total)
+        self.progress_label.configure(
+            text=f"{progress['hashed']}/{progress['to_hash']} candidats hachés "
+                 f"({progress['bytes_hashed'] / 1e6:.0f} Mo) sur {progress['discovered']} fichiers")
+
+    def _show_summary(self, summary):
+        self.progress_bar.set(1)
+        status = "Annulé" if summary["status"] == "cancelled" else "Terminé"
+        self.progress_label.configure(
+            text=f"{status} - {summary['duplicates']} doublon(s) dans {summary['groups']} groupe(s), "
+                 f"{summary['reclaimable_bytes'] / 1e6:.1f} Mo récupérables, "
+                 f"{summary['visual_duplicates']} image(s) visuellement identique(s)")
+        self.pause_button.configure(state="disabled")
+        self.cancel_button.configure(state="disabled")
+        self.export_button.configure(state="normal")
+
+    def toggle_pause(self):
+        if self.scan_job.running.is_set():
+            self.scan_job.pause()
+            self.pause_button.configure(text="▶️ Reprendre")
+        else:
+            self.scan_job.resume()
+            self.pause_button.configure(text="⏸️ Pause")
+
+    def export(self):
+        path = filedialog.asksaveasfilename(parent=self, title="Exporter le rapport de doublons",
+                                            defaultextension=".csv",
+                                            filetypes=[("CSV", "*.csv"), ("JSON", "*.json")])
+        if path:
+            self.scan_job.export(path)
+            messagebox.showinfo("Export", f"Rapport exporté dans {path}", parent=self)
+
+    def close(self):
+        if not self.scan_job.finished:
+            self.scan_job.cancel()
+        self.destroy()
+
+class MetricsWindow(ctk.CTkToplevel):
+    """Panneau de métriques en direct (histogrammes par étape)"""
+    REFRESH_MS = 1000
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Métriques d'ingestion")
+        self.geometry("760x520")
+        self.resizable(True, True)
+        
+        ctk.CTkLabel(self, text="📈 Métriques par étape", 
+                    font=("Arial", 20, "bold")).pack(anchor="w", padx=15, pady=(15, 5))
+        
+        self.textbox = ctk.CTkTextbox(self, font=("Courier New", 12))
+        self.textbox.pack(fill="both", expand=True, padx=15, pady=5)
+        
+        btn_frame = ctk.CTkFrame(self, fg_color="transparent")
+        btn_frame.pack(pady=(0, 10))
+        ctk.CTkButton(btn_frame, text="💾 Exporter Prometheus", width=170,
+                     command=self.export).pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="🗑️ Réinitialiser", width=120, fg_color="gray",
+                     command=metrics.reset).pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="❌ Fermer", width=100, fg_color="gray",
+                     command=self.destroy).pack(side="left", padx=5)
+        
+        self.refresh()
+
+    def refresh(self):
+        """Redessine le tableau et les histogrammes"""
+        if not self.winfo_exists():
+            return
+        stats = metrics.snapshot()
+        lines = [f"{'Étape':<12}{'n':>7}{'moy.':>9}{'p50':>9}{'p95':>9}{'Mo':>10}{'err.':>6}", "-" * 62]
+        for name, stage in stats.items():
+            lines.append(f"{name:<12}{stage['count']:>7}{stage['mean_s']:>8.3f}s{stage['p50_s']:>8.3f}s"
+                         f"{stage['p95_s']:>8.3f}s{stage['bytes'] / 1e6:>10.1f}{stage['errors']:>6}")
+        lines.append("")
+        labels = [f"≤{bound}s" for bound in MetricsCollector.BUCKETS] + [">30s"]
+        for name, stage in stats.items():
+            if not stage["count"]:
+                continue
+            lines.append(f"[{name}]")
+            peak = max(stage["histogram"]) or 1
+            for label, count in zip(labels, stage["histogram"]):
+                if count:
+                    lines.append(f"  {label:>8} {'█' * max(1, int(40 * count / peak))} {count}")
+        self.textbox.delete("1.0", "end")
+        self.textbox.insert("1.0", "\n".join(lines))
+        self.after(self.REFRESH_MS, self.refresh)
+
+    def export(self):
+        metrics.write_prometheus()
+        messagebox.showinfo("Métriques", f"Métriques exportées dans {METRICS_PROM_FILE}", parent=self)
 
 class MainApp(ctk.CTk):
     """Application principale"""
@@ -684,15 +5742,28 @@ class MainApp(ctk.CTk):
         super().__init__()
         
         self.config = ConfigManager.load_config()
-        self.file_index = ConfigManager.load_index()
         self.classification_engine = ClassificationEngine()
+        self.pipeline = IngestionPipeline(config=self.config, classification_engine=self.classification_engine)
+        self.file_index = self.pipeline.file_index
+        self.perceptual_index = self.pipeline.perceptual_index
         self.current_files = []
+        self.current_source = None  # Dernier dossier importé (parcours en flux)
         self.new_categories_created = []  # Pour suivre les nouvelles catégories
         self.typology_window = None  # Référence à la fenêtre de typologie
         
         self._setup_appearance()
         self._setup_ui()
         self._update_stats()
+        self.after(1000, self._offer_job_resume)
+        self.after(2000, self._start_index_migration)
+        self.after(1500, self.start_reorganization)  # Termine une réorganisation interrompue
+        self.scrubber = IntegrityScrubber(self.pipeline, self.config)
+        if self.config.get("scrub_enabled", True):
+            threading.Thread(target=self.scrubber.run_forever, daemon=True).start()
+        # Classification IA des documents archivés provisoirement pendant une indisponibilité
+        self.deferred_stop = threading.Event()
+        threading.Thread(target=self.pipeline.deferred.run_forever, daemon=True,
+                         args=(self.deferred_stop, lambda move: self.after(0, self._update_stats))).start()
 
     def _setup_appearance(self):
         ctk.set_appearance_mode("dark")
@@ -753,6 +5824,10 @@ class MainApp(ctk.CTk):
                      command=self.process_imported, height=40).pack(pady=10, fill="x")
         ctk.CTkButton(action_frame, text="🔍 Vérifier Doublons", 
                      command=self.check_duplicates, height=40, fg_color="#f39c12").pack(pady=10, fill="x")
+        ctk.CTkButton(action_frame, text="🧪 Simuler le classement", 
+                     command=self.plan_folder, height=35, fg_color="#34495e").pack(pady=5, fill="x")
+        ctk.CTkButton(action_frame, text="▶️ Exécuter un plan", 
+                     command=self.execute_plan, height=35, fg_color="#34495e").pack(pady=5, fill="x")
         
         # Options
         options_frame = ctk.CTkFrame(self.sidebar, fg_color="transparent")
@@ -776,6 +5851,11 @@ class MainApp(ctk.CTk):
                                                command=self.toggle_auto_create)
         self.auto_create_check.pack(anchor="w", pady=5)
         
+        self.profile_var = ctk.BooleanVar(value=False)
+        self.profile_check = ctk.CTkCheckBox(options_frame, text="Profiler le traitement",
+                                             variable=self.profile_var)
+        self.profile_check.pack(anchor="w", pady=5)
+        
         # Configuration
         config_frame = ctk.CTkFrame(self.sidebar, fg_color="transparent")
         config_frame.pack(pady=10, padx=20, fill="x")
@@ -784,6 +5864,12 @@ class MainApp(ctk.CTk):
                      command=self.open_typology, fg_color="#34495e", height=35).pack(pady=5, fill="x")
         ctk.CTkButton(config_frame, text="🔌 Tester API", 
                      command=self.test_api, fg_color="#27ae60", height=35).pack(pady=5, fill="x")
+        ctk.CTkButton(config_frame, text="🗂️ Traitements", 
+                     command=self.open_jobs, fg_color="#34495e", height=35).pack(pady=5, fill="x")
+        ctk.CTkButton(config_frame, text="📈 Métriques", 
+                     command=self.open_metrics, fg_color="#34495e", height=35).pack(pady=5, fill="x")
+        ctk.CTkButton(config_frame, text="🩺 Intégrité", 
+                     command=self.show_integrity_report, fg_color="#34495e", height=35).pack(pady=5, fill="x")
         
         # Statistiques
         stats_frame = ctk.CTkFrame(self.sidebar)
@@ -840,17 +5926,28 @@ class MainApp(ctk.CTk):
 
     def _update_stats(self):
         """Met à jour les statistiques affichées"""
-        total_files = len(self.file_index)
         typology = self.config.get("typology", {})
         typology_size = len(typology)
         total_subcategories = sum(len(subs) for subs in typology.values())
         
+        # Archives non chargées : résumés tenus dans le registre
+        week_ago = datetime.fromtimestamp(time.time() - 7 * 86400).isoformat(timespec="seconds")
+        summary = self.pipeline.index_summary(week_ago)
+        total_files = summary["records"]
+        recent_files = summary["recent"]
+        archived_gb = summary["bytes"] / 1024 ** 3
+        
         stats_text = f"📊 Statistiques\n"
         stats_text += f"Fichiers indexés: {total_files}\n"
+        stats_text += f"Archivés (7 jours): {recent_files}\n"
+        stats_text += f"Volume archivé: {archived_gb:.2f} Go\n"
         stats_text += f"Catégories: {typology_size}\n"
         stats_text += f"Sous-catégories: {total_subcategories}\n"
         stats_text += f"API: {'✅ Active' if self.config.get('api_active', True) else '❌ Inactive'}\n"
         stats_text += f"Auto-création: {'✅ ON' if self.config.get('auto_create_categories', True) else '❌ OFF'}"
+        pending = self.pipeline.deferred.pending()
+        if pending:
+            stats_text += f"\nEn attente de l'IA: {pending}"
         
         self.stats_label.configure(text=stats_text)
 
@@ -882,7 +5979,7 @@ class MainApp(ctk.CTk):
         # Mettre à jour l'affichage immédiatement
         self.typology_window.refresh_display()
 
-    def _on_typology_saved(self):
+    def _on_typology_saved(self, changes=None):
         """Callback après sauvegarde de la typologie"""
         # Recharger la configuration
         self.config = ConfigManager.load_config()
@@ -891,6 +5988,15 @@ class MainApp(ctk.CTk):
         # Mettre à jour les stats
         self._update_stats()
         
+        # Répercuter renommages et suppressions sur les documents déjà archivés
+        if changes:
+            counts = self.pipeline.index_summary(datetime.now().isoformat(timespec="seconds"))["categories"]
+            affected = sum(counts.get(category, 0) for category in ArchiveReorganizer.affected_categories(changes))
+            if affected and messagebox.askyesno("Réorganisation de l'archive",
+                                                f"{affected} document(s) archivé(s) concerné(s) par ces modifications.\n\n"
+                                                f"Réorganiser l'archive maintenant (en arrière-plan) ?"):
+                self.start_reorganization(changes)
+        
         # Si la fenêtre de typologie est ouverte, la rafraîchir
         if hasattr(self, 'typology_window') and self.typology_window is not None:
             try:
@@ -898,6 +6004,26 @@ class MainApp(ctk.CTk):
             except:
                 pass
 
+    def start_reorganization(self, changes=None):
+        """Réorganisation en arrière-plan (ou reprise d'une réorganisation interrompue)"""
+        reorganizer = ArchiveReorganizer(self.pipeline)
+        
+        def report(current, total):
+            self.after(0, lambda: self.status_label.configure(text=f"Réorganisation : {current}/{total}"))
+        
+        def worker():
+            if changes is None:
+                stats = reorganizer.recover()
+                if stats is None:
+                    return
+            else:
+                stats = reorganizer.run(reorganizer.plan(changes), on_progress=report)
+            self.after(0, lambda: self.status_label.configure(
+                text=f"Archive réorganisée : {stats['moved']} déplacé(s), {stats['missing']} manquant(s)"))
+            self.after(0, self._update_stats)
+        
+        threading.Thread(target=worker, daemon=True).start()
+
     def refresh_typology_window(self):
         """Rafraîchit la fenêtre de typologie si elle est ouverte"""
         if hasattr(self, 'typology_window') and self.typology_window is not None:
@@ -906,6 +6032,74 @@ class MainApp(ctk.CTk):
             except:
                 pass
 
+    def open_jobs(self):
+        """Ouvre le panneau des traitements (en cours, interrompus, échoués)"""
+        JobsWindow(self, self.resume_job, self.pipeline.active_jobs)
+
+    def _offer_job_resume(self):
+        """Propose de reprendre les traitements interrompus au démarrage"""
+        interrupted = [job for job in JobManifest.list_jobs() if job.status == "running"]
+        for job in interrupted[:1]:
+            progress = job.progress()
+            remaining = progress["total"] - sum(progress.get(stage, 0) for stage in JobManifest.FINAL_STAGES)
+            if messagebox.askyesno("Traitement interrompu",
+                                   f"Le traitement {job.job_id} a été interrompu "
+                                   f"({remaining} fichier(s) restant(s) sur {progress['total']}).\n\n"
+                                   f"Reprendre maintenant ?"):
+                self.resume_job(job)
+
+    def _start_index_migration(self):
+        """Recalcule en arrière-plan les empreintes après un changement d'algorithme"""
+        migrator = IndexMigrator(self.pipeline)
+        
+        def report(progress):
+            self.after(0, lambda: self.status_label.configure(
+                text=f"Migration de l'index : {progress['done']}/{progress['total']}"))
+        
+        def worker():
+            pending = migrator.pending_keys()  # Lecture des index des archives : hors du thread de l'interface
+            if not pending:
+                return
+            progress = migrator.run(on_progress=report, pending=pending)
+            self.after(0, lambda: self.status_label.configure(
+                text=f"Index migré vers {self.pipeline.hasher.algorithm} ({progress['done']} entrées)"))
+        
+        self.index_migrator = migrator
+        threading.Thread(target=worker, daemon=True).start()
+
+    def resume_job(self, job):
+        """Reprend un traitement à partir de son manifeste"""
+        if job.job_id in self.pipeline.active_jobs:
+            messagebox.showwarning("Traitement en cours", f"Le traitement {job.job_id} est déjà en cours.")
+            return
+        self.after(0, self._clear_results)
+        self.current_files = list(job.files)
+        self.new_categories_created = []
+        threading.Thread(target=self._process_files_thread,
+                         args=(self.current_files, job.dest_dir, job), daemon=True).start()
+
+    def open_metrics(self):
+        """Ouvre le panneau de métriques en direct"""
+        if getattr(self, "metrics_window", None) is not None and self.metrics_window.winfo_exists():
+            self.metrics_window.lift()
+            return
+        self.metrics_window = MetricsWindow(self)
+
+    def show_integrity_report(self):
+        """Affiche le bilan de la vérification d'intégrité de l'archive"""
+        report = self.scrubber.report()
+        issues = self.scrubber.state["issues"]
+        message = (f"Passes complètes: {report['passes']} (dernière: {report['last_pass'] or 'aucune'})\n"
+                   f"Fiches vérifiées: {report['checked']}\n\n"
+                   f"❌ Manquants: {report['missing']}\n"
+                   f"⚠️ Modifiés: {report['modified']}\n"
+                   f"❓ Orphelins: {report['orphaned']}")
+        examples = list(issues["missing"].values())[:3] + list(issues["modified"].values())[:3] + issues["orphaned"][:3]
+        if examples:
+            message += "\n\n" + "\n".join(os.path.basename(path) for path in examples)
+        message += f"\n\nDétail complet: {SCRUB_STATE_FILE}"
+        messagebox.showinfo("Intégrité de l'archive", message)
+
     def test_api(self):
         """Teste la connexion à l'API DeepSeek"""
         if not self.config.get("api_active", True):
@@ -951,22 +6145,36 @@ class MainApp(ctk.CTk):
         """Sélection d'un dossier complet"""
         folder = filedialog.askdirectory(title="Sélectionnez le dossier source")
         if folder:
-            # Filtre avec tous les formats supportés
-            supported_ext = ('.pdf', '.docx', '.xlsx', '.pptx', '.mp3', '.wav', 
-                           '.mp4', '.mov', '.avi', '.jpg', '.jpeg', '.png')
-            files = []
-            for root, _, filenames in os.walk(folder):
-                for filename in filenames:
-                    if filename.lower().endswith(supported_ext):
-                        files.append(os.path.join(root, filename))
-            
-            if files:
-                self.start_processing(files)
-            else:
-                messagebox.showwarning("Aucun fichier", "Aucun fichier compatible trouvé dans ce dossier.")
+            self.current_files = []
+            self.current_source = folder
+            self.start_folder_processing(folder)
+
+    def start_folder_processing(self, folder):
+        """Parcours en flux : le traitement démarre dès les premiers fichiers découverts"""
+        dest_dir = filedialog.askdirectory(title="Sélectionnez le dossier de destination (Archives)")
+        if not dest_dir:
+            return
+
+        # Mise à jour de la config
+        self.config["last_destination"] = dest_dir
+        ConfigManager.save_config(self.config)
+
+        # Nettoyage interface
+        self.after(0, self._clear_results)
+        self.new_categories_created = []
+        
+        # Filtre avec tous les formats supportés ; les archives elles-mêmes ne sont pas reparcourues
+        scanner = FolderScanner(SUPPORTED_EXTENSIONS, self.config.get("scan_skip_patterns", []),
+                                skip_paths=[dest_dir])
+        threading.Thread(target=self._process_files_thread,
+                         args=(scanner.stream(folder), dest_dir), kwargs={"scanner": scanner, "sources": [folder]},
+                         daemon=True).start()
 
     def process_imported(self):
         """Traiter les fichiers déjà importés ou sélectionner de nouveaux"""
+        if not self.current_files and getattr(self, "current_source", None):
+            self.start_folder_processing(self.current_source)
+            return
         if not hasattr(self, 'current_files') or not self.current_files:
             messagebox.showinfo("Aucun fichier", 
                               "Aucun fichier à traiter. Veuillez d'abord importer des fichiers.")
@@ -1000,61 +6208,107 @@ class MainApp(ctk.CTk):
         # Nettoyage interface
         self.after(0, self._clear_results)
         self.current_files = file_list
+        self.current_source = None
         self.new_categories_created = []
         
         # Lancement du thread
         threading.Thread(target=self._process_files_thread, 
                          args=(file_list, dest_dir), daemon=True).start()
 
-    def _process_files_thread(self, file_list, dest_dir):
-        """Thread de traitement des fichiers"""
-        if not file_list:
+    def plan_folder(self):
+        """Simulation sur un dossier : classification sans copie, plan enregistré pour relecture"""
+        folder = filedialog.askdirectory(title="Sélectionnez le dossier à simuler")
+        if not folder:
+            return
+        dest_dir = filedialog.askdirectory(title="Sélectionnez le dossier de destination prévu (Archives)")
+        if not dest_dir:
+            return
+        plan_path = filedialog.asksaveasfilename(title="Enregistrer le plan", defaultextension=".csv",
+                                                 filetypes=[("CSV", "*.csv"), ("Parquet", "*.parquet")])
+        if not plan_path:
+            return
+        
+        def worker():
+            self.after(0, self._show_progress, None)
+            scanner = FolderScanner(SUPPORTED_EXTENSIONS, self.config.get("scan_skip_patterns", []),
+                                    skip_paths=[dest_dir])
+            plan = self.pipeline.plan_batch(
+                scanner.stream(folder), dest_dir,
+                on_progress=lambda current, total: self.after(0, self._update_progress, current,
+                                                              scanner.discovered, not scanner.finished))
+            self.after(0, self._hide_progress)
+            try:
+                plan.save(plan_path)
+            except Exception as e:
+                msg = str(e)
+                self.after(0, lambda m=msg: messagebox.showerror("Plan", f"Erreur d'enregistrement du plan: {m}"))
+                return
+            self.after(0, lambda: messagebox.showinfo("Plan de classement",
+                                                      f"{plan.summary_text()}\n\nPlan enregistré: {plan_path}"))
+        
+        threading.Thread(target=worker, daemon=True).start()
+
+    def execute_plan(self):
+        """Applique un plan de classement relu (copies en bloc, dans l'ordre du disque)"""
+        plan_path = filedialog.askopenfilename(title="Sélectionnez le plan",
+                                               filetypes=[("Plans", "*.csv *.parquet")])
+        if not plan_path:
+            return
+        try:
+            plan = ClassificationPlan.load(plan_path)
+        except Exception as e:
+            messagebox.showerror("Plan", f"Plan illisible: {e}")
+            return
+        if not messagebox.askyesno("Exécuter le plan", f"{plan.summary_text()}\n\nExécuter ce plan vers {plan.dest_dir} ?"):
+            return
+        self.resume_job(self.pipeline.prepare_plan_job(plan, delete_source=self.auto_delete_var.get()))
+
+    def _process_files_thread(self, file_list, dest_dir, job=None, scanner=None, sources=None):
+        """Thread de traitement des fichiers (liste ou flux issu d'un FolderScanner)"""
+        if scanner is None and not file_list:
             self.after(0, lambda: messagebox.showwarning("Aucun fichier", 
                                                        "Aucun fichier à traiter."))
             return
         
         # Fenêtre de progression
-        self.after(0, self._show_progress, len(file_list))
-        
-        # Traitement
-        processed = 0
-        duplicates = 0
-        errors = 0
-        
-        for i, filepath in enumerate(file_list):
-            # Mise à jour progression
-            self.after(0, self._update_progress, i + 1, len(file_list))
-            
-            try:
-                result = self._process_single_file(filepath, dest_dir)
-                
-                if result["status"] == "DOUBLON":
-                    duplicates += 1
-                elif "ERREUR" in result["status"]:
-                    errors += 1
-                else:
-                    processed += 1
-                    # Si une nouvelle catégorie a été créée, la suivre
-                    if result.get("created_new", False):
-                        new_cat = {
-                            "category": result["category"],
-                            "subcategory": result["subcategory"],
-                            "file": result["filename"],
-                            "reason": result.get("reason", "")
-                        }
-                        self.new_categories_created.append(new_cat)
-                
-                self.after(0, self._add_result_row, result)
-                
-            except Exception as e:
-                print(f"Erreur traitement {filepath}: {e}")
-                errors += 1
+        self.after(0, self._show_progress, None if scanner else len(file_list))
+        self.scrubber.pause()  # Débit disque réservé à l'ingestion
         
-        # Fermeture progression
-        self.after(0, self._hide_progress)
+        # Traitement (cœur d'ingestion sans interface)
+        if scanner is not None:
+            on_progress = lambda current, total: self.after(0, self._update_progress, current,
+                                                            scanner.discovered, not scanner.finished)
+        else:
+            on_progress = lambda current, total: self.after(0, self._update_progress, current, total)
+        on_result = lambda result: self.after(0, self._add_result_row, result)
+        profiler = None
+        try:
+            if self.profile_var.get():
+                profiler = SamplingProfiler.from_config(self.config)
+                profiler.start()
+            if job is not None:
+                summary = self.pipeline.resume_job(job, on_progress=on_progress, on_result=on_result)
+            else:
+                summary = self.pipeline.process_batch(file_list, dest_dir,
+                                                      delete_source=self.auto_delete_var.get(),
+                                                      on_progress=on_progress, on_result=on_result, sources=sources)
+        except Exception as e:
+            print(f"Erreur traitement du lot: {e}")
+            msg = str(e)
+            self.after(0, lambda m=msg: messagebox.showerror("Traitement", f"Traitement interrompu: {m}"))
+            return
+        finally:
+            self.last_profile = profiler.stop() if profiler is not None else None
+            self.scrubber.resume()
+            # Fermeture progression
+            self.after(0, self._hide_progress)
+        self.new_categories_created = summary["new_categories"]
+        self.last_report = summary.get("report_xlsx") or summary.get("report")
         
-        # Sauvegarde index
-        ConfigManager.save_index(self.file_index)
+        if scanner is not None and summary["total"] == 0:
+            self.after(0, lambda: messagebox.showwarning("Aucun fichier", 
+                                                       "Aucun fichier compatible trouvé dans ce dossier."))
+            return
         
         # Rafraîchir la configuration pour avoir les dernières catégories
         self.config = ConfigManager.load_config()
@@ -1063,121 +6317,30 @@ class MainApp(ctk.CTk):
         self.after(0, self.refresh_typology_window)
         
         # Affichage résultats avec nouvelles catégories
-        self.after(0, lambda: self._show_results(processed, duplicates, errors, file_list))
+        self.after(0, lambda: self._show_results(summary["processed"], summary["duplicates"],
+                                                 summary["errors"], file_list))
 
     def _process_single_file(self, filepath, dest_dir):
         """Traite un fichier individuel"""
-        filename = os.path.basename(filepath)
-        
-        # 1. Vérification doublon
-        file_hash = DuplicateManager.get_file_hash(filepath)
-        is_duplicate = DuplicateManager.is_duplicate(file_hash, self.file_index)
-        
-        if is_duplicate:
-            return {
-                "filename": filename,
-                "category": "DOUBLON",
-                "subcategory": "",
-                "status": f"DOUBLON ({os.path.basename(self.file_index[file_hash])[:20]}...)",
-                "color": "orange",
-                "path": filepath,
-                "is_duplicate": True,
-                "created_new": False
-            }
-        
-        # 2. Classification avec création automatique
-        classification = self.classification_engine.analyze_document(filepath)
-        
-        # 3. Préparation destination
-        final_dir = os.path.join(dest_dir, classification["category"], classification["subcategory"])
-        os.makedirs(final_dir, exist_ok=True)
-        
-        dest_path = os.path.join(final_dir, classification["new_name"])
-        
-        # 4. Copie
-        shutil.copy2(filepath, dest_path)
-        
-        # 5. Vérification intégrité
-        dest_hash = DuplicateManager.get_file_hash(dest_path)
-        if dest_hash != file_hash:
-            return {
-                "filename": filename,
-                "category": classification["category"],
-                "subcategory": classification["subcategory"],
-                "status": "ERREUR Intégrité",
-                "color": "red",
-                "path": dest_path,
-                "is_duplicate": False,
-                "created_new": False
-            }
-        
-        # 6. Mise à jour index
-        self.file_index[file_hash] = dest_path
-        
-        # 7. Tagging métadonnées (si fichier audio/vidéo)
-        if dest_path.lower().endswith(('.mp3', '.mp4', '.m4a')):
-            try:
-                MetadataManager.tag_file(dest_path, classification["category"], classification["subcategory"])
-            except:
-                pass
-        
-        # 8. Suppression source si option activée
-        source_deleted = False
-        if self.auto_delete_var.get():
-            try:
-                os.remove(filepath)
-                source_deleted = True
-            except:
-                pass
-        
-        # 9. Retour résultat
-        status = f"{classification['status']}{' (Source supprimée)' if source_deleted else ''}"
-        
-        return {
-            "filename": filename,
-            "category": classification["category"],
-            "subcategory": classification["subcategory"],
-            "status": status,
-            "color": "#27ae60" if not classification.get("created_new", False) else "#f39c12",
-            "path": dest_path,
-            "is_duplicate": False,
-            "created_new": classification.get("created_new", False),
-            "reason": classification.get("reason", ""),
-            "new_name": classification["new_name"]
-        }
+        return self.pipeline.process_file(filepath, dest_dir, delete_source=self.auto_delete_var.get())
 
     def check_duplicates(self):
-        """Vérifie les doublons dans un dossier"""
+        """Vérifie les doublons dans un dossier (en arrière-plan)"""
         source_dir = filedialog.askdirectory(title="Sélectionnez le dossier à vérifier")
         if not source_dir:
             return
-            
-        # Recherche doublons
-        duplicates_found = []
-        file_hashes = {}
-        
-        for root, _, files in os.walk(source_dir):
-            for file in files:
-                filepath = os.path.join(root, file)
-                file_hash = DuplicateManager.get_file_hash(filepath)
-                
-                if file_hash:
-                    if file_hash in file_hashes:
-                        duplicates_found.append((file, file_hashes[file_hash]))
-                    else:
-                        file_hashes[file_hash] = file
         
-        if duplicates_found:
-            message = f"Doublons trouvés: {len(duplicates_found)}\n\n"
-            for dup in duplicates_found[:10]:  # Limite à 10 affichages
-                message += f"- {dup[0]} (identique à {dup[1]})\n"
-            
-            if len(duplicates_found) > 10:
-                message += f"\n... et {len(duplicates_found) - 10} autres"
-            
-            messagebox.showwarning("Doublons détectés", message)
-        else:
-            messagebox.showinfo("Vérification", "Aucun doublon détecté.")
+        # Mode visuel : images identiques malgré redimensionnement / recompression
+        visual_mode = PerceptualHashManager.is_available() and messagebox.askyesno(
+            "Doublons visuels", "Rechercher aussi les images visuellement identiques ?")
+        
+        scan_job = DuplicateScanJob(source_dir,
+                                    workers=self.config.get("duplicate_scan_workers", 4),
+                                    visual_mode=visual_mode,
+                                    threshold=self.config.get("phash_threshold", 6),
+                                    skip_patterns=self.config.get("scan_skip_patterns", []),
+                                    hasher=self.pipeline.hasher)
+        DuplicateScanWindow(self, scan_job)
 
     def _clear_results(self):
         """Vide le tableau des résultats"""
@@ -1233,15 +6396,19 @@ class MainApp(ctk.CTk):
         self.progress_bar.pack(pady=10)
         self.progress_bar.set(0)
         
-        self.progress_label = ctk.CTkLabel(self.progress_window, text=f"0/{total_files}")
+        self.progress_label = ctk.CTkLabel(self.progress_window,
+                                           text=f"0/{total_files}" if total_files else "Recherche des fichiers...")
         self.progress_label.pack()
 
-    def _update_progress(self, current, total):
-        """Met à jour la barre de progression"""
+    def _update_progress(self, current, total, scanning=False):
+        """Met à jour la barre de progression (total provisoire tant que le parcours continue)"""
         if hasattr(self, 'progress_bar'):
-            progress = current / total
+            progress = current / total if total else 0
             self.progress_bar.set(progress)
-            self.progress_label.configure(text=f"{current}/{total}")
+            text = f"{current}/{total}"
+            if scanning:
+                text = f"{current} traités / {total} découverts (recherche en cours...)"
+            self.progress_label.configure(text=text)
             self.progress_window.update()
 
     def _hide_progress(self):
@@ -1278,14 +6445,207 @@ class MainApp(ctk.CTk):
             message += "\n📋 Le plan de classement a été automatiquement mis à jour."
             message += "\n\nCliquez sur 'Plan de Classement' pour voir les nouvelles catégories."
         
+        if getattr(self, "last_report", None):
+            message += f"\n\n📄 Rapport détaillé : {os.path.abspath(self.last_report)}"
+        if getattr(self, "last_profile", None):
+            message += f"\n⏱️ Profil : {os.path.abspath(self.last_profile)}"
+        
         messagebox.showinfo("Résultats", message)
         self.status_label.configure(text=f"Terminé - {processed} fichiers traités")
         self._update_stats()  # Met à jour les stats avec les nouvelles catégories
 
+# ==================== LIGNE DE COMMANDE ====================
+def build_cli_parser():
+    parser = argparse.ArgumentParser(description="MALKOGED AI - sans argument, lance l'interface graphique")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile la commande (piles repliées et résumé dans ged_profiles)")
+    parser.add_argument("--tracemalloc", action="store_true", help="Avec --profile : allocations par étape")
+    commands = parser.add_subparsers(dest="command")
+    
+    ingest = commands.add_parser("ingest", help="Archive des fichiers ou dossiers sans interface graphique")
+    ingest.add_argument("sources", nargs="+")
+    ingest.add_argument("--dest", required=True, help="Dossier d'archives")
+    ingest.add_argument("--delete-source", action="store_true")
+    
+    shard_init = commands.add_parser("shard-init", help="Découpe un manifeste d'entrée en partitions")
+    shard_init.add_argument("manifest", help="Fichier texte : un chemin source par ligne")
+    shard_init.add_argument("--shared-dir", required=True, help="Dossier partagé entre les nœuds")
+    shard_init.add_argument("--dest", required=True, help="Dossier d'archives (partagé)")
+    shard_init.add_argument("--partitions", type=int, default=64)
+    
+    shard_worker = commands.add_parser("shard-worker", help="Traite des partitions jusqu'à épuisement")
+    shard_worker.add_argument("--shared-dir", required=True)
+    shard_worker.add_argument("--node-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    
+    shard_merge = commands.add_parser("shard-merge", help="Fusionne les segments d'index")
+    shard_merge.add_argument("--shared-dir", required=True)
+    shard_merge.add_argument("--keep-blobs", action="store_true", help="Ne supprime pas les exemplaires redondants")
+    
+    commands.add_parser("migrate-index", help="Recalcule les empreintes de l'index avec l'algorithme configuré")
+    
+    index_export = commands.add_parser("index-export", help="Exporte l'index (fichier .parquet ou .csv, pandas requis)")
+    index_export.add_argument("output")
+    
+    plan = commands.add_parser("plan", help="Simule le classement d'un dossier (aucune copie)")
+    plan.add_argument("source")
+    plan.add_argument("--dest", required=True, help="Dossier d'archives prévu")
+    plan.add_argument("--output", default="plan.csv", help="Fichier de plan (.csv ou .parquet)")
+    
+    execute_plan = commands.add_parser("execute-plan", help="Applique un plan de classement")
+    execute_plan.add_argument("plan")
+    execute_plan.add_argument("--delete-source", action="store_true")
+    
+    commands.add_parser("classify-pending", help="Classe par l'IA les documents archivés provisoirement")
+    
+    serve = commands.add_parser("serve", help="Service HTTP local d'ingestion (dépôts de fichiers ou de chemins)")
+    serve.add_argument("--dest", required=True, help="Dossier d'archives")
+    serve.add_argument("--host", default=None)
+    serve.add_argument("--port", type=int, default=None)
+    serve.add_argument("--delete-source", action="store_true", help="Supprime les fichiers soumis par chemin")
+    
+    report_xlsx = commands.add_parser("report-xlsx", help="Convertit un rapport de lot (JSONL/CSV) en Excel")
+    report_xlsx.add_argument("report", help="Rapport dans ged_reports")
+    report_xlsx.add_argument("--output", default=None, help="Classeur de sortie (.xlsx)")
+    
+    commands.add_parser("archives", help="Liste les archives connues (rattachées, en ligne, nombre de fiches)")
+    archive_attach = commands.add_parser("archive-attach", help="Rattache une archive (support rebranché, autre poste)")
+    archive_attach.add_argument("root")
+    archive_detach = commands.add_parser("archive-detach", help="Détache une archive : ses fiches ne comptent plus")
+    archive_detach.add_argument("root")
+    
+    commands.add_parser("pack", help="Range les petits documents déjà archivés dans des packs compressés")
+    commands.add_parser("pack-compact", help="Récupère l'espace des documents supprimés dans les packs")
+    
+    pack_extract = commands.add_parser("pack-extract", help="Restitue les documents des packs en fichiers")
+    pack_extract.add_argument("dest", nargs="?", help="Dossier de la vue catégorie / sous-catégorie")
+    pack_extract.add_argument("--category", help="Limite l'extraction à une catégorie")
+    pack_extract.add_argument("--all", action="store_true", help="Copie aussi les documents hors pack")
+    pack_extract.add_argument("--in-place", action="store_true",
+                              help="Remet les documents à leur place dans l'archive (abandon des packs)")
+    
+    scrub = commands.add_parser("scrub", help="Termine la passe de vérification d'intégrité en cours")
+    scrub.add_argument("--bandwidth-mb", type=float, default=None, help="Débit maximal en Mo/s (0 = illimité)")
+    return parser
+
+def run_cli(args):
+    """Exécute une commande sans interface graphique (sous profilage avec --profile)"""
+    profiler = None
+    if args.profile:
+        profiler = SamplingProfiler.from_config(ConfigManager.load_config(), args.tracemalloc or None)
+        profiler.start()
+    try:
+        run_command(args)
+    finally:
+        if profiler is not None:
+            print(f"Profil enregistré dans {profiler.stop()}")
+
+def run_command(args):
+    if args.command == "ingest":
+        config = ConfigManager.load_config()
+        
+        pipeline = IngestionPipeline(config=config)
+        summary = pipeline.process_batch(
+            pipeline.stream_sources(args.sources, args.dest), args.dest, args.delete_source,
+            on_progress=lambda current, total: print(f"\r{current} fichier(s)", end="", flush=True),
+            sources=args.sources)
+        print(f"\nIngestion terminée: {summary}")
+    elif args.command == "shard-init":
+        settings = ShardCoordinator(args.shared_dir).init(args.manifest, args.partitions, args.dest)
+        print(f"{settings['files']} fichiers répartis en {settings['partitions']} partitions")
+    elif args.command == "shard-worker":
+        totals = ShardCoordinator(args.shared_dir).run_worker(
+            args.node_id, on_progress=lambda partition, current, total: print(
+                f"\r{partition}: {current}/{total}", end="", flush=True))
+        print(f"\nNœud {args.node_id}: {totals}")
+    elif args.command == "shard-merge":
+        stats = ShardCoordinator(args.shared_dir).merge(delete_redundant=not args.keep_blobs)
+        print(f"Fusion terminée: {stats}")
+    elif args.command == "migrate-index":
+        pipeline = IngestionPipeline()
+        progress = IndexMigrator(pipeline).run(on_progress=lambda p: print(
+            f"\r{p['done']}/{p['total']}", end="", flush=True))
+        print(f"\nMigration vers {pipeline.hasher.algorithm}: {progress}")
+    elif args.command == "plan":
+        scanner = FolderScanner(SUPPORTED_EXTENSIONS, ConfigManager.load_config().get("scan_skip_patterns", []),
+                                skip_paths=[args.dest])
+        classification_plan = IngestionPipeline().plan_batch(scanner.stream(args.source), args.dest)
+        classification_plan.save(args.output)
+        print(f"{classification_plan.summary_text()}\nPlan enregistré: {args.output}")
+    elif args.command == "execute-plan":
+        pipeline = IngestionPipeline()
+        summary = pipeline.execute_plan(ClassificationPlan.load(args.plan), args.delete_source,
+                                        on_progress=lambda current, total: print(
+                                            f"\r{current}/{total}", end="", flush=True))
+        print(f"\nExécution terminée: {summary}")
+    elif args.command == "classify-pending":
+        deferred = IngestionPipeline().deferred
+        deferred.requeue_from_index()
+        stats = deferred.drain(on_move=lambda move: print(f"{move['old']} -> {move['new']}"))
+        print(f"Classification différée: {stats}")
+    elif args.command == "serve":
+        pipeline = IngestionPipeline()
+        if not pipeline.config.get("service_token"):
+            pipeline.config["service_token"] = secrets.token_urlsafe(24)
+            ConfigManager.save_config(pipeline.config)
+            print(f"Jeton du service généré (service_token, en-tête X-GED-Token) : {pipeline.config['service_token']}")
+        service = IngestionService(pipeline, args.dest, args.delete_source)
+        host, port = service.start(args.host or pipeline.config.get("service_host", "127.0.0.1"),
+                                   args.port or pipeline.config.get("service_port", 8765))
+        print(f"Service d'ingestion à l'écoute sur http://{host}:{port} (Ctrl+C pour arrêter)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            service.stop()
+            pipeline.save()
+            pipeline.close()
+    elif args.command == "report-xlsx":
+        print(f"Classeur écrit : {BatchReportWriter.to_xlsx(args.report, args.output)}")
+    elif args.command == "archives":
+        registry = ArchiveRegistry()
+        online = set(registry.online())
+        for root, info in sorted(registry.archives.items()):
+            state = "en ligne" if root in online else ("absente" if info.get("attached", True) else "détachée")
+            print(f"{root}\t{state}\t{info.get('records', 0)} fiche(s)")
+    elif args.command == "archive-attach":
+        print(f"Archive rattachée : {IngestionPipeline().attach_archive(args.root)}")
+    elif args.command == "archive-detach":
+        IngestionPipeline().detach_archive(args.root)
+        print(f"Archive détachée : {os.path.abspath(args.root)}")
+    elif args.command == "pack":
+        stats = ArchivePacker(IngestionPipeline()).pack_existing(
+            on_progress=lambda current, total: print(f"\r{current}/{total}", end="", flush=True))
+        print(f"\nRangement en packs: {stats}")
+    elif args.command == "pack-compact":
+        print(f"Compactage: {ArchivePacker(IngestionPipeline()).compact()}")
+    elif args.command == "pack-extract":
+        if not args.dest and not args.in_place:
+            print("Indiquez un dossier de destination ou --in-place")
+            return
+        stats = ArchivePacker(IngestionPipeline()).extract(args.dest, args.category, args.all, args.in_place)
+        print(f"Extraction: {stats}")
+    elif args.command == "scrub":
+        config = ConfigManager.load_config()
+        if args.bandwidth_mb is not None:
+            config["scrub_bandwidth_mb_s"] = args.bandwidth_mb
+        print(f"Vérification: {IntegrityScrubber(IngestionPipeline(config=config)).run_pass()}")
+    elif args.command == "index-export":
+        rows = ConfigManager.load_index().export(args.output)
+        print(f"{rows} fiches exportées dans {args.output}")
+
 # ==================== LANCEMENT ====================
 if __name__ == "__main__":
     # Installation requise :
     # pip install customtkinter pdfplumber requests mutagen pillow python-docx openpyxl python-pptx
+    # Optionnel (doublons visuels d'images) : pip install numpy
+    # Optionnel (export analytique de l'index) : pip install pandas pyarrow
+    # Optionnel (OCR des documents numérisés) : pip install pytesseract pypdfium2 + Tesseract (langue fra)
     
-    app = MainApp()
-    app.mainloop()
+    multiprocessing.freeze_support()  # Processus d'OCR dans l'exécutable Windows
+    cli_args = build_cli_parser().parse_args()
+    if cli_args.command:
+        run_cli(cli_args)
+    else:
+        app = MainApp()
+        app.mainloop()
+        app.pipeline.close()
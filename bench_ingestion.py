@@ -0,0 +1,535 @@
+"""Banc d'essai reproductible de l'ingestion MALKOGED (hors ligne).
+
+Génère un corpus synthétique, lance le cœur d'ingestion sans interface contre
+un bouchon local de l'API DeepSeek et enregistre les mesures par étape en JSON.
+
+Exemples :
+    python bench_ingestion.py --files 500 --latency-ms 200 --output run_a.json
+    python bench_ingestion.py --files 10000 --cassette-mode replay --output run_c.json
+    python bench_ingestion.py --compare run_a.json run_b.json
+    python bench_ingestion.py --ooxml --files 300 --output ooxml.json
+    python bench_ingestion.py --excerpt --files 300 --output extraits.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import MALKOGED as ged
+
+DEFAULT_MIX = "pdf=30,docx=10,xlsx=10,pptx=5,mp3=5,mp4=5,image=20,duplicate=15"
+STAGES = ged.MetricsCollector.STAGES
+
+# Vocabulaire aligné sur les règles de classification pour exercer les deux chemins
+WORDS = {
+    "JURIDIQUE": ["bail", "contrat", "acte", "locataire", "clause", "signature"],
+    "TECHNIQUE": ["diagnostic", "devis", "plan", "chantier", "visite", "installation"],
+    "COMPTABILITE": ["facture", "montant", "bancaire", "impôt", "échéance", "relevé"],
+    "ADMINISTRATIF": ["assurance", "courrier", "identité", "attestation", "dossier", "permis"],
+    "AUTRE": ["lorem", "ipsum", "document", "page", "annexe", "référence"]
+}
+
+# ==================== CORPUS SYNTHÉTIQUE ====================
+def parse_mix(mix_text):
+    mix = {}
+    for part in mix_text.split(","):
+        kind, weight = part.split("=")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+def random_text(rng, category, n_words):
+    vocabulary = WORDS[category] + WORDS["AUTRE"]
+    return " ".join(rng.choice(vocabulary) for _ in range(n_words))
+
+def write_pdf(path, text):
+    """PDF minimal valide avec une page de texte"""
+    lines = [text[i:i + 80] for i in range(0, len(text), 80)][:40]
+    content = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(
+        "(" + line.replace("\\", "").replace("(", "").replace(")", "") + ") '" for line in lines) + " ET"
+    content = content.encode("latin-1", "replace")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length " + str(len(content)).encode() + b" >>\nstream\n" + content + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f"{i} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    data += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(data)
+
+def write_docx(path, text):
+    document = ged.docx.Document()
+    for i in range(0, len(text), 200):
+        document.add_paragraph(text[i:i + 200])
+    document.save(path)
+
+def write_xlsx(path, rng, category):
+    workbook = ged.openpyxl.Workbook()
+    sheet = workbook.active
+    for _ in range(30):
+        sheet.append([random_text(rng, category, 3), rng.randint(1, 10000), round(rng.random() * 1000, 2)])
+    workbook.save(path)
+
+def write_pptx(path, text):
+    presentation = ged.Presentation()
+    for i in range(3):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = text[:40]
+        slide.placeholders[1].text = text[i * 150:(i + 1) * 150]
+    presentation.save(path)
+
+def write_mp3(path, rng, size):
+    """Trames MPEG-1 Layer III (128 kbit/s, 44,1 kHz) sans balise ID3"""
+    payload = rng.randbytes(size) if hasattr(rng, "randbytes") else os.urandom(size)
+    with open(path, "wb") as f:
+        for offset in range(0, max(413, len(payload) - 412), 413):
+            f.write(b"\xff\xfb\x90\x64" + payload[offset:offset + 413].ljust(413, b"\x00"))
+
+def write_mp4(path, rng, size):
+    """Conteneur MP4 minimal (ftyp + moov/mvhd + mdat)"""
+    ftyp = struct.pack(">I4s4sI8s", 24, b"ftyp", b"isom", 512, b"isommp41")
+    mvhd_body = struct.pack(">B3xIIII", 0, 0, 0, 1000, 0) + struct.pack(">IH10x", 0x00010000, 0x0100)
+    mvhd_body += struct.pack(">9I", 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+    mvhd_body += bytes(24) + struct.pack(">I", 2)
+    mvhd = struct.pack(">I4s", 8 + len(mvhd_body), b"mvhd") + mvhd_body
+    moov = struct.pack(">I4s", 8 + len(mvhd), b"moov") + mvhd
+    payload = rng.randbytes(size) if hasattr(rng, "randbytes") else os.urandom(size)
+    mdat = struct.pack(">I4s", 8 + len(payload), b"mdat") + payload
+    with open(path, "wb") as f:
+        f.write(ftyp + moov + mdat)
+
+def write_image(path, rng, width=640, height=480):
+    if ged.Image is not None:
+        base = ged.Image.new("RGB", (16, 12))
+        base.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(16 * 12)])
+        base.resize((width, height), ged.Image.BILINEAR).save(path)
+        return
+    # Repli sans Pillow : PNG en niveaux de gris écrit à la main
+    rows = b"".join(b"\x00" + bytes(rng.randrange(256) for _ in range(width)) for _ in range(height))
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+    png = b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+    png += chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+    with open(path, "wb") as f:
+        f.write(png)
+
+def generate_corpus(corpus_dir, n_files, mix, seed, media_size):
+    """Génère un corpus reproductible (même graine => mêmes fichiers)"""
+    rng = random.Random(seed)
+    os.makedirs(corpus_dir, exist_ok=True)
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    files = []
+    counts = {}
+    for i in range(n_files):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "duplicate" and not files:
+            kind = "pdf"
+        category = rng.choice(list(WORDS))
+        stem = f"{i:06d}_{rng.choice(WORDS[category])}"
+        text = random_text(rng, category, rng.randint(80, 600))
+        if kind == "duplicate":
+            original = rng.choice(files)
+            path = os.path.join(corpus_dir, f"{stem}_copie{os.path.splitext(original)[1]}")
+            if original.endswith(ged.IMAGE_EXTENSIONS) and ged.Image is not None and rng.random() < 0.5:
+                # Ré-export redimensionné : doublon visuel, pas binaire
+                with ged.Image.open(original) as img:
+                    img.resize((img.width // 2, img.height // 2)).save(path)
+            else:
+                shutil.copyfile(original, path)
+        else:
+            ext = rng.choice([".jpg", ".png"]) if kind == "image" else "." + kind
+            path = os.path.join(corpus_dir, stem + ext)
+            if kind == "pdf":
+                write_pdf(path, text)
+            elif kind == "docx":
+                write_docx(path, text)
+            elif kind == "xlsx":
+                write_xlsx(path, rng, category)
+            elif kind == "pptx":
+                write_pptx(path, text)
+            elif kind == "mp3":
+                write_mp3(path, rng, media_size)
+            elif kind == "mp4":
+                write_mp4(path, rng, media_size)
+            elif kind == "image":
+                write_image(path, rng)
+            else:
+                raise ValueError(f"Type inconnu dans --mix: {kind}")
+        files.append(path)
+        counts[kind] = counts.get(kind, 0) + 1
+    total_bytes = sum(os.path.getsize(p) for p in files)
+    return files, {"files": len(files), "bytes": total_bytes, "by_type": counts, "seed": seed}
+
+# ==================== BOUCHON API ====================
+class StubDeepSeekHandler(BaseHTTPRequestHandler):
+    """Répond comme /v1/chat/completions avec une classification déterministe"""
+    latency_s = 0.0
+    jitter_s = 0.0
+    token_latency_s = 0.0
+
+    def classify(self, prompt, rng):
+        return rng.choice(["SANTE", "LOGEMENT", "GENERAL", "VIE PROFESSIONNELLE & ETUDES"])
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        prompt = payload.get("messages", [{}])[-1].get("content", "")
+        rng = random.Random(zlib.crc32(prompt.encode("utf-8")))
+        delay = self.latency_s + rng.uniform(-self.jitter_s, self.jitter_s)
+        time.sleep(max(0.0, delay + self.token_latency_s * ged.ExcerptSelector.estimate_tokens(prompt)))
+        category = self.classify(prompt, rng)
+        content = json.dumps({"category": category, "subcategory": "Bench", "reason": "Réponse simulée"})
+        body = json.dumps({"model": "stub-deepseek",
+                           "choices": [{"message": {"role": "assistant", "content": content}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class KeywordStubHandler(StubDeepSeekHandler):
+    """Classe l'extrait reçu selon le vocabulaire dominant : un extrait sans mot parlant donne AUTRE"""
+    def classify(self, prompt, rng):
+        match = re.search(r"--- (.*?) ---", prompt, re.DOTALL)
+        words = (match.group(1) if match else "").lower().split()
+        counts = {category: sum(words.count(w) for w in vocabulary)
+                  for category, vocabulary in WORDS.items() if category != "AUTRE"}
+        best = max(counts, key=counts.get)
+        return best if counts[best] else "AUTRE"
+
+def start_stub_server(latency_ms, jitter_ms, token_latency_ms=0.0, base=StubDeepSeekHandler):
+    handler = type("Handler", (base,), {"latency_s": latency_ms / 1000.0,
+                                        "jitter_s": jitter_ms / 1000.0,
+                                        "token_latency_s": token_latency_ms / 1000.0})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+# ==================== MESURES ====================
+def stage_report(collector, wall_time):
+    """Statistiques par étape à partir des durées brutes de l'instrumentation"""
+    stages = {}
+    for stage in STAGES:
+        ordered = sorted(collector.samples[stage])
+        total = sum(ordered)
+        nbytes = collector.bytes[stage]
+        stages[stage] = {
+            "count": len(ordered),
+            "total_s": round(total, 4),
+            "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+            "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+            "files_per_s": round(len(ordered) / total, 2) if total else None,
+            "mb_per_s": round(nbytes / 1e6 / total, 2) if total and nbytes else None,
+            "share_of_wall": round(total / wall_time, 4) if wall_time else None,
+            "outcomes": dict(collector.outcomes[stage])
+        }
+    return stages
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def peak_rss_mb():
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+# ==================== EXÉCUTION ====================
+def run_benchmark(args):
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="malkoged_bench_"))
+    corpus_dir = os.path.join(workdir, "corpus")
+    dest_dir = os.path.join(workdir, "archive")
+    if os.path.exists(dest_dir):
+        shutil.rmtree(dest_dir)
+
+    print(f"Génération du corpus ({args.files} fichiers) dans {corpus_dir}...")
+    files, corpus = generate_corpus(corpus_dir, args.files, parse_mix(args.mix), args.seed, args.media_kb * 1024)
+
+    server, url = start_stub_server(args.latency_ms, args.jitter_ms)
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)  # Config et index isolés du poste de l'utilisateur
+    try:
+        for stale in (ged.CONFIG_FILE, ged.INDEX_FILE, ged.PHASH_INDEX_FILE):
+            if os.path.exists(stale):
+                os.remove(stale)
+        config = ged.ConfigManager.load_config()
+        config["api_active"] = not args.no_api
+        if args.cassette_mode != "off":
+            config["api_cassette_mode"] = args.cassette_mode
+            config["api_cassette_file"] = args.cassette
+            config["api_replay_latency_ms"] = args.replay_latency_ms
+        ged.ConfigManager.save_config(config)
+        ged.DEEPSEEK_API_URL = url
+
+        pipeline = ged.IngestionPipeline()
+        ged.metrics.reset()
+        ged.metrics.keep_samples = True
+
+        print(f"Ingestion (latence API simulée {args.latency_ms} ms)...")
+        start = time.perf_counter()
+        summary = pipeline.process_batch(files, dest_dir)
+        wall_time = time.perf_counter() - start
+    finally:
+        os.chdir(previous_cwd)
+        server.shutdown()
+
+    result = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args)
+        },
+        "corpus": corpus,
+        "total": {
+            "wall_s": round(wall_time, 3),
+            "files_per_s": round(len(files) / wall_time, 2) if wall_time else None,
+            "mb_per_s": round(corpus["bytes"] / 1e6 / wall_time, 2) if wall_time else None
+        },
+        "outcomes": {k: summary[k] for k in ("processed", "duplicates", "errors")},
+        "stages": stage_report(ged.metrics, wall_time),
+        "peak_rss_mb": peak_rss_mb()
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=4, ensure_ascii=False)
+
+    print_report(result)
+    print(f"Résultats enregistrés dans {args.output}")
+    if not args.keep and not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+def run_ooxml_benchmark(args):
+    """Extraction seule : lecteur XML en flux contre bibliothèques complètes, par format"""
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="malkoged_bench_"))
+    mix = {kind: weight for kind, weight in parse_mix(args.mix).items() if kind in ("docx", "xlsx", "pptx")}
+    files, corpus = generate_corpus(os.path.join(workdir, "corpus"), args.files, mix or {"docx": 1},
+                                    args.seed, args.media_kb * 1024)
+    engine = ged.ClassificationEngine()
+    engine.config["ooxml_fast_extraction"] = True
+    extractors = {"streaming": engine._extract_text_by_type, "libraries": engine._extract_text_with_libraries}
+
+    timings = {}
+    for path in files:
+        ext = os.path.splitext(path)[1].lower()
+        texts = {}
+        for name, extract in extractors.items():
+            start = time.perf_counter()
+            texts[name] = extract(path, ext)
+            timings.setdefault(ext, {}).setdefault(name, []).append(time.perf_counter() - start)
+        # Contrôle de cohérence : mêmes mots extraits par les deux méthodes
+        words = [set(texts[name].split()) for name in extractors]
+        timings[ext].setdefault("overlap", []).append(
+            len(words[0] & words[1]) / len(words[0] | words[1]) if words[0] | words[1] else 1.0)
+
+    formats = {}
+    for ext, samples in sorted(timings.items()):
+        report = {"files": len(samples["streaming"]),
+                  "overlap": round(sum(samples["overlap"]) / len(samples["overlap"]), 3)}
+        for name in extractors:
+            ordered = sorted(samples[name])
+            report[name] = {"p50_ms": round(percentile(ordered, 50) * 1000, 3),
+                            "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+                            "total_s": round(sum(ordered), 3)}
+        streaming = report["streaming"]["total_s"]
+        report["speedup"] = round(report["libraries"]["total_s"] / streaming, 2) if streaming else None
+        formats[ext] = report
+        print(f"{ext:<6} {report['files']:>5} fichiers  flux p50 {report['streaming']['p50_ms']} ms  "
+              f"bibliothèques p50 {report['libraries']['p50_ms']} ms  x{report['speedup']}  "
+              f"recouvrement {report['overlap']}")
+
+    result = {"meta": {"timestamp": datetime.now().isoformat(timespec="seconds"),
+                       "python": platform.python_version(), "args": vars(args)},
+              "corpus": corpus, "ooxml": formats, "peak_rss_mb": peak_rss_mb()}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=4, ensure_ascii=False)
+    print(f"Résultats enregistrés dans {args.output}")
+    if not args.keep and not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+def letter_text(rng, category):
+    """Courrier type : en-tête, mentions et références avant le corps du texte"""
+    header = [
+        f"{rng.choice(['Cabinet', 'Société', 'Agence', 'Groupe'])} {rng.choice(['Martin', 'Durand', 'Lefebvre', 'Moreau'])} "
+        f"{rng.choice(['Conseil', 'Services', 'Partenaires', 'Associés'])}",
+        f"{rng.randint(1, 99)} rue {rng.choice(['des Lilas', 'Victor Hugo', 'de la Gare', 'du Moulin'])} "
+        f"{rng.randint(10000, 95999)} {rng.choice(['Paris', 'Lyon', 'Nantes', 'Lille'])}",
+        f"Tél. 0{rng.randint(1, 9)} {rng.randint(10, 99)} {rng.randint(10, 99)} {rng.randint(10, 99)} {rng.randint(10, 99)}",
+        f"Réf. {rng.randint(2015, 2025)}-{rng.randint(100000, 999999)} / Page 1 sur {rng.randint(2, 6)}"
+    ]
+    legal = ["Société par actions simplifiée au capital social indiqué au registre du commerce et des sociétés.",
+             "Conformément au règlement général sur la protection des données, vous disposez d'un droit d'accès.",
+             "Nos bureaux sont ouverts du lundi au vendredi de neuf heures à dix-huit heures sans interruption.",
+             "Merci de rappeler les références ci-dessus dans toute correspondance adressée à nos services.",
+             "Ce courrier est émis par un système automatisé et reste valable sans signature manuscrite.",
+             "Toute réclamation doit être formulée par écrit auprès du service clients dans les meilleurs délais.",
+             "Les informations recueillies font l'objet d'un traitement informatique destiné à la gestion de votre compte.",
+             "Vous pouvez à tout moment consulter votre espace personnel en ligne avec vos identifiants habituels.",
+             "En cas de changement d'adresse, merci d'en informer nos équipes afin de mettre à jour vos coordonnées.",
+             "Le médiateur de la consommation peut être saisi gratuitement en cas de litige non résolu avec nos services.",
+             "Ce message et ses éventuelles pièces jointes sont confidentiels et destinés exclusivement à leur destinataire."]
+    header += rng.sample(legal, rng.randint(3, len(legal)))
+    header += [f"Madame, Monsieur, suite à notre échange du {rng.randint(1, 28)}/{rng.randint(1, 12)}, "
+               f"veuillez trouver ci-dessous les éléments demandés."] * rng.randint(1, 3)
+    body = [random_text(rng, category, rng.randint(12, 25)).capitalize() + "." for _ in range(rng.randint(4, 10))]
+    footer = ["Nous vous prions d'agréer, Madame, Monsieur, l'expression de nos salutations distinguées."]
+    return "\n".join(header + body + footer)
+
+def run_excerpt_benchmark(args):
+    """Classification IA seule : début du texte (1500 caractères) contre extrait sélectionné"""
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="malkoged_bench_"))
+    rng = random.Random(args.seed)
+    categories = [c for c in WORDS if c != "AUTRE"]
+    documents = [(category, letter_text(rng, category)) for category in (rng.choice(categories) for _ in range(args.files))]
+
+    server, url = start_stub_server(args.latency_ms, args.jitter_ms, args.token_latency_ms, KeywordStubHandler)
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    modes = ("prefix", "salience")
+    samples = {mode: {"tokens": [], "latency": [], "answers": []} for mode in modes}
+    try:
+        if os.path.exists(ged.CONFIG_FILE):
+            os.remove(ged.CONFIG_FILE)
+        config = ged.ConfigManager.load_config()
+        config["api_active"] = True
+        ged.ConfigManager.save_config(config)
+        ged.DEEPSEEK_API_URL = url
+        engine = ged.ClassificationEngine()
+        engine.config["excerpt_token_budget"] = args.excerpt_tokens
+        for i, (_, text) in enumerate(documents):
+            for mode in modes:
+                engine.config["excerpt_mode"] = mode
+                excerpt = engine.build_excerpt(text)
+                start = time.perf_counter()
+                suggestion = engine.suggest_new_category(text, f"courrier_{i}.pdf") or {}
+                samples[mode]["latency"].append(time.perf_counter() - start)
+                samples[mode]["tokens"].append(ged.ExcerptSelector.estimate_tokens(excerpt))
+                samples[mode]["answers"].append(suggestion.get("category", "AUTRE"))
+    finally:
+        os.chdir(previous_cwd)
+        server.shutdown()
+
+    truth = [category for category, _ in documents]
+    report = {}
+    for mode in modes:
+        tokens, latency = sorted(samples[mode]["tokens"]), sorted(samples[mode]["latency"])
+        answers = samples[mode]["answers"]
+        report[mode] = {"excerpt_tokens_p50": percentile(tokens, 50),
+                        "excerpt_tokens_mean": round(sum(tokens) / len(tokens), 1),
+                        "latency_p50_ms": round(percentile(latency, 50) * 1000, 2),
+                        "latency_p99_ms": round(percentile(latency, 99) * 1000, 2),
+                        "accuracy": round(sum(a == t for a, t in zip(answers, truth)) / len(truth), 3)}
+        print(f"{mode:<9} extrait {report[mode]['excerpt_tokens_mean']} jetons  "
+              f"latence p50 {report[mode]['latency_p50_ms']} ms  p99 {report[mode]['latency_p99_ms']} ms  "
+              f"bonne catégorie {report[mode]['accuracy'] * 100:.1f}%")
+    agreement = sum(a == b for a, b in zip(*(samples[mode]["answers"] for mode in modes))) / len(documents)
+    print(f"Accord entre les deux modes : {agreement * 100:.1f}%")
+
+    result = {"meta": {"timestamp": datetime.now().isoformat(timespec="seconds"),
+                       "python": platform.python_version(), "args": vars(args)},
+              "documents": len(documents), "excerpt": report, "agreement": round(agreement, 3)}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=4, ensure_ascii=False)
+    print(f"Résultats enregistrés dans {args.output}")
+    if not args.keep and not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+def print_report(result):
+    total = result["total"]
+    print(f"\nTotal: {total['wall_s']} s - {total['files_per_s']} fichiers/s - pic RSS {result['peak_rss_mb']} Mo")
+    print(f"{'Étape':<16}{'n':>7}{'total s':>10}{'p50 ms':>10}{'p99 ms':>10}{'fich/s':>10}{'Mo/s':>9}")
+    for stage, stats in result["stages"].items():
+        print(f"{stage:<16}{stats['count']:>7}{stats['total_s']:>10}{stats['p50_ms']:>10}"
+              f"{stats['p99_ms']:>10}{str(stats['files_per_s']):>10}{str(stats['mb_per_s']):>9}")
+
+def compare_runs(path_a, path_b):
+    """Affiche l'évolution entre deux exécutions enregistrées"""
+    with open(path_a, encoding="utf-8") as f:
+        run_a = json.load(f)
+    with open(path_b, encoding="utf-8") as f:
+        run_b = json.load(f)
+    def delta(a, b):
+        return f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+    print(f"Temps total: {run_a['total']['wall_s']} s -> {run_b['total']['wall_s']} s "
+          f"({delta(run_a['total']['wall_s'], run_b['total']['wall_s'])})")
+    for stage in STAGES:
+        a, b = run_a["stages"].get(stage, {}), run_b["stages"].get(stage, {})
+        if a and b:
+            print(f"{stage:<16} p50 {a['p50_ms']} -> {b['p50_ms']} ms ({delta(a['p50_ms'], b['p50_ms'])}), "
+                  f"p99 {a['p99_ms']} -> {b['p99_ms']} ms ({delta(a['p99_ms'], b['p99_ms'])})")
+    print(f"Pic RSS: {run_a['peak_rss_mb']} -> {run_b['peak_rss_mb']} Mo")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Banc d'essai de l'ingestion MALKOGED")
+    parser.add_argument("--files", type=int, default=200, help="Nombre de fichiers du corpus")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Pondération par type (pdf,docx,xlsx,pptx,mp3,mp4,image,duplicate)")
+    parser.add_argument("--seed", type=int, default=42, help="Graine du générateur (reproductibilité)")
+    parser.add_argument("--media-kb", type=int, default=2048, help="Taille des fichiers MP3/MP4 générés (Ko)")
+    parser.add_argument("--latency-ms", type=float, default=150.0, help="Latence simulée de l'API")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Variation aléatoire de la latence")
+    parser.add_argument("--no-api", action="store_true", help="Désactive la classification IA")
+    parser.add_argument("--cassette-mode", default="off", choices=ged.ApiCassette.MODES,
+                        help="Enregistre ou rejoue les réponses de l'API")
+    parser.add_argument("--cassette", default=os.path.abspath(ged.CASSETTE_FILE), help="Fichier cassette")
+    parser.add_argument("--replay-latency-ms", type=float, default=0.0, help="Latence simulée en relecture")
+    parser.add_argument("--workdir", help="Dossier de travail (temporaire par défaut)")
+    parser.add_argument("--keep", action="store_true", help="Conserve le dossier de travail temporaire")
+    parser.add_argument("--output", default="bench_results.json", help="Fichier JSON de résultats")
+    parser.add_argument("--compare", nargs=2, metavar=("AVANT", "APRES"), help="Compare deux fichiers de résultats")
+    parser.add_argument("--ooxml", action="store_true",
+                        help="Mesure l'extraction DOCX/XLSX/PPTX seule (flux XML contre bibliothèques)")
+    parser.add_argument("--excerpt", action="store_true",
+                        help="Compare l'extrait envoyé à l'IA : début du texte contre passages sélectionnés")
+    parser.add_argument("--excerpt-tokens", type=int, default=300, help="Budget de l'extrait sélectionné (jetons)")
+    parser.add_argument("--token-latency-ms", type=float, default=0.2, help="Latence simulée par jeton de requête")
+    return parser
+
+if __name__ == "__main__":
+    arguments = build_parser().parse_args()
+    if arguments.compare:
+        compare_runs(*arguments.compare)
+    elif arguments.ooxml:
+        run_ooxml_benchmark(arguments)
+    elif arguments.excerpt:
+        run_excerpt_benchmark(arguments)
+    else:
+        run_benchmark(arguments)
@@ -0,0 +1,23 @@
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import customtkinter  # noqa: F401
+except ImportError:
+    # Poste sans interface graphique (intégration continue) : module minimal pour que les fenêtres
+    # de MALKOGED.py se définissent à l'import ; les tests ne portent que sur le cœur d'ingestion
+    customtkinter = types.ModuleType("customtkinter")
+    customtkinter.CTk = customtkinter.CTkToplevel = customtkinter.CTkFrame = object
+    sys.modules["customtkinter"] = customtkinter
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Dossier de travail isolé : les fichiers ged_*.json sont relatifs au dossier courant"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
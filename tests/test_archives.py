@@ -0,0 +1,107 @@
+import json
+import os
+
+import MALKOGED as ged
+
+
+def make_archive(base, name, files):
+    """Archive <base>/<name> contenant les fichiers {empreinte: nom} ; retourne (racine, fiches)"""
+    root = os.path.abspath(os.path.join(base, name))
+    folder = os.path.join(root, "Factures", "Fournisseurs")
+    os.makedirs(folder, exist_ok=True)
+    records = {}
+    for key, filename in files.items():
+        path = os.path.join(folder, filename)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(key)
+        records[key] = {"path": path, "size": 1, "category": "Factures", "subcategory": "Fournisseurs",
+                        "algo": "sha256", "archived_at": "2026-01-01T00:00:00"}
+    registry = ged.ArchiveRegistry()
+    registry.attach(root)
+    registry.write(root, records)
+    registry.save_registry()
+    return root, records
+
+
+def stored_keys(root):
+    return sorted(ged.ArchiveRegistry().read_index(root))
+
+
+def test_load_and_save_round_trip(workdir):
+    root, records = make_archive(workdir, "A", {"K1": "a.txt", "K2": "b.txt"})
+    index = ged.ConfigManager.load_index()
+    assert sorted(index) == ["K1", "K2"]
+    assert index["K1"]["path"] == records["K1"]["path"]
+    ged.ConfigManager.save_index(index)
+    assert stored_keys(root) == ["K1", "K2"]
+
+
+def test_save_index_keeps_shadowed_records(workdir):
+    root_a, _ = make_archive(workdir, "A", {"K": "a.txt"})
+    root_b, _ = make_archive(workdir, "B", {"K": "a.txt", "KB": "b.txt"})
+    index = ged.ConfigManager.load_index()
+    assert ged.ArchiveRegistry.root_of(index["K"]["path"]) == root_a
+    ged.ConfigManager.save_index(index)
+    assert stored_keys(root_a) == ["K"]
+    assert stored_keys(root_b) == ["K", "KB"]
+
+
+def test_save_plain_index_keeps_shadowed_records(workdir):
+    root_a, records_a = make_archive(workdir, "A", {"K": "a.txt"})
+    root_b, records_b = make_archive(workdir, "B", {"K": "a.txt", "KB": "b.txt"})
+    ged.ConfigManager.save_index({"K": records_a["K"], "KB": records_b["KB"]})
+    assert stored_keys(root_b) == ["K", "KB"]
+
+
+def test_detach_restores_shadowed_record(workdir):
+    root_a, _ = make_archive(workdir, "A", {"K": "a.txt"})
+    root_b, records_b = make_archive(workdir, "B", {"K": "a.txt", "KB": "b.txt"})
+    index = ged.FileIndex()
+    registry = ged.ArchiveRegistry()
+    registry.open(index)
+    registry.load_all()
+    registry.detach(root_a)
+    assert registry.lookup("K")["path"] == records_b["K"]["path"]
+    registry.save(index)
+    assert stored_keys(root_b) == ["K", "KB"]
+
+
+def test_lookup_loads_only_candidate_archive(workdir):
+    root_a, _ = make_archive(workdir, "A", {"KA": "a.txt"})
+    root_b, _ = make_archive(workdir, "B", {"KB": "b.txt"})
+    index = ged.FileIndex()
+    registry = ged.ArchiveRegistry()
+    registry.open(index)
+    assert registry.lookup("KB") is not None
+    assert registry.loaded == {root_b}
+
+
+def test_shard_merge_is_idempotent(workdir):
+    root, records = make_archive(workdir, "A", {"K": "a.txt"})
+    copy = os.path.join(os.path.dirname(records["K"]["path"]), "a_2.txt")
+    with open(copy, "w", encoding="utf-8") as f:
+        f.write("K")
+    new = os.path.join(os.path.dirname(copy), "n.txt")
+    coordinator = ged.ShardCoordinator(str(workdir / "shared"))
+    os.makedirs(coordinator.segments_dir)
+    segment = {"node": "n2", "partition": "part-00000", "phash": {},
+               "index": {"K": dict(records["K"], path=copy, source="/src/a"),
+                         "N": dict(records["K"], path=new, source="/src/n")}}
+    segment_path = os.path.join(coordinator.segments_dir, "part-00000.json")
+    with open(segment_path, "w", encoding="utf-8") as f:
+        json.dump(segment, f)
+
+    first = coordinator.merge()
+    assert (first["added"], first["cross_shard_duplicates"], first["blobs_removed"]) == (1, 1, 1)
+    assert not os.path.exists(copy)
+    assert not os.path.exists(segment_path)
+    assert os.path.exists(os.path.join(coordinator.merged_dir, "part-00000.json"))
+
+    # Segment déposé une seconde fois (nœud relancé) : rien n'est ajouté ni supprimé
+    with open(segment_path, "w", encoding="utf-8") as f:
+        json.dump(segment, f)
+    second = coordinator.merge()
+    assert (second["added"], second["cross_shard_duplicates"], second["blobs_removed"]) == (0, 0, 0)
+    with open(ged.INDEX_ALIASES_FILE, "r", encoding="utf-8") as f:
+        assert len(json.load(f)["K"]) == 1
+    assert stored_keys(root) == ["K", "N"]
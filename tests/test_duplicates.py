@@ -0,0 +1,122 @@
+import os
+import shutil
+
+import pytest
+
+import MALKOGED as ged
+
+
+def make_config(**settings):
+    config = ged.ConfigManager.load_config()
+    config.update(api_active=False, **settings)
+    ged.ConfigManager.save_config(config)
+    return config
+
+
+def make_archive(base, files, config):
+    """Archive <base>/A contenant les fichiers {nom: algorithme} ; retourne {nom: chemin}"""
+    root = os.path.abspath(os.path.join(base, "A"))
+    folder = os.path.join(root, "Factures", "Fournisseurs")
+    os.makedirs(folder, exist_ok=True)
+    hasher = ged.ContentHasher(config)
+    records, paths = {}, {}
+    for number, (filename, algorithm) in enumerate(files.items()):
+        path = os.path.join(folder, filename)
+        with open(path, "wb") as f:
+            f.write(f"{filename} {number} ".encode() * 100)
+        records[hasher.key_for(path, algorithm)] = {"path": path, "size": os.path.getsize(path), "algo": algorithm,
+                                                    "category": "Factures", "subcategory": "Fournisseurs"}
+        paths[filename] = path
+    registry = ged.ArchiveRegistry()
+    registry.attach(root)
+    registry.write(root, records)
+    registry.save_registry()
+    return paths
+
+
+@pytest.fixture
+def hash_calls(monkeypatch):
+    """Fichiers lus par ContentHasher.key_for : [(nom, algorithme)]"""
+    calls = []
+    key_for = ged.ContentHasher.key_for
+
+    def spy(self, filepath, algorithm, throttle=None):
+        calls.append((os.path.basename(filepath), algorithm))
+        return key_for(self, filepath, algorithm, throttle)
+
+    monkeypatch.setattr(ged.ContentHasher, "key_for", spy)
+    return calls
+
+
+def lookup(pipeline, filepath):
+    file_hash, algorithm = pipeline.hasher.hash_file(filepath)
+    return pipeline.find_duplicate(filepath, file_hash, algorithm)
+
+
+def new_file(base, filename, content=None):
+    path = os.path.join(base, filename)
+    with open(path, "wb") as f:
+        f.write(content if content is not None else os.urandom(2000))
+    return path
+
+
+def test_fallback_skips_algorithms_that_cannot_match(workdir, hash_calls):
+    config = make_config(media_payload_hash=True)
+    make_archive(workdir, {"x.pdf": "sha256", "y.mp3": "sha256-payload"}, config)
+    pipeline = ged.IngestionPipeline()
+    assert pipeline.migration_pending
+    hash_calls.clear()
+    assert lookup(pipeline, new_file(workdir, "b.pdf")) is None
+    assert hash_calls == [("b.pdf", "sha256")]
+
+
+def test_no_fallback_once_nothing_is_pending(workdir, hash_calls):
+    config = make_config(media_payload_hash=True)
+    make_archive(workdir, {"x.pdf": "sha256", "y.mp3": "sha256-payload"}, config)
+    pipeline = ged.IngestionPipeline()
+    assert ged.IndexMigrator(pipeline).pending_keys() == []
+    assert not pipeline.migration_pending
+    hash_calls.clear()
+    assert lookup(pipeline, new_file(workdir, "a.mp3")) is None
+    assert hash_calls == [("a.mp3", "sha256-payload")]
+    # Réglages notés dans le registre : pas de rapprochement au démarrage suivant
+    assert not ged.IngestionPipeline().migration_pending
+
+
+def test_old_media_key_is_bridged_until_migrated(workdir, hash_calls):
+    config = make_config(media_payload_hash=True)
+    paths = make_archive(workdir, {"old.mp3": "sha256"}, config)
+    copy = new_file(workdir, "copy.mp3", open(paths["old.mp3"], "rb").read())
+    pipeline = ged.IngestionPipeline()
+    assert pipeline.migration_pending
+    assert lookup(pipeline, copy)["path"] == paths["old.mp3"]
+
+    migrator = ged.IndexMigrator(pipeline)
+    progress = migrator.run(pending=migrator.pending_keys())
+    assert progress["done"] == 1
+    assert not pipeline.migration_pending
+    hash_calls.clear()
+    assert lookup(pipeline, copy)["path"] == paths["old.mp3"]
+    assert hash_calls == [("copy.mp3", "sha256-payload")]
+
+
+def test_new_archive_needs_no_migration(workdir):
+    make_config()
+    source = new_file(workdir, "facture.txt", b"facture " * 100)
+    pipeline = ged.IngestionPipeline()
+    summary = pipeline.process_batch([source], os.path.join(workdir, "A"))
+    assert summary["processed"] == 1
+    assert not ged.IngestionPipeline().migration_pending
+
+
+def test_duplicate_found_after_algorithm_change(workdir):
+    config = make_config(hash_algorithm="sha256")
+    paths = make_archive(workdir, {"contrat.pdf": "sha256"}, config)
+    make_config(hash_algorithm="blake2b")
+    copy = os.path.join(workdir, "copie.pdf")
+    shutil.copy(paths["contrat.pdf"], copy)
+    pipeline = ged.IngestionPipeline()
+    assert lookup(pipeline, copy)["path"] == paths["contrat.pdf"]
+    migrator = ged.IndexMigrator(pipeline)
+    migrator.run(pending=migrator.pending_keys())
+    assert lookup(pipeline, copy)["algo"] == "blake2b"
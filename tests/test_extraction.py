@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+import MALKOGED as ged
+
+
+def library_text(path, ext):
+    return ged.ClassificationEngine()._extract_text_with_libraries(path, ext)
+
+
+def test_xlsx_fast_path_matches_library(workdir):
+    openpyxl = pytest.importorskip("openpyxl")
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["Facture", "False", "0", 0, 5, 3.5, 0.001, True, False, None, "", 0.0, -2])
+    sheet.append(["Total TTC", 1234567890123, 1e20])
+    second = workbook.create_sheet("Détail")
+    second.append(["Référence", "FAC-2026-001"])
+    path = os.path.join(workdir, "facture.xlsx")
+    workbook.save(path)
+    assert ged.OOXMLExtractor.extract_xlsx(path) == library_text(path, ".xlsx")
+
+
+def test_docx_fast_path_matches_library(workdir):
+    docx = pytest.importorskip("docx")
+    document = docx.Document()
+    document.add_heading("Contrat de prestation", level=1)
+    paragraph = document.add_paragraph("Entre les soussignés ")
+    paragraph.add_run("Société Exemple").bold = True
+    paragraph.add_run(", ci-après le prestataire.")
+    document.add_paragraph("")
+    document.add_paragraph("Montant : 1 200,00 €")
+    path = os.path.join(workdir, "contrat.docx")
+    document.save(path)
+    assert ged.OOXMLExtractor.extract_docx(path) == library_text(path, ".docx")
+
+
+def test_ocr_stops_on_cached_pages_without_starting_pool(workdir, monkeypatch):
+    engine = ged.OCREngine({"ocr_enabled": True, "ocr_workers": 2, "ocr_max_chars": 150})
+    monkeypatch.setattr(engine, "page_keys", lambda filepath: [(number, f"page{number}") for number in range(4)])
+    for number in range(2):
+        ged.TextCache.put(f"ocr-page{number}", f"page {number} " * 20)
+
+    def no_pool():
+        raise AssertionError("réserve de processus démarrée")
+
+    monkeypatch.setattr(engine, "_pool", no_pool)
+    text = engine.extract(os.path.join(workdir, "scan.pdf"))
+    assert len(text) == 150
+    assert text.startswith("page 0 ")
@@ -0,0 +1,27 @@
+import os
+
+import MALKOGED as ged
+
+
+def test_handler_exception_is_counted_not_raised(workdir):
+    config = ged.ConfigManager.load_config()
+    config.update(api_active=False)
+    ged.ConfigManager.save_config(config)
+    files = []
+    for number in range(20):
+        path = os.path.join(workdir, f"f{number}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("facture " * 10)
+        files.append(path)
+    handled = []
+
+    def handle(filepath):
+        handled.append(filepath)
+        if filepath.endswith("f7.txt"):
+            raise OSError("disque plein")
+        return {"status": "OK"}
+
+    scheduler = ged.BatchScheduler(ged.IngestionPipeline())
+    errors = scheduler.run(iter(files), handle, lambda filepath: {"stage": "pending"})
+    assert errors == 1
+    assert sorted(handled) == sorted(files)